@@ -1,6 +1,17 @@
 #!/usr/bin/env python
 
+import collections
 import glob
+import hashlib
+import json
+import tempfile
+
+# bytes read from the container output at a time
+CHUNK_SIZE = 64 * 1024
+
+# bytes read from the start and the end of a file for its checksum
+CHECKSUM_BLOCK = 1024 * 1024
+
 
 def main():
     module = AnsibleModule(
@@ -13,7 +24,12 @@ def main():
             secure=dict(required=False, default=True, type='bool'),
             sudo=dict(required=False, default=True, type='bool'),
             rm=dict(required=False, default=True, type='bool'),
-            creates=dict(required=False, default=[], type='list')
+            creates=dict(required=False, default=[], type='list'),
+            inputs=dict(required=False, default=[], type='list'),
+            done_file=dict(required=False, default=None, type='str'),
+            checksum=dict(required=False, default=False, type='bool'),
+            log_file=dict(required=False, default=None, type='str'),
+            tail_lines=dict(required=False, default=100, type='int')
         )
     )
 
@@ -26,17 +42,11 @@ def main():
     sudo = module.params['sudo']
     rm = module.params['rm']
     creates = module.params['creates']
-
-    if len(creates) > 0:
-        uncreated = [x for x in creates if not glob.glob(os.path.expanduser(x))]
-        if len(uncreated) == 0:
-            module.exit_json(
-                cmd=command,
-                stdout="skipped, since %s exist" % creates,
-                changed=False,
-                stderr=False,
-                rc=0
-            )
+    inputs = module.params['inputs']
+    done_file = module.params['done_file']
+    checksum = module.params['checksum']
+    log_file = module.params['log_file']
+    tail_lines = module.params['tail_lines']
 
     cmd = []
     if secure:
@@ -54,20 +64,168 @@ def main():
     cmd += ["-v " + x for x in volumes]
     cmd += [image, command]
 
+    if len(creates) > 0:
+        if done_file is None:
+            if glob.has_magic(creates[0]):
+                module.fail_json(msg="done_file is required when the first of creates is a pattern: %s" % creates[0])
+            done_file = creates[0] + ".done"
+        done_file = os.path.expanduser(done_file)
+
+        missing = [x for x in inputs if not glob.glob(os.path.expanduser(x))]
+        if len(missing) > 0:
+            module.fail_json(msg="missing inputs: %s" % missing)
+
+        input_state = file_state(inputs, checksum)
+        if is_done(done_file, " ".join(cmd), input_state, creates, checksum):
+            module.exit_json(
+                cmd=command,
+                stdout="skipped, since %s exist and are newer than the inputs" % creates,
+                changed=False,
+                stderr=False,
+                rc=0
+            )
+        # outputs of a run which is killed now must not look finished to the next one
+        if os.path.exists(done_file):
+            os.remove(done_file)
+
+    # without a log_file the output goes to a temporary file, which is removed once its tail is read
+    keep_log = log_file is not None
+    if keep_log:
+        log_file = os.path.expanduser(log_file)
+    else:
+        (fd, log_file) = tempfile.mkstemp(prefix="dockercmd.", suffix=".log")
+        os.close(fd)
+
+    try:
+        (rc, line_count, tail) = run_command(" ".join(cmd), log_file, tail_lines)
+    finally:
+        if not keep_log:
+            os.remove(log_file)
+
+    # only the last lines of the output are returned, the whole output is in the log file
+    result = dict(cmd=" ".join(cmd),
+                  rc=rc,
+                  stdout="".join(tail),
+                  stdout_lines=[x.rstrip("\n") for x in tail],
+                  truncated=line_count > len(tail),
+                  changed=True)
+    if keep_log:
+        result['log_file'] = log_file
+    if rc != 0:
+        module.fail_json(msg="command failed with exit code %d%s" % (rc, ", output in " + log_file if keep_log else ""),
+                         **result)
+
+    if len(creates) > 0:
+        uncreated = [x for x in creates if not glob.glob(os.path.expanduser(x))]
+        if len(uncreated) > 0:
+            module.fail_json(msg="command didn't create %s" % uncreated, **result)
+        write_done(done_file, " ".join(cmd), input_state, file_state(creates, checksum, done_file))
+        result['done_file'] = done_file
+    module.exit_json(**result)
+
+
+def file_state(patterns, checksum=False, done_file=None):
+    """
+    Size and mtime (or a checksum) of the files matching the patterns, by path.
+    """
+    state = {}
+    for pattern in patterns:
+        for path in glob.glob(os.path.expanduser(pattern)):
+            if done_file is not None and path.startswith(done_file):
+                continue
+            st = os.stat(path)
+            if checksum and os.path.isfile(path):
+                state[path] = sample_checksum(path, st.st_size)
+            else:
+                state[path] = "%d:%d" % (st.st_size, int(st.st_mtime))
+    return state
+
+
+def sample_checksum(path, size):
+    """
+    A cheap checksum: the size and the first and last CHECKSUM_BLOCK bytes of the file.
+    """
+    h = hashlib.sha1(str(size))
+    with open(path, 'rb') as f:
+        h.update(f.read(CHECKSUM_BLOCK))
+        if size > 2 * CHECKSUM_BLOCK:
+            f.seek(size - CHECKSUM_BLOCK)
+            h.update(f.read(CHECKSUM_BLOCK))
+        elif size > CHECKSUM_BLOCK:
+            h.update(f.read())
+    return "%d:%s" % (size, h.hexdigest())
+
+
+def is_done(done_file, cmd, input_state, creates, checksum):
+    """
+    The command is done if it wrote the done file and neither its inputs nor its outputs changed since, as
+    make would have it: a missing, partial (killed run) or stale output, or a newer input, runs it again.
+    """
+    if not os.path.exists(done_file):
+        return False
+    try:
+        with open(done_file) as f:
+            done = json.load(f)
+    except ValueError:
+        return False
+    if done.get("cmd") != cmd or done.get("inputs") != input_state:
+        return False
+    if any([not glob.glob(os.path.expanduser(x)) for x in creates]):
+        return False
+    outputs = file_state(creates, checksum, done_file)
+    if done.get("outputs") != outputs:
+        return False
+    newest_input = max([os.stat(x).st_mtime for x in input_state] or [0])
+    return checksum or all([os.stat(x).st_mtime >= newest_input for x in outputs])
+
+
+def write_done(done_file, cmd, input_state, output_state):
+    """
+    Writes the done file atomically (to a temporary file which is renamed), so it's either whole or missing.
+    """
+    tmp_file = "%s.%d.tmp" % (done_file, os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(dict(cmd=cmd, inputs=input_state, outputs=output_state), f, indent=2, sort_keys=True)
+    os.rename(tmp_file, done_file)
+
+
+def run_command(cmd, log_file, tail_lines):
+    """
+    Runs the command with its output streamed to the log file; returns the exit code, the number of lines
+    and the last tail_lines of them.
+    """
     proc = subprocess.Popen(
-        ["/bin/bash", "-c", " ".join(cmd)],
+        ["/bin/bash", "-c", cmd],
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT)
 
-    lines = []
-
-    for line in iter(proc.stdout.readline, b''):
-        lines.append(line)
+    (line_count, tail) = stream_output(proc.stdout, log_file, tail_lines)
     proc.stdout.close()
-
-    result = dict(stdout="".join(lines),
-                  stdout_lines=lines)
-    module.exit_json(**result)
+    return proc.wait(), line_count, tail
+
+
+def stream_output(stream, log_file, tail_lines):
+    """
+    Copies the output to the log file as it comes; returns the number of lines and the last tail_lines of them.
+    """
+    tail = collections.deque(maxlen=max(tail_lines, 0))
+    line_count = 0
+    partial = ""
+    with open(log_file, 'wb') as log:
+        # os.read returns what the container has written so far, instead of waiting for a whole chunk
+        for chunk in iter(lambda: os.read(stream.fileno(), CHUNK_SIZE), b''):
+            log.write(chunk)
+            lines = (partial + chunk).split("\n")
+            partial = lines.pop()
+            for line in lines:
+                tail.append(line + "\n")
+            line_count += len(lines)
+            # a line without newlines (e.g. progress bars with carriage returns) is cut to one chunk
+            partial = partial[-CHUNK_SIZE:]
+    if partial:
+        tail.append(partial)
+        line_count += 1
+    return line_count, list(tail)
 
 
 # ===========================================
@@ -75,4 +233,5 @@ def main():
 # import module snippets
 from ansible.module_utils.basic import *
 
-main()
+if __name__ == '__main__':
+    main()
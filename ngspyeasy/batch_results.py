@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import json
+
+import os
+
+RESULTS_SUFFIX = ".results.json"
+
+
+def results_path(dir, job_name):
+    """
+    A batch job fails if any of its runs failed; the exit code of every run goes to this file.
+    """
+    return os.path.join(dir, job_name + RESULTS_SUFFIX)
+
+
+def write(path, exit_codes):
+    # written to a temporary file first: a batch killed while writing leaves no results
+    tmp_path = "%s.%d" % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(exit_codes, f)
+    os.rename(tmp_path, path)
+
+
+def read(path, count):
+    """
+    The exit codes of the count runs of a batch, or None if the batch didn't write them.
+    """
+    try:
+        with open(path, 'r') as f:
+            exit_codes = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(exit_codes, list) or len(exit_codes) != count:
+        return None
+    return exit_codes
+
+
+def remove(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -55,5 +55,12 @@ def existed_file(path):
     return path
 
 
+def int_list(value):
+    try:
+        return [int(x) for x in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a comma separated list of integers' % value)
+
+
 def path_basename(path):
     return os.path.basename(path)
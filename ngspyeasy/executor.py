@@ -1,51 +1,216 @@
 import contextlib
+import heapq
 import multiprocessing
 import subprocess
+import threading
 import time
 import sys
 import traceback
+from Queue import Queue, Empty
 
 import re
 from logger import logger
+from utils import Enum
+from resources import Resources, SlotAllocator, machine_capacity
+from retry import OOM_SIGNAL, exit_signal
+import job_id_generator
+from journal import Journal
+import batch_results
 import os
 
+job_states = Enum('PENDING', 'RUNNING', 'DONE', 'EXIT')
+
 
 class TaskSubmitError(Exception):
     pass
 
 
+class JobStatus(object):
+    def __init__(self, state, exit_code=None, out_of_memory=False):
+        self.state = state
+        self.exit_code = exit_code
+        # killed for using more memory than it was allowed to
+        self.out_of_memory = out_of_memory
+
+    def is_finished(self):
+        return self.state in [job_states.DONE, job_states.EXIT]
+
+    def __repr__(self):
+        return "JobStatus(state=%s, exit_code=%s, out_of_memory=%s)" % (
+            self.state, self.exit_code, self.out_of_memory)
+
+
 class Provider(object):
-    def submit(self, name, cmd):
+    def submit(self, name, cmd, resources=None):
+        raise NotImplementedError()
+
+    def submit_array(self, name, cmd, indices, resources=None):
+        """
+        Submits cmd as a job array with the given element indices (starting from 1).
+        Elements are tracked as array_element(job_id, index); each element gets
+        its index in the LSB_JOBINDEX environment variable.
+        """
         raise NotImplementedError()
 
     def list(self):
         raise NotImplementedError()
 
+    def status(self, job_ids):
+        raise NotImplementedError()
+
+    def attach(self, job_id):
+        """
+        Starts tracking a job submitted by a previous (interrupted) pipeline run.
+        """
+        raise NotImplementedError()
+
     def stop(self):
         raise NotImplementedError()
 
+    def poll_interval(self):
+        """
+        Number of seconds the executor may block waiting for new work before
+        it has to ask the provider for job states again; None means the provider
+        wakes the executor up itself when a job finishes.
+        """
+        return None
+
+
+LSF_STATES = {
+    "PEND": job_states.PENDING,
+    "PSUSP": job_states.PENDING,
+    "WAIT": job_states.PENDING,
+    "RUN": job_states.RUNNING,
+    "USUSP": job_states.RUNNING,
+    "SSUSP": job_states.RUNNING,
+    "PROV": job_states.RUNNING,
+    "UNKWN": job_states.RUNNING,
+    "DONE": job_states.DONE,
+    "EXIT": job_states.EXIT,
+    "ZOMBI": job_states.EXIT
+}
+
+# exit reason of a job killed at its memory limit (bjobs -l shows it as TERM_MEMLIMIT)
+LSF_MEMLIMIT = re.compile(r'TERM_MEMLIMIT|memory (usage )?limit', re.IGNORECASE)
+
+
+def parse_bjobs_output(lines, delimiter="|"):
+    jobs = dict()
+    for line in lines:
+        fields = line.strip().split(delimiter)
+        if len(fields) < 4:
+            continue
+        (job_id, job_index, stat, exit_code) = [x.strip() for x in fields[:4]]
+        exit_reason = fields[4] if len(fields) > 4 else ""
+        if job_index not in ["0", "-", ""]:
+            job_id = array_element(job_id, int(job_index))
+        state = LSF_STATES.get(stat, job_states.RUNNING)
+        out_of_memory = state == job_states.EXIT and LSF_MEMLIMIT.search(exit_reason) is not None
+        jobs[job_id] = JobStatus(state, _lsf_exit_code(state, exit_code), out_of_memory)
+    return jobs
+
+
+def _lsf_exit_code(state, exit_code):
+    if state == job_states.DONE:
+        return 0
+    if state != job_states.EXIT:
+        return None
+    try:
+        return int(exit_code)
+    except ValueError:
+        # bjobs prints '-' if the job was killed before it could return anything
+        return 1
+
+
+class LSFJobStatus(object):
+    """
+    Status of all jobs of one LSF job group. bjobs is called at most once per ttl
+    seconds; all lookups in between are served from the cache.
+    """
+
+    def __init__(self, job_group, ttl=30):
+        self._job_group = job_group
+        self._ttl = ttl
+        self._jobs = dict()
+        self._timestamp = None
+
+    def all(self):
+        now = time.time()
+        if self._timestamp is None or now - self._timestamp >= self._ttl:
+            self._jobs = self._query()
+            # from the start of the query, as the executor's poll interval: a slow bjobs mustn't make the
+            # next poll find the cache still fresh
+            self._timestamp = now
+        return self._jobs
+
+    def get(self, job_id):
+        return self.all().get(job_id, None)
+
+    def submitted(self, job_id, indices=None):
+        # a freshly submitted job is not in the cached bjobs output yet
+        if indices is None:
+            self._jobs[job_id] = JobStatus(job_states.PENDING)
+            return
+        for index in indices:
+            self._jobs[array_element(job_id, index)] = JobStatus(job_states.PENDING)
+
+    def _query(self):
+        cmd = ["bjobs", "-a", "-g", self._job_group, "-noheader", "-o",
+               "jobid jobindex stat exit_code exit_reason delimiter='|'"]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (out, err) = proc.communicate()
+        if re.search('No (unfinished )?job found', err):
+            return dict()
+        if proc.returncode != 0:
+            raise ValueError("Error while listing jobs:\n%s" % err)
+        return parse_bjobs_output(out.splitlines())
+
+
+def default_job_group():
+    return "/ngspyeasy/%s" % job_id_generator.TIMESTAMP
+
 
 class LSFProvider(Provider):
-    def __init__(self, queue=None, log_dir=None):
+    def __init__(self, queue=None, log_dir=None, poll_interval=30, job_group=None):
         self._queue = queue
         self._log_dir = log_dir
-
-    def submit(self, name, cmd):
+        self._poll_interval = poll_interval
+        self._job_group = job_group or default_job_group()
+        self._status = LSFJobStatus(self._job_group, ttl=poll_interval)
+
+    def submit(self, name, cmd, resources=None):
+        job_id = self._bsub(name, name, cmd, resources)
+        self._status.submitted(job_id)
+        return job_id
+
+    def submit_array(self, name, cmd, indices, resources=None):
+        # LSF substitutes %I in the output file names with the array element index
+        job_id = self._bsub("%s[%s]" % (name, array_index_spec(indices)), name + ".%I", cmd, resources)
+        self._status.submitted(job_id, indices=indices)
+        return job_id
+
+    def _bsub(self, job_name, log_name, cmd, resources):
         command = ["bsub"]
 
-        command.extend(["-J", name])
+        command.extend(["-J", job_name])
+        command.extend(["-g", self._job_group])
 
         if self._queue:
             command.extend(["-q", str(self._queue)])
 
+        if resources is not None:
+            command.extend(["-n", str(resources.cpu), "-R", "span[hosts=1]"])
+            if resources.memory > 0:
+                command.extend(["-M", "%dMB" % resources.memory, "-R", "rusage[mem=%dMB]" % resources.memory])
+
         if self._log_dir:
-            stderr = os.path.join(self._log_dir, "lsf-%s.err" % name)
-            stdout = os.path.join(self._log_dir, "lsf-%s.out" % name)
+            stderr = os.path.join(self._log_dir, "lsf-%s.err" % log_name)
+            stdout = os.path.join(self._log_dir, "lsf-%s.out" % log_name)
             command.extend(["-o", stdout])
             command.extend(["-e", stderr])
 
         command.append(cmd)
-        logger().debug("Submitting job: name=%s command=\n %s\n" % (name, command))
+        logger().debug("Submitting job: name=%s command=\n %s\n" % (job_name, command))
 
         proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         out = "".join([l for l in proc.stdout])
@@ -57,45 +222,61 @@ class LSFProvider(Provider):
                                   "Executed command:\n%s\n%s\n" % (
                                       out,
                                       err,
-                                      " ".join(cmd)
+                                      " ".join(command)
                                   ))
         return match.group('job_id')
 
+    def attach(self, job_id):
+        self._status.submitted(job_id)
+
     def list(self):
-        proc = subprocess.Popen(["bjobs"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
-        jobs = []
-        for l in proc.stdout:
-            fields = [x for x in l.strip().split(" ") if x]
-            try:
-                long(fields[0])
-            except:
-                continue
-            jobs.append(fields[0])
-        err = "".join([l for l in proc.stderr])
-        if err.startswith('No unfinished job found'):
-            return []
-        if proc.wait() != 0:
-            raise ValueError("Error while listing jobs:\n%s" % (err))
-        return jobs
+        return [job_id for job_id, status in self._status.all().items() if not status.is_finished()]
+
+    def status(self, job_ids):
+        jobs = self._status.all()
+        statuses = dict()
+        for job_id in job_ids:
+            status = jobs.get(job_id, None)
+            if status is None:
+                logger().warn("LSF job %s is not known to bjobs anymore; it finished without an exit code" % job_id)
+                status = JobStatus(job_states.EXIT)
+            statuses[job_id] = status
+        return statuses
 
     def stop(self):
         jobs = self.list()
         for job_id in jobs:
             self._cancel(job_id)
 
+    def poll_interval(self):
+        return self._poll_interval
+
     def _cancel(self, job_id):
         cmd = ["bkill", str(job_id)]
         subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
 
 
 class LocalProvider(Provider):
-    def __init__(self):
-        self._pool_size = max(multiprocessing.cpu_count() / 2, 1)
+    def __init__(self, on_exit=None, capacity=None):
+        self._slots = SlotAllocator(capacity or machine_capacity())
         self._procs = []
         self._waiting_jobs = []
+        self._exited = Queue(-1)
+        self._exit_codes = dict()
+        self._on_exit = on_exit
+
+    def submit(self, name, cmd, resources=None):
+        # a resubmitted (retried) job gets the same id as before
+        self._exit_codes.pop(name, None)
+        self._waiting_jobs.append((name, cmd, None, resources or Resources()))
+        self._run_next()
+        return name
 
-    def submit(self, name, cmd):
-        self._waiting_jobs.insert(0, (name, cmd))
+    def submit_array(self, name, cmd, indices, resources=None):
+        for index in indices:
+            self._exit_codes.pop(array_element(name, index), None)
+            self._waiting_jobs.append(
+                (array_element(name, index), cmd, {"LSB_JOBINDEX": str(index)}, resources or Resources()))
         self._run_next()
         return name
 
@@ -103,32 +284,86 @@ class LocalProvider(Provider):
         self._run_next()
         return [x[0] for x in self._waiting_jobs] + [x[2] for x in self._procs]
 
+    def status(self, job_ids):
+        self._run_next()
+        waiting = set([x[0] for x in self._waiting_jobs])
+        statuses = dict()
+        for job_id in job_ids:
+            if job_id in self._exit_codes:
+                exit_code = self._exit_codes[job_id]
+                statuses[job_id] = JobStatus(job_states.DONE if exit_code == 0 else job_states.EXIT, exit_code,
+                                             out_of_memory=exit_signal(exit_code) == OOM_SIGNAL)
+            elif job_id in waiting:
+                statuses[job_id] = JobStatus(job_states.PENDING)
+            else:
+                statuses[job_id] = JobStatus(job_states.RUNNING)
+        return statuses
+
     def stop(self):
+        self._waiting_jobs = []
         while (len(self._procs) > 0):
             self._stop_all()
             time.sleep(0.5)
 
     def _stop_all(self, sigkill=False):
         self._update()
-        for (proc, cmd, name) in self._procs:
+        for (proc, cmd, name, resources) in self._procs:
             if sigkill:
                 proc.kill()
             else:
                 proc.terminate()
 
+    def _start(self, name, cmd, env):
+        """
+        Starts the job; returns the handle the job is tracked with until it is put to the
+        exited queue together with its return code.
+        """
+        proc_env = os.environ.copy()
+        if env is not None:
+            proc_env.update(env)
+        proc = subprocess.Popen(["/bin/bash", "-c", cmd], env=proc_env)
+        self._watch(proc)
+        return proc
+
     def _run_next(self):
         self._update()
-        if len(self._procs) > self._pool_size:
-            return
-        if len(self._waiting_jobs) == 0:
-            return
-        (name, cmd) = self._waiting_jobs.pop()
-        proc = subprocess.Popen(["/bin/bash", "-c", cmd], env=os.environ.copy())
-        self._procs.append((proc, cmd, name))
+        # first fit: a job which doesn't fit into the free slots doesn't block smaller ones behind it
+        waiting_jobs = []
+        for (name, cmd, env, resources) in self._waiting_jobs:
+            if not self._slots.allocate(resources):
+                waiting_jobs.append((name, cmd, env, resources))
+                continue
+            logger().debug("starting job: name=%s %s" % (name, resources))
+            self._procs.append((self._start(name, cmd, env), cmd, name, resources))
+        self._waiting_jobs = waiting_jobs
+
+    def _watch(self, proc):
+        # the waiter thread is the only one reaping the child (os.waitpid inside Popen.wait),
+        # so the executor loop never has to poll process states
+        thrd = threading.Thread(target=self._wait_for, args=(proc,))
+        thrd.daemon = True
+        thrd.start()
+
+    def _wait_for(self, proc):
+        proc.wait()
+        self._exited.put((proc, proc.returncode))
+        if self._on_exit is not None:
+            self._on_exit()
 
     def _update(self):
-        unfinished = [x for x in self._procs if x[0].poll() is None]
-        self._procs = unfinished
+        exited = dict()
+        while True:
+            try:
+                (proc, returncode) = self._exited.get(block=False)
+                exited[proc] = returncode
+            except Empty:
+                break
+        for (proc, cmd, name, resources) in self._procs:
+            if proc in exited:
+                self._exit_codes[name] = exited[proc]
+                self._slots.release(resources)
+        if len(exited) > 0:
+            self._procs = [x for x in self._procs if x[0] not in exited]
 
 
 work_queue = multiprocessing.Queue(-1)
@@ -136,8 +371,41 @@ work_queue = multiprocessing.Queue(-1)
 results_queue = multiprocessing.Queue(-1)
 
 
-def start(provider, log_dir):
-    e = JobExecutor(provider=provider, log_dir=log_dir)
+class JobRequest(object):
+    def __init__(self, name, cmd, array_indices=None, resources=None, tags=None, job_id=None, retry=None,
+                 attempt=1, results_path=None):
+        self.name = name
+        self.cmd = cmd
+        self.array_indices = array_indices
+        self.resources = resources
+        # journal.RunTag of the job (or of every array element, or of every run of a batch), None if the
+        # job isn't journaled
+        self.tags = tags
+        # id of an already submitted job to re-attach to instead of submitting a new one
+        self.job_id = job_id
+        # retry.RetryPolicy of the job, None if a failed job is not retried
+        self.retry = retry
+        self.attempt = attempt
+        # file a batch writes the exit code of each of its runs to (see batch_results), None if the
+        # job has one exit code for all its runs
+        self.results_path = results_path
+
+    def retry_request(self, index, exit_code, tags=None, out_of_memory=False):
+        """
+        The request to resubmit the job (or one element of the job array) with, if the job
+        failed with exit_code and its retry policy allows another attempt; None otherwise.
+        """
+        if self.retry is None or self.cmd is None or \
+                not self.retry.should_retry(self.attempt, exit_code, out_of_memory):
+            return None
+        return JobRequest(self.name, self.cmd, array_indices=[index] if index is not None else None,
+                          resources=self.retry.resources(self.resources, out_of_memory), tags=tags,
+                          retry=self.retry, attempt=self.attempt + 1, results_path=self.results_path)
+
+
+def start(provider, log_dir, poll_interval=30, journal_path=None, job_group=None, worker_pool=False):
+    e = JobExecutor(provider=provider, log_dir=log_dir, poll_interval=poll_interval, journal_path=journal_path,
+                    job_group=job_group, worker_pool=worker_pool)
     e.start()
 
 
@@ -145,17 +413,88 @@ def stop():
     submit("STOP", None)
 
 
-def submit(name, cmd):
-    work_queue.put((name, cmd))
+def wakeup():
+    submit("WAKEUP", None)
+
+
+def submit(name, cmd, resources=None, tag=None, retry=None):
+    work_queue.put(JobRequest(name, cmd, resources=resources, tags=[tag], retry=retry))
+
+
+def submit_array(name, cmd, indices, resources=None, tags=None, retry=None):
+    work_queue.put(JobRequest(name, cmd, array_indices=indices, resources=resources, tags=tags, retry=retry))
+
+
+def submit_batch(name, cmd, resources=None, tags=None, retry=None, results_path=None):
+    """
+    Submits one job running several play runs, journaled with the tag of every run. With a
+    results_path, the result of every run is reported as batch_element(name, i), i being its
+    position in the batch; otherwise the batch has one result, reported as name.
+    """
+    work_queue.put(JobRequest(name, cmd, resources=resources, tags=tags, retry=retry, results_path=results_path))
+
+
+def attach(name, job_id, tags=None):
+    work_queue.put(JobRequest(name, None, tags=tags, job_id=job_id))
+
+
+def batch_element(name, index):
+    return "%s:%d" % (name, index)
+
+
+def batch_exit_codes(results_path, exit_code, count):
+    """
+    The exit codes of the count runs of a finished batch: the ones the batch wrote or, if it
+    wrote none (e.g. it was killed), its own exit code for every run.
+    """
+    exit_codes = batch_results.read(results_path, count) if exit_code is not None else None
+    batch_results.remove(results_path)
+    return exit_codes or [exit_code] * count
+
+
+def array_element(name, index):
+    return "%s[%d]" % (name, index)
+
+
+def array_elements(name, indices):
+    return [array_element(name, index) for index in indices]
+
+
+def array_index_spec(indices):
+    """
+    Compacts element indices into LSF job array index list, e.g. [1, 2, 3, 5] -> "1-3,5".
+    """
+    ranges = []
+    for index in sorted(indices):
+        if len(ranges) > 0 and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ",".join([str(x) if x == y else "%d-%d" % (x, y) for x, y in ranges])
 
 
 class JobExecutor(multiprocessing.Process):
-    def __init__(self, provider, log_dir):
+    def __init__(self, provider, log_dir, poll_interval=30, journal_path=None, job_group=None, worker_pool=False):
         super(JobExecutor, self).__init__()
-        self._provider = LSFProvider(log_dir=log_dir) if provider == "lsf" else LocalProvider()
+        if provider == "lsf":
+            self._provider = LSFProvider(log_dir=log_dir, poll_interval=poll_interval, job_group=job_group)
+        elif worker_pool:
+            from worker_pool import PoolProvider
+            self._provider = PoolProvider(on_exit=wakeup)
+        else:
+            self._provider = LocalProvider(on_exit=wakeup)
         self._running = True
         self._mapping = dict()
+        # journal.RunTags of the running jobs: one per job, or one per run of a batch
+        self._tags = dict()
+        self._requests = dict()
+        # results file and number of runs of the running batches
+        self._batches = dict()
+        self._retries = []
         self._running_jobs = []
+        self._last_update = 0
+        self._journal_path = journal_path
+        self._journal = None
 
     @contextlib.contextmanager
     def exceptions(self):
@@ -170,35 +509,149 @@ class JobExecutor(multiprocessing.Process):
         global work_queue
         global results_queue
 
+        if self._journal_path is not None:
+            self._journal = Journal(self._journal_path)
+
         while self._running:
-            if not work_queue.empty():
-                (name, cmd) = work_queue.get(block=False)
+            try:
+                request = work_queue.get(block=True, timeout=self._wait_timeout())
+            except Empty:
+                request = None
+            name = request.name if request is not None else None
 
-                if name == "STOP":
-                    logger().info("executor: received [STOP] message")
-                    self._stop()
-                    break
+            if name == "STOP":
+                logger().info("executor: received [STOP] message")
+                self._stop()
+                break
 
+            if name is not None and name != "WAKEUP":
                 logger().info("executor: received cmd to run: name=%s" % name)
-                self._submit(name, cmd)
-            self._update_results()
-
-    def _submit(self, name, cmd):
+                self._submit(request)
+
+            if name == "WAKEUP" or self._poll_timeout() == 0:
+                self._update_results()
+
+            self._submit_retries()
+
+    def _wait_timeout(self):
+        timeouts = [x for x in [self._poll_timeout(), self._retry_timeout()] if x is not None]
+        return min(timeouts) if len(timeouts) > 0 else None
+
+    def _poll_timeout(self):
+        interval = self._provider.poll_interval()
+        if interval is None:
+            return None
+        return max(0, self._last_update + interval - time.time())
+
+    def _retry_timeout(self):
+        if len(self._retries) == 0:
+            return None
+        return max(0, self._retries[0][0] - time.time())
+
+    def _retry_later(self, request, exit_code):
+        delay = request.retry.delay(request.attempt - 1)
+        logger().warn("job %s failed: exit_code=%s; retrying in %ds (attempt %d of %d)" % (
+            request.name if request.array_indices is None else array_element(request.name, request.array_indices[0]),
+            exit_code, delay, request.attempt, request.retry.attempts))
+        heapq.heappush(self._retries, (time.time() + delay, request))
+
+    def _submit_retries(self):
+        while len(self._retries) > 0 and self._retries[0][0] <= time.time():
+            (due, request) = heapq.heappop(self._retries)
+            self._submit(request)
+
+    def _submit(self, request):
+        job_id = None
         with self.exceptions():
-            job_id = self._provider.submit(name, cmd)
+            tags = request.tags or []
+            if request.job_id is not None:
+                job_id = request.job_id
+                self._provider.attach(job_id)
+                self._track(job_id, request.name, tags)
+            elif request.array_indices is None:
+                job_id = self._provider.submit(request.name, request.cmd, request.resources)
+                self._track(job_id, request.name, tags, request)
+            else:
+                job_id = self._provider.submit_array(request.name, request.cmd, request.array_indices,
+                                                     request.resources)
+                for i, index in enumerate(request.array_indices):
+                    self._track(array_element(job_id, index), array_element(request.name, index),
+                                tags[i:i + 1], request, index)
             logger().debug("job_id=%s" % job_id)
-            self._mapping[job_id] = name
-            self._running_jobs.append(job_id)
+            self._journal_submitted(request, job_id)
+        if job_id is None:
+            tags = request.tags or []
+            indices = request.array_indices if request.array_indices is not None else [None]
+            for i, index in enumerate(indices):
+                retry = request.retry_request(index, None, tags[i:i + 1] if index is not None else tags)
+                if retry is not None:
+                    self._retry_later(retry, None)
+                elif request.results_path is not None:
+                    self._put_results(request.name, None, (request.results_path, len(tags)))
+                else:
+                    results_queue.put((request.name if index is None else array_element(request.name, index), None))
+
+    def _track(self, job_id, name, tags=None, request=None, index=None):
+        self._mapping[job_id] = name
+        self._running_jobs.append(job_id)
+        tags = [x for x in tags or [] if x is not None]
+        if len(tags) > 0:
+            self._tags[job_id] = tags
+        if request is not None and request.retry is not None:
+            self._requests[job_id] = (request, index)
+        if request is not None and request.results_path is not None:
+            self._batches[job_id] = (request.results_path, len(request.tags))
+
+    def _journal_submitted(self, request, job_id):
+        if self._journal is None or request.job_id is not None:
+            return
+        if request.array_indices is None:
+            job_ids = [(request.name, job_id)]
+        else:
+            job_ids = [(array_element(request.name, index), array_element(job_id, index))
+                       for index in request.array_indices]
+        self._journal.submitted([(tag, x[0], x[1]) for x in job_ids for tag in self._tags.get(x[1], [])])
 
     def _update_results(self):
+        self._last_update = time.time()
         with self.exceptions():
-            job_list = self._provider.list()
-            finished_jobs = [x for x in self._running_jobs if x not in set(job_list)]
-            for job_id in finished_jobs:
-                results_queue.put(self._mapping[job_id])
-            self._running_jobs = job_list
+            statuses = self._provider.status(self._running_jobs)
+            running_jobs = []
+            finished_tags = []
+            for job_id in self._running_jobs:
+                status = statuses[job_id]
+                if status.is_finished():
+                    logger().debug("job finished: job_id=%s %s" % (job_id, status))
+                    name = self._mapping.pop(job_id)
+                    tags = self._tags.pop(job_id, [])
+                    (request, index) = self._requests.pop(job_id, (None, None))
+                    batch = self._batches.pop(job_id, None)
+                    retry = request.retry_request(index, status.exit_code, tags, status.out_of_memory) \
+                        if request is not None else None
+                    if retry is not None:
+                        self._retry_later(retry, status.exit_code)
+                        continue
+                    if batch is None:
+                        finished_tags.extend([(tag, status.exit_code) for tag in tags])
+                        results_queue.put((name, status.exit_code))
+                    else:
+                        exit_codes = self._put_results(name, status.exit_code, batch)
+                        finished_tags.extend(zip(tags, exit_codes))
+                else:
+                    running_jobs.append(job_id)
+            self._running_jobs = running_jobs
+            if self._journal is not None and len(finished_tags) > 0:
+                self._journal.finished(finished_tags)
+
+    @staticmethod
+    def _put_results(name, exit_code, batch):
+        (results_path, count) = batch
+        exit_codes = batch_exit_codes(results_path, exit_code, count)
+        for i, x in enumerate(exit_codes):
+            results_queue.put((batch_element(name, i), x))
+        return exit_codes
 
     def _stop(self):
         with self.exceptions():
-            results_queue.put("STOP")
+            results_queue.put(("STOP", None))
             self._provider.stop()
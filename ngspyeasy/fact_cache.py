@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import json
+import socket
+import tempfile
+import time
+
+import os
+
+FACTS_DIR = "ngspyeasy_facts"
+
+
+def cache_path():
+    """
+    The facts of a node are kept on its local disk.
+    """
+    return os.path.join(tempfile.gettempdir(), "%s_%d" % (FACTS_DIR, os.getuid()), socket.gethostname() + ".json")
+
+
+def load(ttl, path=None):
+    """
+    The cached facts, or None if there are none or they are older than ttl seconds.
+    """
+    path = path or cache_path()
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def store(facts, path=None):
+    # written to a temporary file first: runs on the node read the cache concurrently
+    path = path or cache_path()
+    if not os.path.isdir(os.path.dirname(path)):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+    tmp_path = "%s.%d" % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(facts, f)
+    os.rename(tmp_path, path)
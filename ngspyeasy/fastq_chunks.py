@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import shlex
+import subprocess
+
+import os
+from logger import logger
+
+# steps of chunked plays which ngspyeasy runs itself, instead of Ansible
+SPLIT_FASTQ = "split_fastq"
+MERGE_BAM = "merge_bam"
+
+# consecutive reads written to the same chunk; the chunks get the blocks in turn, so they are
+# balanced without counting the reads first
+BLOCK_READS = 10000
+
+DEFAULT_MERGE_COMMAND = "samtools merge -f"
+
+
+def chunk_path(fastq, out_dir, index):
+    """
+    Path of a chunk of a FASTQ file: reads.fq.gz -> out_dir/reads.chunk003.fq.gz
+    """
+    name = os.path.basename(fastq)
+    gz = ""
+    if name.endswith(".gz"):
+        (name, gz) = (name[:-3], ".gz")
+    (root, ext) = os.path.splitext(name)
+    return os.path.join(out_dir, "%s.chunk%03d%s%s" % (root, index, ext, gz))
+
+
+def chunk_paths(fastq, out_dir, count):
+    return [chunk_path(fastq, out_dir, i) for i in range(count)]
+
+
+def run_step(step):
+    """
+    Runs a step (see PlayYaml.step()); returns True if it succeeded.
+    """
+    if step["step"] == SPLIT_FASTQ:
+        split(step["inputs"], step["chunks"])
+        return True
+    if step["step"] == MERGE_BAM:
+        return merge(step["outputs"][0], step["inputs"], step.get("command", None))
+    raise ValueError("Unknown step: %s" % step["step"])
+
+
+def split(fastqs, chunks):
+    """
+    Splits FASTQ files (one, or the two files of paired reads) into chunks in one pass: the files
+    are read in step, so the mates stay in chunks with the same index. Compressed files are read
+    and written through gzip processes, never decompressed on disk.
+    """
+    paths = [[(x, "%s.%d.tmp" % (x, os.getpid())) for x in c] for c in chunks]
+    for (path, tmp_path) in sum(paths, []):
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+    readers = [_open_reader(x) for x in fastqs]
+    writers = [[_open_writer(tmp_path, path.endswith(".gz")) for (path, tmp_path) in c] for c in paths]
+    try:
+        reads = _split_records(fastqs, [x.stdout for x in readers], [[x.stdin for x in w] for w in writers])
+        for p in readers + sum(writers, []):
+            _close(p)
+    except:
+        for p in readers + sum(writers, []):
+            _close(p, check=False)
+        for (path, tmp_path) in sum(paths, []):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+    for (path, tmp_path) in sum(paths, []):
+        os.rename(tmp_path, path)
+    logger().info("%d reads split into %d chunks: %s" % (reads, len(chunks[0]), fastqs))
+
+
+def _split_records(fastqs, inputs, outputs):
+    count = len(outputs[0])
+    reads = 0
+    while True:
+        records = [_read_record(x) for x in inputs]
+        if all([x is None for x in records]):
+            return reads
+        if any([x is None for x in records]):
+            raise ValueError("Different number of reads in %s" % fastqs)
+        chunk = (reads // BLOCK_READS) % count
+        for i, record in enumerate(records):
+            outputs[i][chunk].write(record)
+        reads += 1
+
+
+def merge(output, inputs, command=None):
+    """
+    Merges the BAM files of the chunks, which are sorted by coordinate, into one sorted BAM file.
+    """
+    cmd = shlex.split(command or DEFAULT_MERGE_COMMAND) + [output] + inputs
+    logger().info("merging chunks: %s" % " ".join(cmd))
+    return subprocess.call(cmd) == 0
+
+
+def _read_record(stream):
+    header = stream.readline()
+    if not header:
+        return None
+    if not header.startswith("@"):
+        raise ValueError("Not a FASTQ record: %s" % header.strip())
+    return header + stream.readline() + stream.readline() + stream.readline()
+
+
+def _open_reader(path):
+    if path.endswith(".gz"):
+        return subprocess.Popen(["gzip", "-dc", path], stdout=subprocess.PIPE, bufsize=-1, close_fds=True)
+    return _Plain(stdout=open(path, 'rb'))
+
+
+def _open_writer(path, compressed):
+    if not compressed:
+        return _Plain(stdin=open(path, 'wb'))
+    with open(path, 'wb') as out:
+        # level 1: the chunks are only kept until they are aligned
+        return subprocess.Popen(["gzip", "-1", "-c"], stdin=subprocess.PIPE, stdout=out, bufsize=-1,
+                                close_fds=True)
+
+
+def _close(p, check=True):
+    for stream in [p.stdin, p.stdout]:
+        if stream is not None:
+            stream.close()
+    if p.wait() != 0 and check:
+        raise IOError("gzip failed with exit code %s" % p.returncode)
+
+
+class _Plain(object):
+    """
+    An uncompressed file with the same interface as a gzip process.
+    """
+
+    def __init__(self, stdout=None, stdin=None):
+        self.stdout = stdout
+        self.stdin = stdin
+        self.returncode = 0
+
+    def wait(self):
+        return 0
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import fnmatch
+import glob
+
+import os
+
+try:
+    # the scandir package (os.scandir in Python 3) tells the directories without a stat per entry
+    from scandir import scandir
+except ImportError:
+    scandir = None
+
+RECURSIVE = "**"
+
+
+def find(pattern):
+    """
+    Yields the paths matching a glob pattern as the directories are listed, sorted by name within
+    every directory. Only the directories the pattern can match are listed; "**" matches any number
+    of directories, including none (symbolic links to directories are not followed by "**").
+    Like glob, wildcards don't match names starting with a dot.
+    """
+    parts = pattern.split(os.sep)
+    if parts[0] == "":
+        return _find(os.sep, parts[1:])
+    return _find("", parts)
+
+
+def find_all(pattern):
+    """
+    All paths matching the pattern, sorted by the whole path like sorted(glob.glob(pattern)), which
+    differs from the order of find() across directories (a-b/x comes before a/x). The runs of a play
+    are planned from the whole list; find() is consumed as it goes by the file watcher.
+    """
+    return sorted(find(pattern))
+
+
+def root(pattern):
+    """
+    The directory the paths matching the pattern are found under: its leading parts without
+    wildcards (the directory of a pattern without any).
+    """
+    parts = pattern.split(os.sep)
+    fixed = 0
+    while fixed < len(parts) - 1 and not glob.has_magic(parts[fixed]):
+        fixed += 1
+    if fixed == 1 and parts[0] == "":
+        return os.sep
+    return os.sep.join(parts[:fixed]) or os.curdir
+
+
+def _find(base, parts):
+    fixed = 0
+    while fixed < len(parts) and not glob.has_magic(parts[fixed]):
+        fixed += 1
+    if fixed > 0:
+        base = os.path.join(base, *parts[:fixed])
+    parts = parts[fixed:]
+    if len(parts) == 0:
+        if os.path.lexists(base):
+            yield base
+        return
+
+    part, rest = parts[0], parts[1:]
+    if part == RECURSIVE:
+        for path in _find(base, rest):
+            yield path
+        for (name, is_dir, is_link) in _list(base):
+            if _is_hidden(name) or is_link or not is_dir:
+                continue
+            for path in _find(os.path.join(base, name), parts):
+                yield path
+        return
+
+    for (name, is_dir, is_link) in _list(base):
+        if _is_hidden(name) and not part.startswith("."):
+            continue
+        if not fnmatch.fnmatchcase(name, part):
+            continue
+        path = os.path.join(base, name)
+        if len(rest) == 0:
+            yield path
+        elif is_dir:
+            for p in _find(path, rest):
+                yield p
+
+
+def _list(directory):
+    """
+    (name, is_dir, is_link) of the entries of a directory, sorted by name; nothing if it can't be listed.
+    """
+    try:
+        if scandir is not None:
+            return sorted([(x.name, x.is_dir(), x.is_symlink()) for x in scandir(directory or os.curdir)])
+        names = sorted(os.listdir(directory or os.curdir))
+    except OSError:
+        return []
+    return [(x, _Lazy(os.path.isdir, os.path.join(directory, x)), _Lazy(os.path.islink, os.path.join(directory, x)))
+            for x in names]
+
+
+class _Lazy(object):
+    """
+    A boolean computed on first use: without scandir an entry is stat'ed only if its type matters.
+    """
+
+    def __init__(self, func, path):
+        self._func = func
+        self._path = path
+        self._value = None
+
+    def __nonzero__(self):
+        if self._value is None:
+            self._value = self._func(self._path)
+        return self._value
+
+
+def _is_hidden(name):
+    return name.startswith(".")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import hashlib
+import json
+
+import os
+import yaml
+import file_finder
+from var_scope import json_default
+
+CHUNK_SIZE = 1024 * 1024
+
+# the sample table: a run on one sample (or file) has its row in the context instead, so adding
+# a sample to the table changes only the fingerprints of the runs over all samples
+SAMPLES_VAR = "all_samples"
+
+
+def fingerprint_path(outputs):
+    """
+    The fingerprint of a run is kept next to its first declared output.
+    """
+    first = outputs[0]
+    return os.path.join(os.path.dirname(first), ".%s.fingerprint" % os.path.basename(first))
+
+
+def is_up_to_date(digest, outputs):
+    if not all([os.path.exists(x) for x in outputs]):
+        return False
+    path = fingerprint_path(outputs)
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'r') as f:
+        return f.read().strip() == digest
+
+
+def store(digest, outputs):
+    path = fingerprint_path(outputs)
+    tmp_path = "%s.%d" % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write(digest + "\n")
+    os.rename(tmp_path, path)
+
+
+class Fingerprinter(object):
+    """
+    Computes the fingerprint of a play run: a hash of the play yaml, the roles (and modules)
+    it uses, the playbook variables, the run contexts and the declared input files (patterns are
+    expanded), either by their size and mtime or by their content.
+    """
+
+    def __init__(self, playbook_dir):
+        self._roles_dir = os.path.join(playbook_dir, "roles")
+        self._library_dir = os.path.join(playbook_dir, "library")
+        self._digests = dict()
+        self._vars_digests = (None, dict())
+
+    def compute(self, play_yaml, variables, contexts, inputs, content=False):
+        h = hashlib.sha1()
+        h.update(_dumps(play_yaml))
+        h.update(self._variables_digest(variables, any(contexts)))
+        h.update(_dumps(contexts))
+        for role in sorted(self._roles(play_yaml)):
+            h.update("role:%s:%s" % (role, self._dir_digest(os.path.join(self._roles_dir, role))))
+        h.update("library:%s" % self._dir_digest(self._library_dir))
+        for pattern in inputs:
+            # a pattern matching nothing is hashed as a missing file
+            for path in file_finder.find_all(pattern) or [pattern]:
+                h.update("input:%s:%s" % (path, _file_digest(path, content)))
+        return h.hexdigest()
+
+    def _variables_digest(self, variables, per_run):
+        # the playbook variables are shared by all runs, so they are hashed once
+        (hashed, digests) = self._vars_digests
+        if hashed is not variables:
+            digests = dict()
+            self._vars_digests = (variables, digests)
+        if per_run not in digests:
+            shared = dict([(k, v) for k, v in variables.items() if not per_run or k != SAMPLES_VAR])
+            digests[per_run] = hashlib.sha1(_dumps(shared)).hexdigest()
+        return digests[per_run]
+
+    def _roles(self, play_yaml):
+        roles = set()
+        stack = [_role_name(x) for x in play_yaml.get("roles", None) or []]
+        while stack:
+            role = stack.pop()
+            if role is None or role in roles:
+                continue
+            roles.add(role)
+            stack.extend([_role_name(x) for x in self._role_dependencies(role)])
+        return roles
+
+    def _role_dependencies(self, role):
+        meta = os.path.join(self._roles_dir, role, "meta", "main.yml")
+        if not os.path.isfile(meta):
+            return []
+        with open(meta, 'r') as stream:
+            meta_yaml = yaml.load(stream) or dict()
+        return meta_yaml.get("dependencies", None) or []
+
+    def _dir_digest(self, path):
+        # roles don't change while the pipeline is running, so every directory is hashed once
+        if path not in self._digests:
+            self._digests[path] = dir_digest(path)
+        return self._digests[path]
+
+
+def dir_digest(path):
+    """
+    A hash of the names and the content of all files in a directory tree.
+    """
+    h = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            h.update("%s:%s" % (os.path.relpath(file_path, path), _content_digest(file_path)))
+    return h.hexdigest()
+
+
+def _role_name(role):
+    if isinstance(role, dict):
+        return role.get("role", role.get("name", None))
+    return role
+
+
+def _dumps(obj):
+    return json.dumps(obj, sort_keys=True, default=json_default)
+
+
+def _file_digest(path, content=False):
+    if not os.path.exists(path):
+        return "missing"
+    if os.path.isdir(path):
+        h = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                h.update("%s:%s" % (os.path.relpath(file_path, path), _file_digest(file_path, content)))
+        return h.hexdigest()
+    if content:
+        return _content_digest(path)
+    st = os.stat(path)
+    return "%d:%d" % (st.st_size, int(st.st_mtime))
+
+
+def _content_digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        chunk = f.read(CHUNK_SIZE)
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(CHUNK_SIZE)
+    return h.hexdigest()
@@ -17,6 +17,10 @@
 ###
 
 import os
+import re
+
+# contig[:start[-end]], 1-based and inclusive, as in samtools and GATK
+REGION = re.compile(r'^(?P<contig>[^:]+)(:(?P<start>[\d,]+)(-(?P<end>[\d,]+))?)?$')
 
 
 def select(gb, projects_home):
@@ -97,3 +101,71 @@ class GenomeBuild(object):
 
     def adapter_fa(self):
         return self.path_to("contaminant_list.fa")
+
+    def intervals(self, size=None, contigs=None):
+        return split_intervals(read_contigs(self.ref_fasta()), size, contigs)
+
+
+def read_contigs(ref_fasta):
+    """
+    (name, length) of the contigs of a reference, from its samtools index (ref.fasta.fai) or,
+    if there is none, its sequence dictionary (ref.dict).
+    """
+    fai = ref_fasta + ".fai"
+    if os.path.isfile(fai):
+        with open(fai, 'r') as f:
+            return [(x[0], int(x[1])) for x in [line.split("\t") for line in f] if len(x) > 1]
+    seq_dict = os.path.splitext(ref_fasta)[0] + ".dict"
+    if os.path.isfile(seq_dict):
+        contigs = []
+        with open(seq_dict, 'r') as f:
+            for line in f:
+                if not line.startswith("@SQ"):
+                    continue
+                fields = dict([x.split(":", 1) for x in line.rstrip("\n").split("\t")[1:] if ":" in x])
+                contigs.append((fields["SN"], int(fields["LN"])))
+        return contigs
+    raise ValueError("No index (.fai or .dict) of the reference %s" % ref_fasta)
+
+
+def split_intervals(contigs, size=None, names=None):
+    """
+    Intervals of at most size bases (a whole contig each without size) covering the contigs,
+    or only the named ones, in the order of the reference.
+    """
+    if names is not None:
+        names = set([str(x) for x in names])
+    intervals = []
+    for (contig, length) in contigs:
+        if names is not None and contig not in names:
+            continue
+        step = size or length
+        for start in range(1, length + 1, step):
+            intervals.append(interval(contig, start, min(start + step - 1, length)))
+    return intervals
+
+
+def interval(contig, start=None, end=None):
+    """
+    An interval as plays see it (curr_interval): contig, start, end and the region string.
+    """
+    region = contig if start is None else "%s:%d-%d" % (contig, start, end)
+    return {"contig": contig, "start": start, "end": end, "region": region}
+
+
+def parse_interval(value):
+    """
+    An interval from a region string ("20:1-1000000", "20") or a dict with contig, start and end.
+    """
+    if isinstance(value, dict):
+        if "region" in value:
+            return value
+        return interval(str(value["contig"]), value.get("start", None), value.get("end", None))
+    m = REGION.match(str(value).strip())
+    if m is None:
+        raise ValueError("Invalid interval: %s" % value)
+    if m.group("start") is None:
+        return interval(m.group("contig"))
+    start = int(m.group("start").replace(",", ""))
+    end = int(m.group("end").replace(",", "")) if m.group("end") is not None else start
+    return interval(m.group("contig"), start, end)
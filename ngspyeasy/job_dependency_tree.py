@@ -16,18 +16,28 @@
 # limitations under the License.
 ###
 
+import collections
+
 from utils import Enum
 
-states = Enum('NEW', 'DONE', 'ERROR', 'RUNNING')
+states = Enum('NEW', 'DONE', 'ERROR', 'RUNNING', 'SKIPPED')
 
 
 class JobDependencyTree(object):
+    """
+    Every job keeps a counter of its unfinished parents; a job is moved to the ready
+    queue when the counter drops to zero, so get(), done() and has_running_jobs() don't
+    depend on the size of the tree.
+    """
+
     def __init__(self):
         self.root = Job("root", None)
         self.root.finish(0)
 
         self.index = 0
         self.dict = {"root": self.root}
+        self.ready = collections.deque()
+        self.running = 0
 
     def append(self, job_id, job_dependencies=None, job_details=None):
         if self.dict.has_key(job_id):
@@ -38,7 +48,7 @@ class JobDependencyTree(object):
 
         job = Job(job_id, job_details)
         parents = []
-        for parent_id in job_dependencies:
+        for parent_id in set(job_dependencies):
             parent = self.dict.get(parent_id)
             if parent is None:
                 raise ValueError("Job with id=[%s] doesn't exist", parent_id)
@@ -47,46 +57,70 @@ class JobDependencyTree(object):
         self.dict[job_id] = job
         for parent in parents:
             parent.append_child(job)
+            if not parent.is_done():
+                job.pending += 1
+
+        if job.pending == 0:
+            self.ready.append(job)
 
     def get(self):
-        next_job = self.bfs(lambda x: x.is_new())
-        if next_job is not None:
-            next_job.start()
-            return next_job.get_id(), next_job.get_details()
+        while self.ready:
+            next_job = self.ready.popleft()
+            # a job can be finished by done() while it is still waiting in the queue
+            if next_job.is_new():
+                next_job.start()
+                self.running += 1
+                return next_job.get_id(), next_job.get_details()
         return None, None
 
     def has_running_jobs(self):
-        job = self.bfs(lambda x: x.is_running())
-        return job is not None
-
-    def bfs(self, predicate):
-        queue = [self.root]
-        visited = set()
-        while queue:
-            curr = queue.pop(0)
-            visited.add(curr)
-
-            if predicate(curr):
-                return curr
-
-            queue.extend(set([x for x in curr.get_children() if x.is_done() or predicate(x)]) - visited)
-
-        return None
+        return self.running > 0
 
     def done(self, job_id, retcode):
+        """
+        Marks the job finished. If it failed, all its descendants are marked as skipped
+        and their ids are returned; jobs which don't depend on it are not affected.
+        """
         job = self.dict.get(job_id)
         if job is None:
             raise ValueError("Job with id=[%s] doesn't exist", job_id)
+        if job.is_done() or job.is_error() or job.is_skipped():
+            return []
+        if job.is_running():
+            self.running -= 1
         job.finish(retcode)
+        if not job.is_done():
+            return self._skip_descendants(job)
+        for child in job.children:
+            child.pending -= 1
+            if child.pending == 0 and child.is_new():
+                self.ready.append(child)
+        return []
+
+    def _skip_descendants(self, job):
+        skipped = []
+        stack = list(job.children)
+        while stack:
+            curr = stack.pop()
+            if not curr.is_new():
+                continue
+            curr.skip()
+            skipped.append(curr.get_id())
+            stack.extend(curr.children)
+        return skipped
 
     def has_key(self, req_id):
         return self.dict.has_key(req_id)
 
+    def details(self, job_id):
+        return self.dict[job_id].get_details()
+
 
 class Job():
     def __init__(self, id, details):
         self.state = states.NEW
-        self.children = set()
+        self.children = []
+        self.pending = 0
         self.id = id
         self.details = details
 
@@ -96,8 +130,11 @@ class Job():
     def start(self):
         self.state = states.RUNNING
 
+    def skip(self):
+        self.state = states.SKIPPED
+
     def append_child(self, child_job):
-        self.children.add(child_job)
+        self.children.append(child_job)
 
     def get_id(self):
         return self.id
@@ -117,6 +154,12 @@ class Job():
     def is_running(self):
         return self.state == states.RUNNING
 
+    def is_error(self):
+        return self.state == states.ERROR
+
+    def is_skipped(self):
+        return self.state == states.SKIPPED
+
     def __eq__(self, other):
         if isinstance(other, self.__class__):
             return self.id == other.id
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import sqlite3
+import time
+
+import os.path
+
+JOURNAL_FILE = "ngspyeasy_journal.sqlite"
+
+RUNNING = "RUNNING"
+DONE = "DONE"
+FAILED = "FAILED"
+
+
+def journal_path(log_dir):
+    return os.path.join(log_dir, JOURNAL_FILE)
+
+
+class RunTag(object):
+    """
+    Identifies a play run in the journal by its play and its run key (see PlayRun.key()), which,
+    unlike the run index, stays the same when the samples are reordered or, in watch mode, when
+    the files arrive in other batches.
+    """
+
+    def __init__(self, play_index, run_index, run_key):
+        self.play_index = play_index
+        self.run_index = run_index
+        self.run_key = run_key
+
+    def __repr__(self):
+        return "RunTag(%s, %s, %s)" % (self.play_index, self.run_index, self.run_key)
+
+
+class JournalRecord(object):
+    def __init__(self, run_key, job_name, job_id, state, exit_code):
+        self.run_key = run_key
+        self.job_name = job_name
+        self.job_id = job_id
+        self.state = state
+        self.exit_code = exit_code
+
+    def is_done(self):
+        return self.state == DONE
+
+    def is_running(self):
+        return self.state == RUNNING
+
+
+class Journal(object):
+    """
+    Durable record of every submitted and finished play run, kept in a SQLite database
+    in the log directory, so an interrupted pipeline can be resumed.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=60)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS runs ("
+                               "play_index INTEGER, run_index INTEGER, run_key TEXT, job_name TEXT, job_id TEXT, "
+                               "state TEXT, exit_code INTEGER, updated REAL, PRIMARY KEY (play_index, run_key))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def close(self):
+        self._conn.close()
+
+    def clear(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM runs")
+            self._conn.execute("DELETE FROM meta")
+
+    def get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_meta(self, key, value):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def submitted(self, jobs):
+        """
+        jobs is a list of (run_tag, job_name, job_id) tuples; they are written in one transaction.
+        """
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO runs "
+                "(play_index, run_index, run_key, job_name, job_id, state, exit_code, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, NULL, ?)",
+                [(tag.play_index, tag.run_index, tag.run_key, job_name, job_id, RUNNING, now)
+                 for (tag, job_name, job_id) in jobs])
+
+    def finished(self, jobs):
+        """
+        jobs is a list of (run_tag, exit_code) tuples; they are written in one transaction.
+        """
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE runs SET state = ?, exit_code = ?, updated = ? WHERE play_index = ? AND run_key = ?",
+                [(DONE if exit_code == 0 else FAILED, exit_code, now, tag.play_index, tag.run_key)
+                 for (tag, exit_code) in jobs])
+
+    def records(self):
+        records = dict()
+        for row in self._conn.execute(
+                "SELECT play_index, run_key, job_name, job_id, state, exit_code FROM runs"):
+            records[(row[0], row[1])] = JournalRecord(*row[1:])
+        return records
+
+
+class ResumeIndex(object):
+    """
+    Tells which runs of a resumed pipeline are already finished or still running; the records
+    are found by the play index and the run key.
+    """
+
+    def __init__(self, records=None, attach=False):
+        self._records = records or dict()
+        self._attach = attach
+
+    def record(self, tag):
+        return self._records.get((tag.play_index, tag.run_key), None)
+
+    def is_done(self, tag):
+        record = self.record(tag)
+        return record is not None and record.is_done()
+
+    def running_job_id(self, tag):
+        """
+        Id of the job the run was submitted with, if the job can still be tracked.
+        """
+        record = self.record(tag)
+        if not self._attach or record is None or not record.is_running():
+            return None
+        return record.job_id
@@ -17,6 +17,7 @@
 ###
 
 import sys
+import contextlib
 import logging
 import datetime
 import multiprocessing
@@ -46,13 +47,18 @@ def init_main_logger(log_dir, verbose=True):
     return logger
 
 
-def init_play_run_logger(log_dir, run_id, verbose=True):
+def play_run_log_file(log_dir, run_id):
     logname = "%s_ngseasy@%s.log" % (datetime.datetime.now().strftime("%d%m%y"), run_id)
-    logfile = os.path.join(log_dir, logname)
 
     if not os.path.isdir(log_dir):
         os.makedirs(log_dir)
 
+    return os.path.join(log_dir, logname)
+
+
+def init_play_run_logger(log_dir, run_id, verbose=True):
+    logfile = play_run_log_file(log_dir, run_id)
+
     logger = logging.getLogger("root")
     logger.setLevel(logging.DEBUG if verbose else logging.INFO)
     logger.addHandler(file_handler(logfile))
@@ -65,6 +71,25 @@ def init_play_run_logger(log_dir, run_id, verbose=True):
     return logger
 
 
+@contextlib.contextmanager
+def play_run_logger(log_dir, run_id):
+    """
+    Logs to the play run log file while one run is executed by a long-lived worker process;
+    the file handlers are removed when the run is finished.
+    """
+    logfile = play_run_log_file(log_dir, run_id)
+    handlers = [(logging.getLogger("root"), file_handler(logfile)),
+                (logging.getLogger("file-only"), file_handler(logfile))]
+    for (logger, handler) in handlers:
+        logger.addHandler(handler)
+    try:
+        yield
+    finally:
+        for (logger, handler) in handlers:
+            logger.removeHandler(handler)
+            handler.close()
+
+
 def multi_proc_handler(logfile):
     handler = MultiProcLogHandler(logfile)
     handler.setFormatter(FORMATTER)
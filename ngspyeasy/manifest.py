@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import json
+import struct
+
+import os
+from var_scope import VarScope, json_default
+
+MANIFEST_FILE = "ngspyeasy_manifest.jsonl"
+
+# offsets of the run records in the index file: unsigned 8 bytes, big endian
+OFFSET = struct.Struct(">Q")
+
+
+def manifest_path(log_dir, batch=None):
+    """
+    In watch mode every batch of new files gets its own manifest.
+    """
+    if batch is None:
+        return os.path.join(log_dir, MANIFEST_FILE)
+    (name, ext) = os.path.splitext(MANIFEST_FILE)
+    return os.path.join(log_dir, "%s.%d%s" % (name, batch, ext))
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class RunRecord(object):
+    """
+    Everything a play run needs to be executed: the task yaml of the play, the variables
+    (the playbook ones plus the run context, e.g. curr_sample) and the files to fingerprint.
+    A run of a split play has several contexts: the play is run once for each of them.
+    """
+
+    def __init__(self, name, variables, contexts, play_yaml, inputs=None, outputs=None, hash_inputs=False, step=None):
+        self._name = name
+        self._vars = variables
+        self._contexts = contexts
+        self._yaml = play_yaml
+        self._inputs = inputs or []
+        self._outputs = outputs or []
+        self._hash_inputs = hash_inputs
+        # a step ngspyeasy runs itself instead of the play (see fastq_chunks.run_step)
+        self._step = step
+
+    def name(self):
+        return self._name
+
+    def vars(self):
+        return VarScope(self._vars, self._contexts[0])
+
+    def all_vars(self):
+        return [VarScope(self._vars, x) for x in self._contexts]
+
+    def shared_vars(self):
+        # the playbook variables, the same for all runs
+        return self._vars
+
+    def context(self):
+        return self._contexts[0]
+
+    def yaml(self):
+        # the top level only: ngspyeasy_play_run sets the hosts
+        return dict(self._yaml)
+
+    def step(self):
+        return self._step
+
+    def fingerprint(self, fingerprinter):
+        """
+        Returns (digest, outputs) if the play declares its outputs, (None, None) otherwise.
+        """
+        if fingerprinter is None or len(self._outputs) == 0:
+            return None, None
+        digest = fingerprinter.compute(self._yaml, self._vars, self._contexts, self._inputs, content=self._hash_inputs)
+        return digest, self._outputs
+
+    def to_json(self):
+        return {"name": self._name, "contexts": self._contexts, "inputs": self._inputs, "outputs": self._outputs,
+                "step": self._step}
+
+
+def write(path, variables, plays):
+    """
+    Writes the manifest of a playbook: plays is a list of (play_yaml, hash_inputs, records) tuples,
+    where records are the RunRecord of every run of the play (one for a play without samples/files).
+    The first line keeps the variables and the plays, then goes one line per run; the index file
+    keeps the offsets of the run lines, so a run reads only the header and its own line.
+    """
+    tmp_path = "%s.%d" % (path, os.getpid())
+    with open(tmp_path, 'wb') as data, open(index_path(tmp_path), 'wb') as index:
+        first = []
+        count = 0
+        play_list = []
+        runs = []
+        for (play_yaml, hash_inputs, records) in plays:
+            first.append(count)
+            play_list.append((play_yaml, hash_inputs))
+            runs.append(records)
+            count += len(records)
+        header = {"vars": variables, "plays": play_list, "first": first}
+        data.write(_dumps(header) + "\n")
+        for records in runs:
+            for record in records:
+                index.write(OFFSET.pack(data.tell()))
+                data.write(_dumps(record.to_json()) + "\n")
+    os.rename(index_path(tmp_path), index_path(path))
+    os.rename(tmp_path, path)
+
+
+class Manifest(object):
+    def __init__(self, path):
+        self._path = path
+        with open(path, 'rb') as data:
+            header = json.loads(data.readline())
+        self._vars = header["vars"]
+        self._plays = header["plays"]
+        self._first = header["first"]
+
+    def run_record(self, play_index, run_index):
+        ordinal = self._first[play_index] + max(run_index, 0)
+        with open(index_path(self._path), 'rb') as index:
+            index.seek(ordinal * OFFSET.size)
+            (offset,) = OFFSET.unpack(index.read(OFFSET.size))
+        with open(self._path, 'rb') as data:
+            data.seek(offset)
+            run = json.loads(data.readline())
+        (play_yaml, hash_inputs) = self._plays[play_index]
+        return RunRecord(run["name"], self._vars, run["contexts"], play_yaml, inputs=run["inputs"],
+                         outputs=run["outputs"], hash_inputs=hash_inputs, step=run["step"])
+
+
+def _dumps(obj):
+    return json.dumps(obj, default=json_default)
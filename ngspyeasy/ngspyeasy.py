@@ -16,15 +16,29 @@
 # limitations under the License.
 ###
 
+import Queue
 import argparse
+import collections
+import functools
 import sys
 import signal
+import tempfile
+import time
 
 import executor
+import file_finder
+import journal
+import manifest
+import staging
 import playbook_yaml
 import os
 import cmdargs
+from job_dependency_tree import JobDependencyTree
 from logger import logger, init_main_logger
+from watcher import FileWatcher
+
+# put into the results queue by the file watcher to wake up the main loop
+WATCH = "WATCH"
 
 
 def main(argv):
@@ -38,8 +52,47 @@ def main(argv):
     parser.add_argument("--provider", dest="provider", choices=["local", "lsf"], default="local",
                         help="job scheduler")
     parser.add_argument("--log_dir", dest="log_dir", type=cmdargs.existed_directory)
+    parser.add_argument("--poll_interval", dest="poll_interval", type=int, default=30,
+                        help="seconds between job status queries to a remote job scheduler")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--job_arrays", dest="job_arrays", action="store_true",
+                      help="submit all runs of a play as a job array")
+    mode.add_argument("--pipelined", dest="pipelined", action="store_true",
+                      help="start a run as soon as the runs it depends on are finished, instead of waiting "
+                           "for the whole previous play")
+    mode.add_argument("--watch", dest="watch", action="store_true",
+                      help="keep watching the files patterns of the plays and run the plays on new files as "
+                           "they arrive, pipelined")
+    parser.add_argument("--max_array_size", dest="max_array_size", type=int, default=1000,
+                        help="maximum number of elements in one job array (MAX_JOB_ARRAY_SIZE in LSF)")
+    parser.add_argument("--resume", dest="resume", action="store_true",
+                        help="skip the runs finished by the previous pipeline run with the same log_dir")
+    parser.add_argument("--watch_stable", dest="watch_stable", type=int, default=30,
+                        help="seconds a new file must stay unchanged before it is run on (with --watch)")
+    parser.add_argument("--watch_idle", dest="watch_idle", type=int,
+                        help="stop watching when no new file arrived for this many seconds and all runs are "
+                             "finished (with --watch); by default the pipeline runs until it is interrupted")
+    parser.add_argument("--batch_size", dest="batch_size", type=int, default=1,
+                        help="run this many runs of a play as one job, in parallel on local pseudo-hosts of one "
+                             "Ansible invocation (without --pipelined, --job_arrays and --watch)")
+    parser.add_argument("--fact_cache_ttl", dest="fact_cache_ttl", type=int, default=0,
+                        help="gather the facts of a node once and reuse them in the runs on it for this many "
+                             "seconds; by default every run gathers them")
+    parser.add_argument("--worker_pool", dest="worker_pool", action="store_true",
+                        help="run plays in a pool of long-lived worker processes instead of starting a new "
+                             "process per run (local provider only)")
 
     args = parser.parse_args(argv)
+    if args.resume and args.log_dir is None:
+        parser.error("--resume requires --log_dir")
+    if args.worker_pool and args.provider != "local":
+        parser.error("--worker_pool can be used with the local provider only")
+    if args.batch_size < 1:
+        parser.error("--batch_size must be positive")
+    if args.batch_size > 1 and (args.pipelined or args.job_arrays or args.watch):
+        parser.error("--batch_size can't be used with --pipelined, --job_arrays or --watch")
+    if args.watch and args.provider == "lsf" and args.log_dir is None:
+        parser.error("--watch with the lsf provider requires --log_dir")
 
     if args.log_dir is not None:
         init_main_logger(args.log_dir)
@@ -50,43 +103,469 @@ def main(argv):
     samples_tsv = os.path.abspath(args.samples_tsv) if args.samples_tsv else None
     var_files = [os.path.abspath(f) for f in args.var_files]
 
-    pb = playbook_yaml.parse(playbook_path, samples_tsv, var_files, args.log_dir)
+    # runs read their records from the manifest instead of parsing the playbook again, and share
+    # one read-only copy of the roles and library. Without a log_dir they go to a local temporary
+    # directory, which LSF jobs on other nodes can't see: these parse the playbook themselves
+    temp_dir = tempfile.mkdtemp() if args.log_dir is None and args.provider == "local" else None
+    shared_dir = args.log_dir or temp_dir
+    manifest_path = manifest.manifest_path(shared_dir) if shared_dir is not None else None
+    staged_dir = staging.stage(os.path.dirname(playbook_path), shared_dir) if shared_dir is not None else None
+
+    pb = playbook_yaml.parse(playbook_path, samples_tsv, var_files, args.log_dir, manifest_path, staged_dir,
+                             args.fact_cache_ttl)
+    if args.watch and None in pb.file_patterns():
+        if temp_dir is not None:
+            staging.remove(temp_dir)
+        parser.error("--watch requires files in every play")
+    elif manifest_path is not None and not args.watch:
+        # in watch mode every batch of new files gets its own manifest
+        pb.write_manifest(manifest_path)
+
+    (journal_path, job_group, resume) = open_journal(args.log_dir, args.resume, args.provider == "lsf")
 
     logger().info("Starting job executor: provider=%s" % args.provider)
-    executor.start(provider=args.provider, log_dir=args.log_dir)
+    executor.start(provider=args.provider, log_dir=args.log_dir, poll_interval=args.poll_interval,
+                   journal_path=journal_path, job_group=job_group, worker_pool=args.worker_pool)
 
+    report = RunReport()
     try:
-        for play in pb.plays():
-            logger().info("Starting play: %s" % play.name())
-            jobs = []
-            for name, cmd in play.commands():
-                logger().debug("cmd submit: name=%s\n %s\n" % (name, cmd))
-                executor.submit(name, cmd)
-                jobs.append(name)
-            if not wait_for_results(jobs):
-                break
-
+        if args.watch:
+            completed = run_watching(pb, report, shared_dir, resume, args.watch_stable, args.watch_idle)
+        elif args.pipelined:
+            completed = run_pipelined(pb, report, resume)
+        else:
+            completed = run_sequentially(pb, report, args.job_arrays, args.max_array_size, resume, args.batch_size)
+        if not completed:
+            report.interrupted()
     except Exception as e:
         logger().exception(e)
+        return 1
     finally:
         executor.stop()
+        if temp_dir is not None:
+            staging.remove(temp_dir)
+
+    report.log_summary()
+    return 1 if report.has_failures() else 0
+
+
+def open_journal(log_dir, resume=False, attach=False):
+    """
+    Returns the path of the run journal, the LSF job group and the index of the runs
+    already done; a new journal is started unless the pipeline is resumed.
+    """
+    if log_dir is None:
+        return None, None, journal.ResumeIndex()
+
+    path = journal.journal_path(log_dir)
+    j = journal.Journal(path)
+    try:
+        records = dict()
+        job_group = None
+        if resume:
+            records = j.records()
+            job_group = j.get_meta("job_group")
+            logger().info("Resuming pipeline: %d runs in the journal %s" % (len(records), path))
+        else:
+            j.clear()
+        if job_group is None:
+            job_group = executor.default_job_group()
+            j.set_meta("job_group", job_group)
+    finally:
+        j.close()
+    return path, job_group, journal.ResumeIndex(records, attach)
+
+
+def run_tag(play, play_run, offset=0):
+    return journal.RunTag(play.index(), offset + play_run.index(), " ".join(play_run.key()))
+
+
+def run_sequentially(pb, report, job_arrays=False, max_array_size=1000, resume=None, batch_size=1):
+    resume = resume or journal.ResumeIndex()
+    play_jobs = pb.play_jobs()
+    for play, jobs in play_jobs:
+        logger().info("Starting play: %s" % play.name())
+        runnable = []
+        submitted = dict()
+        attached = collections.OrderedDict()
+        for job in jobs:
+            (play_run, name, cmd, resources, dependencies) = job
+            report.add(name, play, play_run)
+            tag = run_tag(play, play_run)
+            if report.any_failed(dependencies):
+                report.skipped(name)
+            elif resume.is_done(tag):
+                logger().info("Job %s skipped: already done" % name)
+                report.succeeded(name)
+            elif pb.is_up_to_date(play, play_run):
+                logger().info("Job %s skipped: outputs are up to date" % name)
+                report.succeeded(name)
+            elif resume.running_job_id(tag) is not None:
+                # the runs of a batch are still running in the same job, which is attached to as a
+                # whole: it has one result for all of them
+                attached.setdefault(resume.running_job_id(tag), []).append((job, tag))
+            else:
+                runnable.append(job)
+
+        lost = dict()
+        for job_id, runs in attached.items():
+            name = runs[0][0][1]
+            executor.attach(name, job_id, [tag for (job, tag) in runs])
+            submitted[name] = [job[1] for (job, tag) in runs]
+            lost[name] = functools.partial(resubmit_lost, pb, play, [job for (job, tag) in runs], report)
+
+        if len(runnable) > 0 and job_arrays:
+            submitted.update(submit_play_arrays(play, runnable, max_array_size))
+        elif len(runnable) > 0 and batch_size > 1:
+            submitted.update(submit_play_batches(play, runnable, batch_size))
+        elif len(runnable) > 0:
+            submitted.update(submit_play(play, runnable))
+        if not wait_for_results(submitted, report, lost):
+            # the runs of the plays not started yet are reported as not run
+            for next_play, next_jobs in play_jobs:
+                for (play_run, name, cmd, resources, dependencies) in next_jobs:
+                    report.add(name, next_play, play_run)
+            return False
+    return True
+
+
+def submit_play(play, jobs):
+    submitted = dict()
+    for (play_run, name, cmd, resources, dependencies) in jobs:
+        logger().debug("cmd submit: name=%s %s\n %s\n" % (name, resources, cmd))
+        executor.submit(name, cmd, resources, run_tag(play, play_run), play.retry_policy())
+        submitted[name] = [name]
+    return submitted
+
+
+def submit_play_arrays(play, jobs, max_array_size):
+    if play.run_count() == 0:
+        return submit_play(play, jobs)
+
+    runs = dict([(play_run.index(), (play_run, name)) for (play_run, name, cmd, resources, dependencies) in jobs])
+    submitted = dict()
+    for name, cmd, elements, resources in play.array_commands(max_array_size, runs.keys()):
+        indices = [element_index for element_index, run_index in elements]
+        tags = [run_tag(play, runs[run_index][0]) for element_index, run_index in elements]
+        logger().debug("cmd submit: name=%s array=[%s] %s\n %s\n" % (
+            name, executor.array_index_spec(indices), resources, cmd))
+        executor.submit_array(name, cmd, indices, resources, tags, play.retry_policy())
+        for element_index, run_index in elements:
+            submitted[executor.array_element(name, element_index)] = [runs[run_index][1]]
+    return submitted
+
+
+def submit_play_batches(play, jobs, batch_size):
+    runs = dict([(play_run.index(), (play_run, name)) for (play_run, name, cmd, resources, dependencies) in jobs])
+    submitted = dict()
+    for name, cmd, run_indices, resources, results_path in play.batch_commands(batch_size, runs.keys()):
+        tags = [run_tag(play, runs[x][0]) for x in run_indices]
+        logger().debug("cmd submit: name=%s runs=%s %s\n %s\n" % (name, run_indices, resources, cmd))
+        executor.submit_batch(name, cmd, resources, tags, play.retry_policy(), results_path)
+        if results_path is None:
+            submitted[name] = [runs[x][1] for x in run_indices]
+        else:
+            for i, run_index in enumerate(run_indices):
+                submitted[executor.batch_element(name, i)] = [runs[run_index][1]]
+    return submitted
+
 
+def run_pipelined(pb, report, resume=None):
+    resume = resume or journal.ResumeIndex()
+    tree = JobDependencyTree()
+    add_jobs(tree, report, pb.play_jobs())
 
-def wait_for_results(jobs):
-    logger().debug("waiting jobs to be finished: %s" % jobs)
-    while len(jobs) > 0:
-        name = executor.results_queue.get()
+    running = 0
+    attached = set()
+    while True:
+        running += start_ready(pb, tree, report, resume, attached)
+        if running == 0:
+            break
+
+        (name, exit_code) = executor.results_queue.get()
         if name.startswith("STOP"):
             return False
-        jobs.remove(name)
+        running -= 1
+        if exit_code is None and name in attached:
+            attached.discard(name)
+            if resubmit_lost_run(pb, tree, name):
+                running += 1
+                continue
+            exit_code = 0
+        finished(tree, report, name, exit_code)
     return True
 
 
+def run_watching(pb, report, manifest_dir, resume=None, stable_seconds=30, idle_timeout=None):
+    """
+    Runs the plays on the files arriving into their files patterns, pipelined, until stopped or,
+    with idle_timeout, until no file arrived for idle_timeout seconds and all runs are finished.
+    Every batch of new files gets its own manifest; a file goes through the plays as soon as the
+    run of the previous play on it is finished.
+
+    Only the files pattern of the first play (which later plays can share) is watched for files
+    from outside. A play with another pattern runs on files the plays before it write, which are
+    taken when they are finished rather than when they look stable: the files a finished run
+    declares in its outputs, or any new file when no run is running.
+    """
+    resume = resume or journal.ResumeIndex()
+    patterns = pb.file_patterns()
+    downstream = sorted(set([x for x in patterns if x != patterns[0]]))
+    watcher = FileWatcher([patterns[0]], stable_seconds,
+                          on_new_files=lambda: executor.results_queue.put((WATCH, 0)))
+    watcher.start()
+    logger().info("Watching for new files: %s" % patterns[0])
+
+    tree = JobDependencyTree()
+    # run indices of the journal go on across the batches
+    offsets = dict()
+    batch = 0
+    last_arrival = time.time()
+    running = 0
+    attached = set()
+    # outputs of the finished runs, and the files of the downstream patterns already taken
+    written = set()
+    taken = set()
+    try:
+        while True:
+            files = watcher.new_files()
+            files.update(written_files(downstream, taken, written, idle=running == 0))
+            if len(files) > 0:
+                logger().info("New files: %s" % sorted(set(sum(files.values(), []))))
+                batch_manifest = manifest.manifest_path(manifest_dir, batch)
+                batch_pb = pb.for_files(files, batch_manifest)
+                batch_pb.write_manifest(batch_manifest)
+                add_jobs(tree, report, batch_pb.play_jobs(), offsets)
+                batch += 1
+                last_arrival = time.time()
+
+            running += start_ready(pb, tree, report, resume, attached)
+
+            timeout = None
+            if running == 0 and idle_timeout is not None and not watcher.has_pending():
+                timeout = last_arrival + idle_timeout - time.time()
+                if timeout <= 0:
+                    logger().info("No new files for %d seconds: stop watching" % idle_timeout)
+                    break
+            try:
+                (name, exit_code) = executor.results_queue.get(timeout=timeout)
+            except Queue.Empty:
+                continue
+            if name == WATCH:
+                continue
+            if name.startswith("STOP"):
+                return False
+            running -= 1
+            if exit_code is None and name in attached:
+                attached.discard(name)
+                if resubmit_lost_run(pb, tree, name):
+                    running += 1
+                    continue
+                exit_code = 0
+            finished(tree, report, name, exit_code)
+            if exit_code == 0 and len(downstream) > 0:
+                (play, play_run) = tree.details(name)[:2]
+                written.update([os.path.normpath(x) for x in play.outputs(play_run.index())])
+    finally:
+        watcher.stop()
+    return True
+
+
+def written_files(patterns, taken, written, idle=False):
+    """
+    New files of the downstream patterns (by pattern) which the finished runs wrote: those in written
+    or, when no run is running, any file.
+    """
+    files = dict()
+    for pattern in patterns:
+        new = [x for x in file_finder.find_all(pattern) if x not in taken and (idle or os.path.normpath(x) in written)]
+        if len(new) > 0:
+            files[pattern] = new
+            taken.update(new)
+    return files
+
+
+def add_jobs(tree, report, play_jobs, offsets=None):
+    for play, jobs in play_jobs:
+        offset = offsets.get(play.index(), 0) if offsets is not None else 0
+        for (play_run, name, cmd, resources, dependencies) in jobs:
+            report.add(name, play, play_run)
+            tree.append(name, dependencies, (play, play_run, cmd, resources, run_tag(play, play_run, offset)))
+        if offsets is not None:
+            offsets[play.index()] = offset + len(jobs)
+
+
+def start_ready(pb, tree, report, resume, attached=None):
+    """
+    Submits the runs of the tree whose dependencies are finished; returns the number of runs started.
+    The names of the runs attached to their still running jobs go to attached.
+    """
+    started = 0
+    (name, details) = tree.get()
+    while name is not None:
+        (play, play_run, cmd, resources, tag) = details
+        if resume.is_done(tag):
+            logger().info("Job %s skipped: already done" % name)
+            tree.done(name, 0)
+            report.succeeded(name)
+        elif pb.is_up_to_date(play, play_run):
+            logger().info("Job %s skipped: outputs are up to date" % name)
+            tree.done(name, 0)
+            report.succeeded(name)
+        elif resume.running_job_id(tag) is not None:
+            executor.attach(name, resume.running_job_id(tag), [tag])
+            if attached is not None:
+                attached.add(name)
+            started += 1
+        else:
+            logger().debug("cmd submit: name=%s %s\n %s\n" % (name, resources, cmd))
+            executor.submit(name, cmd, resources, tag, play.retry_policy())
+            started += 1
+        (name, details) = tree.get()
+    return started
+
+
+def resubmit_lost_run(pb, tree, name):
+    """
+    Submits again the run of a re-attached job which is lost (see resubmit_lost), unless its outputs
+    are up to date; returns True if it was submitted.
+    """
+    (play, play_run, cmd, resources, tag) = tree.details(name)
+    if pb.is_up_to_date(play, play_run):
+        logger().info("Job %s was lost, but its outputs are up to date" % name)
+        return False
+    logger().info("Job %s was lost: submitting it again" % name)
+    executor.submit(name, cmd, resources, tag, play.retry_policy())
+    return True
+
+
+def finished(tree, report, name, exit_code):
+    if exit_code != 0:
+        report.failed(name, exit_code)
+    else:
+        report.succeeded(name)
+    for skipped in tree.done(name, exit_code):
+        report.skipped(skipped)
+
+
+def resubmit_lost(pb, play, jobs, report):
+    """
+    A re-attached job which finishes without an exit code is lost: the job scheduler doesn't know
+    it anymore (e.g. LSF cleaned it up while the pipeline was down), whether it succeeded or not.
+    Its runs with up to date outputs are done, the others are submitted again; returns the jobs
+    submitted.
+    """
+    runnable = []
+    for job in jobs:
+        (play_run, name) = job[:2]
+        if pb.is_up_to_date(play, play_run):
+            logger().info("Job %s was lost, but its outputs are up to date" % name)
+            report.succeeded(name)
+        else:
+            logger().info("Job %s was lost: submitting it again" % name)
+            runnable.append(job)
+    return submit_play(play, runnable)
+
+
+def wait_for_results(submitted, report, lost=None):
+    """
+    submitted maps the names the jobs were submitted with (e.g. job array elements)
+    to the names of their runs (several for a batch without results per run, which fails
+    as a whole). lost maps the names of the re-attached jobs to the function which resubmits
+    their runs if they are lost.
+    """
+    lost = lost or dict()
+    logger().debug("waiting jobs to be finished: %s" % submitted.keys())
+    while len(submitted) > 0:
+        (name, exit_code) = executor.results_queue.get()
+        if name.startswith("STOP"):
+            return False
+        run_names = submitted.pop(name)
+        if exit_code is None and name in lost:
+            submitted.update(lost.pop(name)())
+            continue
+        for run_name in run_names:
+            if exit_code != 0:
+                report.failed(run_name, exit_code)
+            else:
+                report.succeeded(run_name)
+    return True
+
+
+class RunReport(object):
+    """
+    Keeps failed and skipped (because of a failed dependency) runs to print
+    a summary per play when the pipeline is finished. Runs which are neither finished
+    nor skipped when the pipeline is interrupted are reported as not run.
+    """
+
+    def __init__(self):
+        self._runs = []
+        self._details = dict()
+        self._failed = dict()
+        self._skipped = set()
+        self._succeeded = set()
+        self._interrupted = False
+
+    def add(self, name, play, play_run):
+        self._runs.append(name)
+        self._details[name] = (play, play_run)
+
+    def failed(self, name, exit_code):
+        logger().error("Job %s failed: exit_code=%s" % (name, exit_code))
+        self._failed[name] = exit_code
+
+    def succeeded(self, name):
+        self._succeeded.add(name)
+
+    def interrupted(self):
+        logger().error("Pipeline interrupted")
+        self._interrupted = True
+
+    def skipped(self, name):
+        logger().info("Job %s skipped: one of the jobs it depends on failed" % name)
+        self._skipped.add(name)
+
+    def any_failed(self, names):
+        return any([x in self._failed or x in self._skipped for x in names])
+
+    def not_run(self):
+        """
+        Runs which were interrupted or not started at all.
+        """
+        if not self._interrupted:
+            return []
+        return [x for x in self._runs if x not in self._failed and x not in self._skipped and x not in self._succeeded]
+
+    def has_failures(self):
+        return len(self._failed) > 0 or len(self._skipped) > 0 or len(self.not_run()) > 0
+
+    def log_summary(self):
+        if not self.has_failures():
+            logger().info("Summary: all %d runs finished successfully" % len(self._runs))
+            return
+
+        not_run = self.not_run()
+        logger().error("Summary: %d runs failed, %d skipped, %d not run, %d finished successfully" % (
+            len(self._failed), len(self._skipped), len(not_run),
+            len(self._runs) - len(self._failed) - len(self._skipped) - len(not_run)))
+        for name in self._runs:
+            (play, play_run) = self._details[name]
+            run = " ".join(play_run.key()) or "(single run)"
+            if name in self._failed:
+                logger().error("  [%s] %s: FAILED (exit_code=%s)" % (play.title(), run, self._failed[name]))
+            elif name in self._skipped:
+                logger().error("  [%s] %s: skipped" % (play.title(), run))
+            elif name in not_run:
+                logger().error("  [%s] %s: not run (interrupted)" % (play.title(), run))
+
+
 def signal_handler(signum, frame):
-    logger().info("Got SIGINT(%s) signal" % str(signum))
+    logger().info("Got signal %s" % str(signum))
     executor.stop()
 
 
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler)
-    main(sys.argv[1:])
+    signal.signal(signal.SIGTERM, signal_handler)
+    sys.exit(main(sys.argv[1:]))
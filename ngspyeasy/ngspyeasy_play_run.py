@@ -16,6 +16,8 @@
 # limitations under the License.
 ###
 import argparse
+import collections
+import multiprocessing
 import shutil
 import sys
 import tempfile
@@ -23,85 +25,232 @@ import tempfile
 from ansible.module_utils import basic
 import playbook_yaml
 import os
+import batch_results
 import cmdargs
+import fact_cache
+import fastq_chunks
+import fingerprint
+import manifest
+import staging
+from var_scope import plain
 from logger import logger, init_play_run_logger
+import ansible.playbook
+from ansible.inventory import Inventory
 from ansible.playbook import PlayBook
 from ansible import callbacks
+from ansible import constants
 from ansible import utils
 import yaml
 
 
 def main(argv):
+    args = parse_args(argv)
+
+    logger().debug("Command line arguments: %s" % args)
+
+    runs = open_runs(args)
+    if args.batch is not None:
+        records = [runs.run_record(args.play_index, x) for x in args.batch]
+        if args.log_dir is not None:
+            init_play_run_logger(args.log_dir, batch_id(args.play_index, args.batch))
+        failed = run_batch(records, os.path.abspath(args.playbook_path), staged_dir=args.staged_dir,
+                           fact_cache_ttl=args.fact_cache_ttl, results_path=args.results)
+        return 0 if len(failed) == 0 else 1
+
+    record = runs.run_record(args.play_index, args.run_index)
+    if args.log_dir is not None:
+        init_play_run_logger(args.log_dir, run_id(args.play_index, record))
+
+    ok = run(record, os.path.abspath(args.playbook_path), staged_dir=args.staged_dir,
+             fact_cache_ttl=args.fact_cache_ttl)
+    return 0 if ok else 1
+
+
+def parse_args(argv):
     parser = argparse.ArgumentParser(description="NGSpeasy pipelines")
     parser.add_argument("playbook_path", metavar='/path/to/your_pipeline.yml', type=cmdargs.existed_file)
     parser.add_argument("--play_index", dest="play_index", type=int, help="play index", required=True)
     parser.add_argument("--run_index", dest="run_index", type=int, default=-1, help="run index")
+    parser.add_argument("--batch", dest="batch", type=cmdargs.int_list,
+                        help="run indices (comma separated) of the runs to run together, instead of --run_index")
+    parser.add_argument("--results", dest="results", metavar="/path/to/results.json",
+                        help="file to write the exit code of every run of the --batch to")
     parser.add_argument("--version", action="version", version="%(prog)s 3.0", help="print software version")
     parser.add_argument("--samples", metavar="/path/to/config.tsv", dest="samples_tsv",
                         type=cmdargs.existed_file, help="List of samples in TSV format")
     parser.add_argument("--vars", dest="var_files", metavar="/path/to/your/vars.yml", help="additional variables",
                         type=cmdargs.existed_file, action="append")
     parser.add_argument("--log_dir", dest="log_dir", type=cmdargs.existed_directory)
-
-    args = parser.parse_args(argv)
-
-    play_index = args.play_index
-    run_index = args.run_index
+    parser.add_argument("--manifest", dest="manifest", type=cmdargs.existed_file,
+                        help="playbook compiled by the pipeline runner")
+    parser.add_argument("--staged_dir", dest="staged_dir", type=cmdargs.existed_directory,
+                        help="roles and library staged by the pipeline runner")
+    parser.add_argument("--fact_cache_ttl", dest="fact_cache_ttl", type=int, default=0,
+                        help="reuse the facts gathered on this node for this many seconds (0: gather every time)")
+    return parser.parse_args(argv)
+
+
+def open_runs(args):
+    """
+    Where the run records come from: the manifest compiled by the pipeline runner or, without it,
+    the playbook parsed again.
+    """
+    if args.manifest is not None:
+        return manifest.Manifest(os.path.abspath(args.manifest))
+    return parse_playbook(args)
+
+
+def parse_playbook(args):
     playbook_path = os.path.abspath(args.playbook_path)
     samples_tsv = os.path.abspath(args.samples_tsv) if args.samples_tsv else None
     var_files = [os.path.abspath(f) for f in args.var_files]
 
-    logger().debug("Command line arguments: %s" % args)
     logger().debug("TSV config path: %s" % samples_tsv)
+    return playbook_yaml.parse(playbook_path, samples_tsv, var_files, args.log_dir)
 
-    pb = playbook_yaml.parse(playbook_path, samples_tsv, var_files, args.log_dir)
-    (play_run_vars, play_run_yaml, play_run_name) = pb.play_run(play_index, run_index)
 
-    if args.log_dir is not None:
-        init_play_run_logger(args.log_dir, str(play_index) + "_" + play_run_name)
+def run_id(play_index, record):
+    return str(play_index) + "_" + record.name()
 
-    task = play_run_yaml
-    task["hosts"] = "all"
 
-    temp_dir = tempfile.mkdtemp()
-    print temp_dir
-    try:
-        roles_dir = os.path.join(os.path.dirname(playbook_path), "roles")
-        if os.path.exists(roles_dir):
-            shutil.copytree(roles_dir, os.path.join(temp_dir, "roles"))
+def batch_id(play_index, run_indices):
+    return "%d_batch_%d" % (play_index, run_indices[0])
 
-        library_dir = os.path.join(os.path.dirname(playbook_path), "library")
-        if os.path.exists(library_dir):
-            shutil.copytree(library_dir, os.path.join(temp_dir, "library"))
 
-        playbook = os.path.join(temp_dir, "playbook.yml")
-        with open(playbook, 'w') as outfile:
-            outfile.write(yaml.dump([task], default_flow_style=False))
+def run(record, playbook_path, fingerprinter=None, staged_dir=None, fact_cache_ttl=0):
+    """
+    Runs one play run (a manifest.RunRecord) with the roles and library in staged_dir (see
+    staging.stage) or, without it, the ones next to the playbook; returns True if it succeeded.
+    """
+    source_dir = staged_dir or os.path.dirname(playbook_path)
+    if fingerprinter is None:
+        fingerprinter = fingerprint.Fingerprinter(source_dir)
+    # the inputs are fingerprinted before the run, so a change made while it runs is noticed next time
+    (digest, outputs) = record.fingerprint(fingerprinter)
 
-        run_playbook(temp_dir, play_run_vars)
+    if record.step() is not None:
+        ok = fastq_chunks.run_step(record.step())
+    else:
+        ok = run_play(record, source_dir, fact_cache_ttl)
+
+    if ok and digest is not None:
+        fingerprint.store(digest, outputs)
+    return ok
+
+
+def run_play(record, source_dir, fact_cache_ttl=0):
+    # only the playbook and the inventory are written per run
+    temp_dir = tempfile.mkdtemp()
+    try:
+        write_playbook(record, source_dir, temp_dir)
+        ok = True
+        for variables in record.all_vars():
+            # the items of a split run must not see the facts of the previous ones
+            reset_ansible()
+            ok = all(run_playbook(temp_dir, plain(variables), fact_cache_ttl=fact_cache_ttl).values())
+            if not ok:
+                break
+    finally:
+        shutil.rmtree(temp_dir)
+    return ok
+
+
+def run_batch(records, playbook_path, fingerprinter=None, staged_dir=None, fact_cache_ttl=0, results_path=None):
+    """
+    Runs several runs of the same play (manifest.RunRecords) with one Ansible invocation: every
+    run is a local pseudo-host, named by the run, with its context (curr_sample, curr_file...) as
+    host variables, and the hosts are run in parallel, one fork each. Runs of split plays and
+    steps, and runs with the same name, are run one by one. Returns the records of the runs which
+    failed; with a results_path, the exit code of every run is written there too (see batch_results).
+    """
+    if results_path is not None:
+        # the results of a previous attempt
+        batch_results.remove(results_path)
+    failed = _run_batch(records, playbook_path, fingerprinter, staged_dir, fact_cache_ttl)
+    if results_path is not None:
+        batch_results.write(results_path, [1 if x in failed else 0 for x in records])
+    return failed
+
+
+def _run_batch(records, playbook_path, fingerprinter=None, staged_dir=None, fact_cache_ttl=0):
+    source_dir = staged_dir or os.path.dirname(playbook_path)
+    if fingerprinter is None:
+        fingerprinter = fingerprint.Fingerprinter(source_dir)
+    # a host per run: runs with the same name would share one
+    if any([x.step() is not None or len(x.all_vars()) > 1 for x in records]) or \
+            len(set([x.name() for x in records])) < len(records):
+        return [x for x in records if not run(x, playbook_path, fingerprinter, staged_dir, fact_cache_ttl)]
+
+    fingerprints = [x.fingerprint(fingerprinter) for x in records]
+    temp_dir = tempfile.mkdtemp()
+    try:
+        write_playbook(records[0], source_dir, temp_dir)
+        reset_ansible()
+        host_vars = [(x.name(), plain(x.context())) for x in records]
+        results = run_playbook(temp_dir, plain(records[0].shared_vars()), collections.OrderedDict(host_vars),
+                               fact_cache_ttl)
     finally:
         shutil.rmtree(temp_dir)
 
+    failed = []
+    for (record, (digest, outputs)) in zip(records, fingerprints):
+        if not results[record.name()]:
+            failed.append(record)
+        elif digest is not None:
+            fingerprint.store(digest, outputs)
+    return failed
+
+
+def write_playbook(record, source_dir, dir):
+    task = record.yaml()
+    task["hosts"] = "all"
+    staging.link(source_dir, dir)
+    with open(os.path.join(dir, "playbook.yml"), 'w') as outfile:
+        outfile.write(yaml.safe_dump([task], default_flow_style=False))
+
+
+def reset_ansible():
+    # facts and registered variables are cached per host, and every run uses the same localhost
+    ansible.playbook.SETUP_CACHE.flush()
+    ansible.playbook.VARS_CACHE.clear()
 
-def run_playbook(dir, extra_vars):
+
+def run_playbook(dir, extra_vars, host_vars=None, fact_cache_ttl=0):
+    """
+    Runs the playbook in dir on localhost or, with host_vars ({host: variables}), on a local
+    pseudo-host per entry, in parallel; returns {host: True if the play succeeded on it}.
+    With a fact_cache_ttl, the facts gathered on this node are reused for that many seconds
+    (see fact_cache), unless the play sets gather_facts.
+    """
     utils.VERBOSITY = 0
     playbook_cb = MyPlaybookCallbacks(verbose=utils.VERBOSITY)
     stats = callbacks.AggregateStats()
     runner_cb = MyPlaybookRunnerCallbacks(stats, verbose=utils.VERBOSITY)
 
-    inventory = """
-[localhost]
-localhost ansible_connection=local
-"""
-
-    # Create a temporary file and write the template string to it
-    hosts = tempfile.NamedTemporaryFile(delete=False, dir=dir)
-    hosts.write(inventory)
-    hosts.close()
-
-    pb = PlayBook(
+    if host_vars is None:
+        host_vars = {"localhost": dict()}
+    inventory = Inventory(host_vars.keys())
+    for name, variables in host_vars.items():
+        host = inventory.get_host(name)
+        host.set_variable("ansible_connection", "local")
+        for key, value in variables.items():
+            host.set_variable(key, value)
+
+    facts = None
+    if fact_cache_ttl > 0:
+        facts = fact_cache.load(fact_cache_ttl)
+        # smart gathering skips the hosts which already have facts: the cached ones
+        constants.DEFAULT_GATHERING = "smart"
+    if facts is not None:
+        for name in host_vars:
+            utils.update_hash(ansible.playbook.SETUP_CACHE, name, dict(facts, module_setup=True))
+
+    # a worker of the pool is a daemon process, which can't start the processes of Ansible forks
+    forks = 1 if multiprocessing.current_process().daemon else len(host_vars)
+    pb = FactGatheringPlayBook(
         playbook=os.path.join(dir, "playbook.yml"),
-        host_list=hosts.name,
+        inventory=inventory,
+        forks=forks,
         callbacks=playbook_cb,
         runner_callbacks=runner_cb,
         extra_vars=extra_vars,
@@ -109,17 +258,42 @@ localhost ansible_connection=local
     )
 
     results = pb.run()
+    if fact_cache_ttl > 0 and pb.facts is not None:
+        fact_cache.store(pb.facts)
 
     # Ensure on_stats callback is called
     # for callback modules
     playbook_cb.on_stats(pb.stats)
     logger().info(results)
+    # a host without results had nothing to run
+    return dict([(x, _succeeded(results.get(x, None))) for x in host_vars])
+
+
+def _succeeded(host_results):
+    return host_results is None or (host_results["failures"] == 0 and host_results["unreachable"] == 0)
 
 
 def file_logger():
     return logger(file_only=True)
 
 
+class FactGatheringPlayBook(PlayBook):
+    """
+    Keeps the facts gathered by the setup step of the plays (all hosts are this node).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FactGatheringPlayBook, self).__init__(*args, **kwargs)
+        self.facts = None
+
+    def _do_setup_step(self, play):
+        results = super(FactGatheringPlayBook, self)._do_setup_step(play)
+        for result in results.get("contacted", dict()).values():
+            if "ansible_facts" in result:
+                self.facts = result["ansible_facts"]
+        return results
+
+
 class MyPlaybookCallbacks(callbacks.PlaybookCallbacks):
     def __init__(self, verbose=False):
         super(MyPlaybookCallbacks, self).__init__(verbose)
@@ -195,6 +369,9 @@ class MyPlaybookRunnerCallbacks(callbacks.PlaybookRunnerCallbacks):
 
         results2 = results.copy()
         results2.pop('invocation', None)
+        # stdout_lines repeats the tail of the output in stdout, the whole output is in the log file (dockercmd)
+        if 'log_file' in results2:
+            results2.pop('stdout_lines', None)
 
         item = results2.get('item', None)
         parsed = results2.get('parsed', True)
@@ -249,6 +426,8 @@ class MyPlaybookRunnerCallbacks(callbacks.PlaybookRunnerCallbacks):
 
         if msg != '':
             file_logger().info(msg)
+        if 'log_file' in host_result2:
+            file_logger().info("output: %s" % host_result2['log_file'])
         if 'warnings' in host_result2 and host_result2['warnings']:
             for warning in host_result2['warnings']:
                 file_logger().warn("warning: %s" % warning)
@@ -288,4 +467,4 @@ class MyPlaybookRunnerCallbacks(callbacks.PlaybookRunnerCallbacks):
 
 
 if __name__ == '__main__':
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
@@ -1,110 +1,584 @@
-import copy
-import glob
+import collections
 
 import os
+import batch_results
 import job_id_generator
-import jinja2
+import utils
+import templates
+import fingerprint
+import fastq_chunks
+import file_finder
+import genome_build
+import manifest
 from logger import logger
 import yaml
 import tsv_config
+from resources import Resources, largest
+from retry import RetryPolicy
+
+# play keys handled by ngspyeasy itself; they are removed before the play is given to Ansible
+PLAY_KEYS = ["samples", "files", "split", "split_size", "intervals", "chunks", "step", "resources", "fan_in", "inputs",
+             "outputs", "fingerprint", "retry"]
 
 
 class PlayBookYaml(object):
-    def __init__(self, cmd, plays, samples, variables):
+    def __init__(self, cmd, plays, samples, variables, fingerprinter=None):
         self._cmd = cmd
         self._plays = plays
         self._samples = samples
         self._vars = variables
+        self._fingerprinter = fingerprinter
+        # a playbook for a batch of files (see for_files)
+        self._batch = False
+        # matched files by pattern: a play is created several times, the directories are listed once
+        self._files = dict()
+        # intervals of the references, by reference, interval size and contigs
+        self._intervals = dict()
 
     def plays(self):
         for index, play in enumerate(self._plays, start=0):
             yield self._create_play(index, play)
 
-    def play_run(self, play_index, run_index):
-        yaml_obj = self._plays[play_index]
-        play = self._create_play(play_index, yaml_obj)
-        play_run = play.play_run(run_index)
-        return play_run.vars(self._vars), play_run.yaml(yaml_obj), play_run.name()
+    def play(self, play_index):
+        return self._create_play(play_index, self._plays[play_index])
+
+    def play_jobs(self):
+        """
+        Expands the whole playbook into a graph of runs: yields (play, jobs) for every play, where
+        jobs is a list of (play_run, name, cmd, resources, dependencies) tuples and a run depends
+        on the runs of the previous play with a matching run key (see RunIndex). In a playbook for
+        a batch of files the plays without files in the batch are left out.
+        """
+        prev_jobs = None
+        for play in self.plays():
+            if self._batch and play.file_count() == 0:
+                continue
+            jobs = []
+            index = RunIndex(prev_jobs) if prev_jobs is not None else None
+            for (play_run, name, cmd, resources) in play.jobs():
+                dependencies = index.dependencies(play_run.keys(), play.is_fan_in()) if index is not None else []
+                jobs.append((play_run, name, cmd, resources, dependencies))
+            yield play, jobs
+            prev_jobs = jobs
+
+    def jobs(self):
+        for play, jobs in self.play_jobs():
+            for (play_run, name, cmd, resources, dependencies) in jobs:
+                yield name, cmd, resources, dependencies
+
+    def run_record(self, play_index, run_index):
+        play = self.play(play_index)
+        return self._run_record(play, play.play_run(run_index))
+
+    def _run_record(self, play, play_run, play_yaml=None):
+        if play_yaml is None:
+            play_yaml = play_run.yaml(self._plays[play.index()])
+        return manifest.RunRecord(play_run.name(), self._vars, play_run.contexts(), play_yaml,
+                                  inputs=play.inputs(play_run.index()), outputs=play.outputs(play_run.index()),
+                                  hash_inputs=play.hashes_inputs(), step=play.step(play_run.index()))
+
+    def write_manifest(self, path):
+        """
+        Compiles the playbook into a manifest (see manifest.write), so a run doesn't need to parse
+        the playbook, the samples and the variables again; file patterns are resolved only once.
+        """
+        plays = []
+        for play in self.plays():
+            play_yaml = strip_play_keys(self._plays[play.index()])
+            run_indices = range(play.run_count()) if play.run_count() > 0 else [-1]
+            records = [self._run_record(play, play.play_run(i), play_yaml) for i in run_indices]
+            plays.append((play_yaml, play.hashes_inputs(), records))
+        manifest.write(path, self._vars, plays)
+
+    def fingerprint(self, play, play_run):
+        """
+        Returns (digest, outputs) for a run of a play which declares its outputs, (None, None) otherwise.
+        """
+        return self._run_record(play, play_run).fingerprint(self._fingerprinter)
+
+    def is_up_to_date(self, play, play_run):
+        (digest, outputs) = self.fingerprint(play, play_run)
+        return digest is not None and fingerprint.is_up_to_date(digest, outputs)
+
+    def file_patterns(self):
+        """
+        The files pattern of every play, None for a play without files.
+        """
+        return [templates.render(x["files"], self._vars) if "files" in x else None for x in self._plays]
+
+    def for_files(self, files, manifest_path):
+        """
+        The same playbook, but the plays run only on the given files (by pattern) instead of all
+        files matching their patterns, e.g. the files which arrived in watch mode; the runs read
+        the manifest at manifest_path.
+        """
+        pb = PlayBookYaml(self._cmd.with_manifest(manifest_path), self._plays, self._samples, self._vars,
+                          self._fingerprinter)
+        pb._batch = True
+        for pattern in self.file_patterns():
+            if pattern is not None:
+                pb._files[pattern] = files.get(pattern, [])
+        return pb
 
     def _create_play(self, index, yaml_obj):
-        files = self._files2run(yaml_obj, self._vars)
+        (files, files_root) = self._files2run(yaml_obj, self._vars)
         samples = self._samples2run(yaml_obj, self._vars)
-        return PlayYaml(index, files, samples, self._cmd)
-
-    @staticmethod
-    def _samples2run(yaml_obj, variables):
-        tmpl = yaml_obj.get("samples", None)
+        split = self._split2run(yaml_obj, self._vars)
+        step = yaml_obj.get("step", None)
+        return PlayYaml(index, files, samples, self._cmd, yaml_obj.get("resources", None), self._vars,
+                        fan_in=yaml_obj.get("fan_in", False), title=yaml_obj.get("name", None),
+                        inputs=yaml_obj.get("inputs", None), outputs=yaml_obj.get("outputs", None),
+                        hash_inputs=yaml_obj.get("fingerprint", None) == "content",
+                        retry=RetryPolicy.parse(yaml_obj.get("retry", None)),
+                        split=split, split_size=int(yaml_obj.get("split_size", 1)),
+                        intervals=self._intervals2run(yaml_obj, self._vars),
+                        chunks=yaml_obj.get("chunks", None) if step is None else None,
+                        step=(step, yaml_obj["chunks"]) if step is not None else None, files_root=files_root)
+
+    def _samples2run(self, yaml_obj, variables):
+        return self._list2run(yaml_obj.get("samples", None), variables)
+
+    def _split2run(self, yaml_obj, variables):
+        if "split" not in yaml_obj:
+            return None
+        return self._list2run(yaml_obj["split"], variables)
+
+    def _intervals2run(self, yaml_obj, variables):
+        spec = yaml_obj.get("intervals", None)
+        if spec is None:
+            return None
+        if not isinstance(spec, dict):
+            return [genome_build.parse_interval(x) for x in self._list2run(spec, variables)]
+        # intervals of the given size over the contigs of a reference (see genome_build.read_contigs)
+        reference = templates.render(spec["reference"], variables)
+        size = int(templates.render(str(spec["size"]), variables)) if "size" in spec else None
+        contigs = spec.get("contigs", None)
+        key = (reference, size, tuple(contigs) if contigs is not None else None)
+        if key not in self._intervals:
+            gb = genome_build.GenomeBuild(os.path.dirname(reference), REFFASTA=os.path.basename(reference))
+            self._intervals[key] = gb.intervals(size, contigs)
+        return self._intervals[key]
+
+    def _list2run(self, tmpl, variables):
         if tmpl is None:
             return []
-        samples_str = jinja2.Template(tmpl).render(variables)
-        return eval(samples_str)
-
-    @staticmethod
-    def _files2run(yaml_obj, variables):
+        if isinstance(tmpl, dict):
+            # column values to select the samples by, e.g. {aligner: bwa}
+            conditions = dict([(k, templates.render(v, variables) if isinstance(v, basestring) else v)
+                               for k, v in tmpl.items()])
+            return tsv_config.select(self._samples, conditions)
+        if not isinstance(tmpl, basestring):
+            return tmpl
+        return templates.evaluate(tmpl, variables)
+
+    def _files2run(self, yaml_obj, variables):
+        # the files matching the pattern and the directory they are found under
         tmpl = yaml_obj.get("files", None)
         if tmpl is None:
-            return []
-        pattern = jinja2.Template(tmpl).render(variables)
-        return sorted(glob.glob(pattern))
+            return [], None
+        pattern = templates.render(tmpl, variables)
+        if pattern not in self._files:
+            self._files[pattern] = file_finder.find_all(pattern)
+        return self._files[pattern], file_finder.root(pattern)
 
 
 class PlayYaml(object):
-    def __init__(self, index, files, samples, cmd):
+    def __init__(self, index, files, samples, cmd, resources=None, variables=None, fan_in=False, title=None,
+                 inputs=None, outputs=None, hash_inputs=False, retry=None, split=None, split_size=1, intervals=None,
+                 chunks=None, step=None, files_root=None):
         self._index = index
+        self._title = title
         self._cmd = cmd
         self._files = files
+        # the files are told apart by their paths relative to it (see PlayRun.key())
+        self._files_root = files_root
         self._samples = samples
+        self._resources = resources
+        self._vars = variables or dict()
+        self._fan_in = fan_in
+        self._inputs = inputs
+        self._outputs = outputs
+        self._hash_inputs = hash_inputs
+        self._retry = retry
+        # items to split the play over, split_size items per run; None if the play isn't split
+        self._split = split
+        self._split_size = max(split_size, 1)
+        self._intervals = intervals
+        # chunks spec of a play run on FASTQ chunks (see expand_chunks)
+        self._chunks = chunks
+        # (step, chunks spec) of a play which splits the FASTQ files into chunks or merges them
+        self._step = step
+
+    def index(self):
+        return self._index
 
     def name(self):
         return "play_%s" % str(self._index)
 
-    def commands(self):
-        if len(self._samples) > 0 or len(self._files) > 0:
-            for i in range(max(len(self._samples), len(self._files))):
-                yield self._cmd.compose(self._index, i)
-        else:
-            yield self._cmd.compose(self._index, -1)
+    def title(self):
+        return self._title if self._title else self.name()
+
+    def is_fan_in(self):
+        return self._fan_in or self.run_count() == 0
+
+    def retry_policy(self):
+        return self._retry
+
+    def jobs(self):
+        """
+        Yields (play_run, name, cmd, resources) for every run of the play; resources is None
+        if the play doesn't declare any.
+        """
+        run_indices = range(self.run_count()) if self.run_count() > 0 else [-1]
+        for i in run_indices:
+            (name, cmd) = self._cmd.compose(self._index, i)
+            yield self.play_run(i), name, cmd, self.resources(i)
+
+    def resources(self, run_index):
+        if self._resources is None:
+            return None
+        contexts = self.play_run(run_index).contexts()
+        if len(contexts) == 1:
+            return self._render_resources(contexts[0])
+        # the items of a split run are run one after another
+        return largest([self._render_resources(x) for x in contexts])
+
+    def _render_resources(self, context):
+        rendered = dict()
+        for key, value in self._resources.items():
+            if isinstance(value, basestring):
+                value = templates.render(value, self._vars, **context)
+            rendered[key] = value
+        return Resources.parse(rendered)
+
+    def inputs(self, run_index):
+        """
+        Input files of a run; patterns are kept as they are and expanded when the run is fingerprinted,
+        as an upstream play may not have written their files yet.
+        """
+        if self._step is not None:
+            return self.step(run_index)["inputs"]
+        return self._render_paths(self._inputs, run_index)
+
+    def outputs(self, run_index):
+        if self._step is not None:
+            return self.step(run_index)["outputs"]
+        return self._render_paths(self._outputs, run_index)
+
+    def step(self, run_index):
+        """
+        What a run of a split/merge step play does (see fastq_chunks.run_step); None for other plays.
+        """
+        if self._step is None:
+            return None
+        (step, spec) = self._step
+        context = self.play_run(run_index).context()
+        chunks = [self._chunk(spec, i, context) for i in range(self._chunk_count(spec))]
+        if step == fastq_chunks.SPLIT_FASTQ:
+            keys = [x for x in ["fastq1", "fastq2"] if spec.get(x, None)]
+            chunk_files = [[x[key] for x in chunks] for key in keys]
+            return {"step": step, "inputs": [templates.render(spec[x], self._vars, **context) for x in keys],
+                    "outputs": sum(chunk_files, []), "chunks": chunk_files}
+        merge = spec["merge"]
+        return {"step": step,
+                "inputs": [templates.render(merge["bam"], self._vars, **dict(context, curr_chunk=x)) for x in chunks],
+                "outputs": [templates.render(merge["output"], self._vars, **context)],
+                "command": merge.get("command", None)}
+
+    def _chunk_count(self, spec):
+        return int(templates.render(str(spec["count"]), self._vars))
+
+    def _chunk(self, spec, index, context):
+        out_dir = templates.render(spec["dir"], self._vars, **context)
+        chunk = {"index": index, "count": self._chunk_count(spec)}
+        for key in ["fastq1", "fastq2"]:
+            if spec.get(key, None):
+                fastq = templates.render(spec[key], self._vars, **context)
+                chunk[key] = fastq_chunks.chunk_path(fastq, out_dir, index)
+        return chunk
+
+    def hashes_inputs(self):
+        return self._hash_inputs
+
+    def _render_paths(self, paths, run_index):
+        if paths is None:
+            return []
+        if isinstance(paths, basestring):
+            paths = [paths]
+        rendered = []
+        for context in self.play_run(run_index).contexts():
+            rendered.extend([templates.render(x, self._vars, **context) for x in paths])
+        return utils.uniq_set(rendered)
+
+    def array_commands(self, max_array_size, run_indices=None):
+        """
+        Same runs as jobs() (or only the given run_indices), but grouped into job arrays
+        with element indices not bigger than max_array_size: yields (name, cmd, elements, resources)
+        tuples, where elements is a list of (element_index, run_index) pairs, or None for a play
+        with a single run. All elements of an array request the resources of the largest one.
+        """
+        if self.run_count() == 0:
+            (name, cmd) = self._cmd.compose(self._index, -1)
+            yield name, cmd, None, self.resources(-1)
+            return
+        if run_indices is None:
+            run_indices = range(self.run_count())
+        chunk = []
+        for run_index in sorted(run_indices):
+            if len(chunk) > 0 and run_index - chunk[0] >= max_array_size:
+                yield self._array_command(chunk)
+                chunk = []
+            chunk.append(run_index)
+        if len(chunk) > 0:
+            yield self._array_command(chunk)
+
+    def _array_command(self, run_indices):
+        first = run_indices[0]
+        (name, cmd) = self._cmd.compose_array(self._index, first)
+        resources = None
+        if self._resources is not None:
+            resources = largest([self.resources(i) for i in run_indices])
+        return name, cmd, [(i - first + 1, i) for i in run_indices], resources
+
+    def batch_commands(self, batch_size, run_indices=None):
+        """
+        Same runs as jobs() (or only the given run_indices), but batch_size runs of the play
+        per command, run in parallel by one Ansible invocation: yields (name, cmd, run_indices,
+        resources, results_path) tuples, where a batch requests the resources of all its runs
+        together and writes the exit code of every run to results_path (see batch_results; None
+        for a single run, or without a manifest). The runs of split plays and of the FASTQ chunking
+        steps are not batched.
+        """
+        if self.run_count() == 0 or self._split or self._step is not None:
+            batch_size = 1
+        if run_indices is None:
+            run_indices = range(self.run_count()) if self.run_count() > 0 else [-1]
+        run_indices = sorted(run_indices)
+        for i in range(0, len(run_indices), batch_size):
+            batch = run_indices[i:i + batch_size]
+            if len(batch) == 1:
+                (name, cmd) = self._cmd.compose(self._index, batch[0])
+                yield name, cmd, batch, self.resources(batch[0]), None
+                continue
+            (name, cmd, results_path) = self._cmd.compose_batch(self._index, batch)
+            yield name, cmd, batch, sum([self.resources(x) or Resources() for x in batch], Resources(cpu=0)), \
+                results_path
+
+    def file_count(self):
+        return len(self._files)
+
+    def run_count(self):
+        split_runs = (len(self._split) + self._split_size - 1) // self._split_size if self._split else 0
+        count = max(len(self._samples), len(self._files), split_runs)
+        if self._intervals or self._chunks:
+            # every sample (file, split run) is scattered over the intervals and/or the chunks
+            return max(count, 1) * max(len(self._intervals or []), 1) * self._scatter_chunks()
+        return count
+
+    def _scatter_chunks(self):
+        return self._chunk_count(self._chunks) if self._chunks else 1
 
     def play_run(self, run_index):
-        file = self._files[run_index] if len(self._files) > 0  else None
-        sample = self._samples[run_index] if len(self._samples) > 0 else None
-        return PlayRun(file=file, sample=sample, index=run_index)
+        base_index = run_index
+        chunk_index = None
+        interval = None
+        if self._chunks and run_index >= 0:
+            (base_index, chunk_index) = divmod(base_index, self._scatter_chunks())
+        if self._intervals and run_index >= 0:
+            (base_index, interval_index) = divmod(base_index, len(self._intervals))
+            interval = self._intervals[interval_index]
+        file = self._files[base_index] if len(self._files) > 0 and base_index >= 0 else None
+        sample = self._samples[base_index] if len(self._samples) > 0 and base_index >= 0 else None
+        split = None
+        if self._split and base_index >= 0:
+            split = self._split[base_index * self._split_size:(base_index + 1) * self._split_size]
+        chunk = None
+        if chunk_index is not None:
+            context = PlayRun(file=file, sample=sample, index=base_index, split=split).context()
+            chunk = self._chunk(self._chunks, chunk_index, context)
+        return PlayRun(file=file, sample=sample, index=run_index, split=split, interval=interval, chunk=chunk,
+                       files_root=self._files_root)
 
 
 class PlayRun(object):
-    def __init__(self, file, sample, index):
+    def __init__(self, file, sample, index, split=None, interval=None, chunk=None, files_root=None):
         self._file = file
+        # directory of the files pattern (see file_finder.root)
+        self._files_root = files_root
         self._sample = sample
         self._index = index
-
-    def vars(self, variables):
-        v = copy.deepcopy(variables)
+        # items of a split play the run goes through, one after another
+        self._split = split
+        # genome_build.interval of a play scattered over intervals
+        self._interval = interval
+        # FASTQ chunk of a play run on chunks
+        self._chunk = chunk
+
+    def context(self):
+        c = dict()
         if self._sample:
-            v["curr_sample"] = self._sample
+            c["curr_sample"] = self._sample
         if self._file:
-            v["curr_file"] = self._file
-        return v
+            c["curr_file"] = self._file
+        if self._split:
+            c["curr_split"] = self._split[0]
+        if self._interval:
+            c["curr_interval"] = self._interval
+        if self._chunk:
+            c["curr_chunk"] = self._chunk
+        return c
+
+    def contexts(self):
+        """
+        The context of every item of a split run (the play is run once per item, with the item
+        as curr_split); a single context for other runs.
+        """
+        if not self._split:
+            return [self.context()]
+        return [dict(self.context(), curr_split=x) for x in self._split]
 
     def yaml(self, yaml_obj):
-        y = copy.deepcopy(yaml_obj)
-        y.pop("samples", None)
-        y.pop("files", None)
-        return y
+        return strip_play_keys(yaml_obj)
+
+    def index(self):
+        return self._index
 
     def name(self):
+        if self._chunk:
+            return "chunk_" + str(self._index)
+        if self._interval:
+            return "interval_" + str(self._index)
+        if self._split:
+            return "split_" + str(self._index)
         if self._sample:
             return "sample_" + str(self._index)
         if self._file:
-            return os.path.basename(self._file)
+            return self._file_key().replace(os.sep, "_")
         return "None"
 
+    def key(self):
+        """
+        Identity of the run across plays: runs of different plays with the same key
+        work on the same sample (or file); a run of a play without samples/files has
+        the empty key. A run on an interval (chunk) has the region (chunk id) appended to its
+        key, so a run of the sample in the next play (the gather) waits for all its intervals.
+        """
+        return self._base_key() + self._scatter_key()
+
+    def keys(self):
+        """
+        The keys the run is matched with the runs of the neighbour plays by: one per item of a split run.
+        """
+        if self._split:
+            return [_item_key(x, self._index) + self._scatter_key() for x in self._split]
+        return [self.key()]
+
+    def _scatter_key(self):
+        key = (self._interval["region"],) if self._interval else ()
+        if self._chunk:
+            key += ("chunk_%03d" % self._chunk["index"],)
+        return key
+
+    def _base_key(self):
+        if self._split:
+            return ("+".join([x[0] for x in self.keys()]),)
+        if self._sample:
+            return _item_key(self._sample, self._index)
+        if self._file:
+            return (self._file_key(),)
+        return ()
+
+    def _file_key(self):
+        # the path under the root of the pattern, as files with the same name in different directories
+        # (e.g. L1/R1.fq and L2/R1.fq with a ** pattern) are different runs
+        if self._files_root is None:
+            return os.path.basename(self._file)
+        return os.path.relpath(os.path.normpath(self._file), self._files_root)
+
+
+def _item_key(item, index):
+    if isinstance(item, collections.Mapping):
+        return (item.get("sample_id", str(index)),)
+    return (str(item),)
+
+
+class RunIndex(object):
+    """
+    Index of the runs of one play by their keys. A run of the next play depends on the
+    runs whose key is compatible with its own one, i.e. one key is a prefix of the other.
+    The empty key is a prefix of any key, so a single-run play both waits for and is
+    waited by all runs of its neighbours.
+    """
+
+    def __init__(self, jobs):
+        self._all = []
+        self._by_key = dict()
+        self._by_prefix = dict()
+        for job in jobs:
+            (play_run, name) = job[:2]
+            self._all.append(name)
+            for key in play_run.keys():
+                self._by_key.setdefault(key, []).append(name)
+                for i in range(len(key) + 1):
+                    self._by_prefix.setdefault(key[:i], []).append(name)
+
+    def dependencies(self, keys, fan_in=False):
+        """
+        The runs a run with the given keys (see PlayRun.keys()) depends on.
+        """
+        if fan_in:
+            return list(self._all)
+        deps = []
+        for key in keys:
+            deps.extend(self._by_prefix.get(key, []))
+            for i in range(len(key)):
+                deps.extend(self._by_key.get(key[:i], []))
+        # nothing matches (e.g. samples after files): fall back to waiting for the whole play
+        return utils.uniq_set(deps) if len(deps) > 0 else list(self._all)
+
+
+def expand_chunks(plays):
+    """
+    A play with chunks ({fastq1, fastq2, count, dir, merge}) becomes up to three plays: a step
+    splitting the FASTQ files of every sample into count chunks in dir, the play itself, run on
+    every chunk with curr_chunk, and, with merge ({bam, output, command}), a step merging the
+    BAM files of the chunks of a sample into one.
+    """
+    expanded = []
+    for play in plays:
+        if "chunks" not in play:
+            expanded.append(play)
+            continue
+        runs_on = dict([(k, v) for k, v in play.items() if k in ["samples", "files", "split", "split_size"]])
+        title = play.get("name", "play_%d" % len(expanded))
+        expanded.append(dict(runs_on, name="%s: split FASTQ files into chunks" % title,
+                             step=fastq_chunks.SPLIT_FASTQ, chunks=play["chunks"]))
+        expanded.append(play)
+        if "merge" in play["chunks"]:
+            expanded.append(dict(runs_on, name="%s: merge the chunks" % title,
+                                 step=fastq_chunks.MERGE_BAM, chunks=play["chunks"]))
+    return expanded
+
+
+def strip_play_keys(yaml_obj):
+    # a shallow copy: nested values are shared with the playbook yaml and must not be modified
+    return dict([(k, v) for k, v in yaml_obj.items() if k not in PLAY_KEYS])
+
 
 class JobCommand(object):
-    def __init__(self, playbook_path, tsv_path, var_files, log_dir):
+    def __init__(self, playbook_path, tsv_path, var_files, log_dir, manifest_path=None, staged_dir=None,
+                 fact_cache_ttl=0):
         self._playbook_path = playbook_path
         self._tsv_path = tsv_path
         self._var_files = var_files
         self._log_dir = log_dir
+        self._manifest_path = manifest_path
+        self._staged_dir = staged_dir
+        self._fact_cache_ttl = fact_cache_ttl
+
+    def with_manifest(self, manifest_path):
+        return JobCommand(self._playbook_path, self._tsv_path, self._var_files, self._log_dir, manifest_path,
+                          self._staged_dir, self._fact_cache_ttl)
 
     @staticmethod
     def _next_id(play_index, run_index):
@@ -118,6 +592,12 @@ class JobCommand(object):
             options.append("--samples %s" % self._tsv_path)
         for var_file in self._var_files:
             options.append("--vars %s" % var_file)
+        if self._manifest_path is not None:
+            options.append("--manifest %s" % self._manifest_path)
+        if self._staged_dir is not None:
+            options.append("--staged_dir %s" % self._staged_dir)
+        if self._fact_cache_ttl > 0:
+            options.append("--fact_cache_ttl %d" % self._fact_cache_ttl)
         return options
 
     def compose(self, play_index, run_index):
@@ -130,35 +610,62 @@ class JobCommand(object):
         cmd += self._options()
         return self._next_id(play_index, run_index), " ".join(cmd)
 
+    def compose_array(self, play_index, first_run_index):
+        # array element indices start from 1; the expression is expanded by the shell of each element
+        executable = "ngspyeasy_play_run"
+        cmd = [executable,
+               self._playbook_path,
+               "--play_index", str(play_index),
+               "--run_index", "$((LSB_JOBINDEX+%d))" % (first_run_index - 1)]
+        cmd += self._options()
+        return self._next_id(play_index, first_run_index), " ".join(cmd)
+
+    def compose_batch(self, play_index, run_indices):
+        executable = "ngspyeasy_play_run"
+        cmd = [executable,
+               self._playbook_path,
+               "--play_index", str(play_index),
+               "--batch", ",".join([str(x) for x in run_indices])]
+        cmd += self._options()
+        name = self._next_id(play_index, run_indices[0])
+        # the results go next to the manifest, where the pipeline runner reads them
+        results_path = None
+        if self._manifest_path is not None:
+            results_path = batch_results.results_path(os.path.dirname(self._manifest_path), name)
+            cmd += ["--results", results_path]
+        return name, " ".join(cmd), results_path
+
 
-def parse(playbook_path, tsv_path, var_files, log_dir):
+def parse(playbook_path, tsv_path, var_files, log_dir, manifest_path=None, staged_dir=None, fact_cache_ttl=0):
     plays = _read_plays(playbook_path)
     logger().info("Number of plays: %s" % len(plays))
 
     samples = _read_samples(tsv_path)
-    logger().info("Number of samples: %s" % len(samples))
+    logger().info("Number of samples: %s" % samples.row_size())
 
     vars = _read_variables(var_files)
-    vars["all_samples"] = samples
+    vars["all_samples"] = list(samples.all_rows())
 
-    return PlayBookYaml(JobCommand(playbook_path, tsv_path, var_files, log_dir), plays, samples, vars)
+    cmd = JobCommand(playbook_path, tsv_path, var_files, log_dir, manifest_path, staged_dir, fact_cache_ttl)
+    fingerprinter = fingerprint.Fingerprinter(staged_dir or os.path.dirname(playbook_path))
+    return PlayBookYaml(cmd, plays, samples, vars, fingerprinter)
 
 
 def _read_plays(playbook_path):
     logger().info("Reading playbook yaml...")
     with open(playbook_path, 'r') as stream:
-        return yaml.load(stream)
+        return expand_chunks(yaml.load(stream))
 
 
 def _read_samples(tsv_path):
     if tsv_path is None:
-        return []
+        return tsv_config.TsvConfig([])
 
     logger().debug("TSV config path: %s" % tsv_path)
-    tsv_conf = tsv_config.parse(tsv_path)
+    tsv_conf = tsv_config.parse(tsv_path, memory_map=True)
 
     logger().info("TSV config first line: %s" % str(tsv_conf.row_at(0)))
-    return list(tsv_conf.all_rows())
+    return tsv_conf
 
 
 def _read_variables(var_files):
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import multiprocessing
+import re
+import tempfile
+
+import os
+
+SIZE_UNITS = {"": 1, "K": 1.0 / 1024, "M": 1, "G": 1024, "T": 1024 * 1024}
+
+
+def parse_size(value):
+    """
+    Converts a size like 512, "512M", "16G" or "1.5TB" to megabytes.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (int, long, float)):
+        return int(value)
+    match = re.match(r'^\s*(?P<num>\d+(\.\d+)?)\s*(?P<unit>[KMGT]?)B?\s*$', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError("Can't parse size value: %s" % value)
+    return int(float(match.group("num")) * SIZE_UNITS[match.group("unit").upper()])
+
+
+class Resources(object):
+    def __init__(self, cpu=1, memory=0, disk=0):
+        self.cpu = cpu
+        self.memory = memory
+        self.disk = disk
+
+    @staticmethod
+    def parse(d):
+        if d is None:
+            return Resources()
+        return Resources(cpu=max(int(d.get("cpu", 1)), 1),
+                         memory=parse_size(d.get("memory", None)),
+                         disk=parse_size(d.get("disk", None)))
+
+    def fits(self, other):
+        return self.cpu <= other.cpu and self.memory <= other.memory and self.disk <= other.disk
+
+    def __add__(self, other):
+        return Resources(self.cpu + other.cpu, self.memory + other.memory, self.disk + other.disk)
+
+    def __sub__(self, other):
+        return Resources(self.cpu - other.cpu, self.memory - other.memory, self.disk - other.disk)
+
+    def __eq__(self, other):
+        return isinstance(other, Resources) and self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "Resources(cpu=%d, memory=%dM, disk=%dM)" % (self.cpu, self.memory, self.disk)
+
+
+def largest(resources):
+    return Resources(cpu=max([x.cpu for x in resources] + [1]),
+                     memory=max([x.memory for x in resources] + [0]),
+                     disk=max([x.disk for x in resources] + [0]))
+
+
+def machine_capacity(scratch_dir=None):
+    cpu = multiprocessing.cpu_count()
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    st = os.statvfs(scratch_dir or tempfile.gettempdir())
+    disk = st.f_bavail * st.f_frsize / (1024 * 1024)
+    return Resources(cpu=cpu, memory=memory, disk=disk)
+
+
+class SlotAllocator(object):
+    """
+    Keeps track of the free machine resources; a job is started only if its whole
+    request fits into what is left by the running ones.
+    """
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._free = capacity
+
+    def capacity(self):
+        return self._capacity
+
+    def free(self):
+        return self._free
+
+    def fit(self, request):
+        # a request bigger than the machine would never start; let it run alone instead
+        return Resources(cpu=min(request.cpu, self._capacity.cpu),
+                         memory=min(request.memory, self._capacity.memory),
+                         disk=min(request.disk, self._capacity.disk))
+
+    def allocate(self, request):
+        request = self.fit(request)
+        if not request.fits(self._free):
+            return False
+        self._free = self._free - request
+        return True
+
+    def release(self, request):
+        self._free = self._free + self.fit(request)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import signal
+
+from resources import Resources
+
+# the kernel OOM killer kills a local job with SIGKILL; LSF sends SIGINT, SIGTERM and then SIGKILL
+# at its memory limit, so an LSF job is known to be killed for memory by its exit reason instead
+OOM_SIGNAL = signal.SIGKILL
+
+
+def exit_signal(exit_code):
+    """
+    Signal the job was killed with, or None: Popen reports it as a negative return code,
+    a shell (or LSF) as 128 + signal.
+    """
+    if exit_code is None:
+        return None
+    if exit_code < 0:
+        return -exit_code
+    if 128 < exit_code < 160:
+        return exit_code - 128
+    return None
+
+
+def parse_signal(value):
+    if isinstance(value, (int, long)):
+        return value
+    name = str(value).upper()
+    if not name.startswith("SIG"):
+        name = "SIG" + name
+    if not hasattr(signal, name):
+        raise ValueError("Unknown signal: %s" % value)
+    return getattr(signal, name)
+
+
+class RetryPolicy(object):
+    """
+    When and how a failed play run is resubmitted. A run is retried if it failed with one of
+    the exit_codes or was killed with one of the signals (any failure if neither is given), or
+    if its job got lost; the n-th retry is delayed by backoff * 2^(n-1) seconds. With
+    memory_factor the memory request is multiplied each time the run is killed for using too much
+    memory: by the OOM killer (SIGKILL) locally, at its memory limit (TERM_MEMLIMIT) in LSF.
+    """
+
+    def __init__(self, attempts=1, backoff=60, exit_codes=None, signals=None, memory_factor=None):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.exit_codes = exit_codes
+        self.signals = signals
+        self.memory_factor = memory_factor
+
+    @staticmethod
+    def parse(d):
+        if d is None:
+            return None
+        if isinstance(d, (int, long)):
+            d = {"attempts": d}
+        return RetryPolicy(attempts=max(int(d.get("attempts", 1)), 1),
+                           backoff=float(d.get("backoff", 60)),
+                           exit_codes=[int(x) for x in d["exit_codes"]] if "exit_codes" in d else None,
+                           signals=[parse_signal(x) for x in d["signals"]] if "signals" in d else None,
+                           memory_factor=float(d["memory_factor"]) if "memory_factor" in d else None)
+
+    def should_retry(self, attempt, exit_code, out_of_memory=False):
+        if exit_code == 0 or attempt >= self.attempts:
+            return False
+        if exit_code is None or (self.exit_codes is None and self.signals is None):
+            return True
+        # the exit code of a job killed at the LSF memory limit depends on the signal which got it
+        if out_of_memory and self.memory_factor is not None:
+            return True
+        if self.exit_codes is not None and exit_code in self.exit_codes:
+            return True
+        return self.signals is not None and exit_signal(exit_code) in self.signals
+
+    def delay(self, attempt):
+        return self.backoff * (2 ** (attempt - 1))
+
+    def resources(self, resources, out_of_memory):
+        """
+        Resources for the next attempt of a run which failed, killed for using too much memory or not.
+        """
+        if self.memory_factor is None or resources is None or resources.memory == 0:
+            return resources
+        if not out_of_memory:
+            return resources
+        return Resources(cpu=resources.cpu, memory=int(resources.memory * self.memory_factor), disk=resources.disk)
+
+    def __repr__(self):
+        return "RetryPolicy(attempts=%s, backoff=%s, exit_codes=%s, signals=%s, memory_factor=%s)" % (
+            self.attempts, self.backoff, self.exit_codes, self.signals, self.memory_factor)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import hashlib
+import shutil
+import stat
+
+import os
+import fingerprint
+from logger import logger
+
+STAGING_DIR = "ngspyeasy_staging"
+
+# the playbook directories the runs need, besides the playbook itself
+STAGED = ["roles", "library"]
+
+READ_ONLY = ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def stage(playbook_dir, root):
+    """
+    Copies the roles and the library of a playbook, once per pipeline, into a read-only directory
+    in root named by the digest of their content, and returns it; every run links to it instead
+    of copying them again. A directory staged by a previous pipeline with the same content is reused.
+    """
+    h = hashlib.sha1()
+    for name in STAGED:
+        path = os.path.join(playbook_dir, name)
+        if os.path.isdir(path):
+            h.update("%s:%s" % (name, fingerprint.dir_digest(path)))
+    # the runs link to it from their own directories
+    staged_dir = os.path.join(os.path.abspath(root), STAGING_DIR, h.hexdigest())
+    if os.path.isdir(staged_dir):
+        logger().debug("roles and library already staged: %s" % staged_dir)
+        return staged_dir
+
+    tmp_dir = "%s.%d.tmp" % (staged_dir, os.getpid())
+    os.makedirs(tmp_dir)
+    for name in STAGED:
+        path = os.path.join(playbook_dir, name)
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(tmp_dir, name))
+    _make_read_only(tmp_dir)
+    try:
+        os.rename(tmp_dir, staged_dir)
+    except OSError:
+        # staged meanwhile by another pipeline
+        if not os.path.isdir(staged_dir):
+            raise
+        remove(tmp_dir)
+    logger().info("roles and library staged: %s" % staged_dir)
+    return staged_dir
+
+
+def link(source_dir, run_dir):
+    """
+    Links the roles and the library in source_dir (staged or the playbook directory) into the
+    directory of a run, next to its playbook.
+    """
+    for name in STAGED:
+        path = os.path.join(source_dir, name)
+        if os.path.isdir(path):
+            os.symlink(path, os.path.join(run_dir, name))
+
+
+def remove(path):
+    """
+    Removes a directory tree which may have read-only directories in it.
+    """
+
+    def make_writable(func, failed_path, exc_info):
+        parent = os.path.dirname(failed_path)
+        os.chmod(parent, os.stat(parent).st_mode | stat.S_IWUSR)
+        func(failed_path)
+
+    shutil.rmtree(path, onerror=make_writable)
+
+
+def _make_read_only(path):
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                os.chmod(file_path, os.stat(file_path).st_mode & READ_ONLY)
+        os.chmod(root, os.stat(root).st_mode & READ_ONLY)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import ast
+import collections
+import re
+
+import jinja2
+
+# a template which is a single expression, e.g. "{{ all_samples }}"
+SINGLE_EXPRESSION = re.compile(r'^\s*\{\{(.*)\}\}\s*$', re.DOTALL)
+
+_env = jinja2.Environment()
+
+# compiled templates and expressions by their source; the same few are rendered for every play run
+_templates = dict()
+_expressions = dict()
+
+
+def render(source, variables, **context):
+    """
+    Renders a template string, like jinja2.Template(source).render(variables, **context).
+    """
+    if source not in _templates:
+        _templates[source] = _env.from_string(source)
+    return _templates[source].render(variables, **context)
+
+
+def evaluate(source, variables, **context):
+    """
+    Evaluates a template to a Python object. A single expression ("{{ all_samples }}") is
+    evaluated natively, so the value is returned as is, without rendering it to a string;
+    anything else is rendered and read back as a Python literal.
+    """
+    expression = _expression(source)
+    if expression is None:
+        return ast.literal_eval(render(source, variables, **context).strip())
+    args = dict(variables)
+    args.update(context)
+    value = expression(**args)
+    if isinstance(value, jinja2.Undefined):
+        raise ValueError("Undefined value of the template: %s" % source)
+    if isinstance(value, collections.Iterator):
+        # filters like select and map return generators
+        return list(value)
+    return value
+
+
+def _expression(source):
+    if source not in _expressions:
+        m = SINGLE_EXPRESSION.match(source)
+        body = m.group(1) if m is not None else None
+        if body is None or "{{" in body or "}}" in body or "{%" in source:
+            _expressions[source] = None
+        else:
+            _expressions[source] = _env.compile_expression(body, undefined_to_none=False)
+    return _expressions[source]
@@ -16,28 +16,40 @@
 # limitations under the License.
 ###
 
+import collections
 import csv
+import mmap
 
 import os.path
 
 
-def parse(tsv_path):
+def parse(tsv_path, memory_map=False):
+    """
+    Reads a TSV file with a header line. With memory_map the file is read through mmap,
+    which avoids copying big sample sheets through the file buffers.
+    """
     if not os.path.exists(tsv_path):
         raise IOError("File %s does not exist" % tsv_path)
 
     if os.stat(tsv_path).st_size == 0:
         return TsvConfig([])
 
-    rows = []
     with open(tsv_path, 'r') as tsv:
-        reader = csv.reader(utf_8_encoder(tsv), delimiter="\t")
+        if not memory_map:
+            return _read(tsv_path, tsv)
+        mm = mmap.mmap(tsv.fileno(), 0, access=mmap.ACCESS_READ)
         try:
-            for row in reader:
-                rows.append(row)
-        except csv.Error as e:
-            raise ValueError('TSV Format Error: file %s, line %d: %s' % (tsv_path, reader.line_num, e))
+            return _read(tsv_path, iter(mm.readline, ""))
+        finally:
+            mm.close()
 
-    return TsvConfig(rows)
+
+def _read(tsv_path, lines):
+    reader = csv.reader(utf_8_encoder(lines), delimiter="\t")
+    try:
+        return TsvConfig(reader)
+    except csv.Error as e:
+        raise ValueError('TSV Format Error: file %s, line %d: %s' % (tsv_path, reader.line_num, e))
 
 
 def utf_8_encoder(unicode_csv_data):
@@ -45,35 +57,160 @@ def utf_8_encoder(unicode_csv_data):
         yield line.encode('utf-8')
 
 
-class TsvConfig:
+class TsvConfig(object):
+    """
+    Column oriented sample table: the values of every column are kept in one tuple and
+    rows are lightweight read-only views (see Row). Rows can be looked up by sample_id.
+    """
+
     def __init__(self, rows):
-        self.rows = []
         self.header = None
-
-        if (rows is None) or len(rows) == 0:
+        self._columns = dict()
+        self._values = []
+        self._size = 0
+        self._ids = None
+
+        rows = iter(rows if rows is not None else [])
+        header = next(rows, None)
+        if header is None:
             return
 
-        header = rows[0]
-        self.rows = [self.as_dict(x, header) for x in rows[1:]]
+        self.header = tuple([h.lower() for h in header])
+        # as in a dict built from the row, the last of duplicated columns wins
+        self._columns = dict([(h, i) for i, h in enumerate(self.header)])
+        self._keys = tuple(collections.OrderedDict.fromkeys(self.header))
+        columns = [[] for _ in self.header]
+        for row in rows:
+            for i, values in enumerate(columns):
+                values.append(row[i])
+        self._values = [tuple(x) for x in columns]
+        self._size = len(self._values[0]) if len(self._values) > 0 else 0
 
     def all_rows(self):
-        for r in self.rows:
-            yield r
+        for i in xrange(self._size):
+            yield Row(self, i)
 
     def is_empty(self):
-        return len(self.rows) == 0
+        return self._size == 0
 
     def row_size(self):
-        return len(self.rows)
+        return self._size
 
     def col_size(self):
-        return 0 if self.is_empty() else self.row_at(0).size()
+        return 0 if self.header is None else len(self.header)
 
     def row_at(self, index):
-        return self.rows[index] if 0 <= index <= self.row_size() else None
+        return Row(self, index) if 0 <= index < self._size else None
 
-    def as_dict(self, values, headers):
-        d = dict()
-        for i, h in enumerate(headers, start=0):
-            d[h.lower()] = values[i]
-        return d
+    def column(self, name):
+        return self._values[self._columns[name.lower()]]
+
+    def get(self, sample_id):
+        """
+        Row with the given sample_id (the first one if there are duplicates), None if there is no such row.
+        """
+        if self._ids is None:
+            self._ids = dict()
+            if "sample_id" in self._columns:
+                for i, value in enumerate(self.column("sample_id")):
+                    self._ids.setdefault(value, i)
+        index = self._ids.get(sample_id, None)
+        return Row(self, index) if index is not None else None
+
+    def where(self, **conditions):
+        """
+        Rows where every given column has the given value (or one of the values, if a list is given),
+        e.g. where(aligner="bwa"). Every condition is checked against a whole column at once.
+        """
+        indices = None
+        for name, value in conditions.items():
+            # all values in the table are strings
+            accepted = set([str(x) for x in _accepted(value)])
+            column = self.column(name)
+            candidates = xrange(self._size) if indices is None else indices
+            indices = [i for i in candidates if column[i] in accepted]
+        if indices is None:
+            indices = xrange(self._size)
+        return [Row(self, i) for i in indices]
+
+    def _value(self, index, name):
+        return self._values[self._columns[name]][index]
+
+
+class Row(object):
+    """
+    Read-only view of one row of a TsvConfig; behaves like a dict with the lowercased header as keys.
+    It implements collections.Mapping instead of inheriting from it: the Python 2 Mapping classes
+    have no __slots__, so every row would have a __dict__ too.
+    """
+    __slots__ = ("_table", "_index")
+    __hash__ = None
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        if key not in self._table._columns:
+            raise KeyError(key)
+        return self._table._value(self._index, key)
+
+    def __contains__(self, key):
+        return key in self._table._columns
+
+    def __iter__(self):
+        return iter(self._table._keys)
+
+    def __len__(self):
+        return len(self._table._keys)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        return (self[x] for x in self)
+
+    def iteritems(self):
+        return ((x, self[x]) for x in self)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+
+collections.Mapping.register(Row)
+
+
+def select(samples, conditions):
+    """
+    Samples (a TsvConfig or a list of dicts) matching all conditions, see TsvConfig.where().
+    """
+    if isinstance(samples, TsvConfig):
+        return samples.where(**conditions)
+    checks = [(name, _accepted(value)) for name, value in conditions.items()]
+    return [x for x in samples if all([x.get(name, None) in accepted for name, accepted in checks])]
+
+
+def _accepted(value):
+    if isinstance(value, (list, tuple, set)):
+        return set(value)
+    return set([value])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import collections
+
+
+class VarScope(collections.MutableMapping):
+    """
+    Variables of a play run: an overlay (e.g. curr_sample) on top of the playbook variables,
+    which are shared by all runs and never modified; writes and deletions go to the overlay.
+    """
+
+    def __init__(self, base, overlay=None):
+        self._base = base
+        self._overlay = dict(overlay or dict())
+        self._deleted = set()
+
+    def __getitem__(self, key):
+        if key in self._overlay:
+            return self._overlay[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        return self._base[key]
+
+    def __setitem__(self, key, value):
+        self._overlay[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._overlay.pop(key, None)
+        if key in self._base:
+            self._deleted.add(key)
+
+    def __contains__(self, key):
+        return key in self._overlay or (key not in self._deleted and key in self._base)
+
+    def __iter__(self):
+        for key in self._overlay:
+            yield key
+        for key in self._base:
+            if key not in self._overlay and key not in self._deleted:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """
+        A plain dict with the same variables, e.g. for Ansible which checks the type of extra_vars;
+        only the top level is copied, the values are shared.
+        """
+        return dict(self.iteritems())
+
+    def __repr__(self):
+        return "VarScope(%s)" % repr(self.to_dict())
+
+
+def plain(value):
+    """
+    The value with the mappings which are not dicts (VarScope, sample table rows) replaced by dicts,
+    for code which checks types, like Ansible. Only what contains such mappings is copied.
+    """
+    if isinstance(value, collections.Mapping):
+        result = value if type(value) == dict else dict(value.iteritems())
+        for k, v in result.items():
+            p = plain(v)
+            if p is not v:
+                if result is value:
+                    result = dict(value)
+                result[k] = p
+        return result
+    if isinstance(value, (list, tuple)):
+        items = [plain(x) for x in value]
+        if all([x is y for x, y in zip(items, value)]):
+            return value
+        return type(value)(items)
+    return value
+
+
+def json_default(obj):
+    """
+    To be used as the default of json.dumps: mappings are written as objects, anything
+    else unknown as its repr.
+    """
+    if isinstance(obj, collections.Mapping):
+        return dict(obj.iteritems())
+    return repr(obj)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import ctypes
+import ctypes.util
+import select
+import sys
+import threading
+import time
+
+import os
+import file_finder
+from logger import logger
+
+# inotify(7) events of a new file; writes to a file are not watched, its stability is checked by time
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class FileWatcher(object):
+    """
+    Watches glob patterns for new files in a background thread. A file is reported once, when it
+    is stable: its size and mtime haven't changed between two scans stable_seconds apart, whatever
+    its mtime (a file copied with its mtime preserved looks old while it is written). The
+    directories are rescanned when inotify reports a change in one of them, or every poll_interval
+    seconds if inotify is not available (and, as a safety net, for directories created later under
+    a wildcard). on_new_files is called from the watcher thread.
+    """
+
+    def __init__(self, patterns, stable_seconds=30, poll_interval=10, on_new_files=None):
+        self._patterns = sorted(set(patterns))
+        self._stable_seconds = stable_seconds
+        self._poll_interval = poll_interval
+        self._on_new_files = on_new_files
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        # path -> (size, mtime, time the size and mtime were first seen)
+        self._pending = dict()
+        self._reported = set()
+        self._new = dict()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="FileWatcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def new_files(self):
+        """
+        Returns the stable files found since the last call, by pattern, and forgets them.
+        """
+        with self._lock:
+            new = self._new
+            self._new = dict()
+        return dict([(pattern, sorted(files)) for pattern, files in new.items()])
+
+    def has_pending(self):
+        """
+        True if some files are found but not stable yet, or not taken by new_files() yet.
+        """
+        with self._lock:
+            return len(self._pending) > 0 or len(self._new) > 0
+
+    def _run(self):
+        notifier = inotify_or_polling(self._stopped)
+        try:
+            while not self._stopped.is_set():
+                for directory in self._directories():
+                    notifier.watch(directory)
+                if self.scan(time.time()):
+                    if self._on_new_files is not None:
+                        self._on_new_files()
+                notifier.wait(self._timeout(time.time()))
+        except Exception as e:
+            logger().exception(e)
+        finally:
+            notifier.close()
+
+    def scan(self, now):
+        """
+        Looks for new files and updates their state; returns True if any became stable.
+        """
+        found = False
+        seen = set()
+        for pattern in self._patterns:
+            for path in file_finder.find(pattern):
+                if path in self._reported:
+                    continue
+                seen.add(path)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if self._is_stable(path, st, now):
+                    with self._lock:
+                        self._pending.pop(path, None)
+                        self._new.setdefault(pattern, []).append(path)
+                    self._reported.add(path)
+                    found = True
+        with self._lock:
+            # removed before they became stable
+            for path in [x for x in self._pending if x not in seen]:
+                del self._pending[path]
+        return found
+
+    def _is_stable(self, path, st, now):
+        state = (st.st_size, st.st_mtime)
+        with self._lock:
+            (size, mtime, since) = self._pending.get(path, (None, None, now))
+            if (size, mtime) != state:
+                since = now
+                self._pending[path] = state + (since,)
+        return (size, mtime) == state and now - since >= self._stable_seconds
+
+    def _timeout(self, now):
+        with self._lock:
+            waits = [since + self._stable_seconds - now for (size, mtime, since) in self._pending.values()]
+        return max(min(waits + [self._poll_interval]), 0.1)
+
+    def _directories(self):
+        directories = []
+        for pattern in self._patterns:
+            parent = os.path.dirname(pattern) or os.curdir
+            directories.extend([x for x in file_finder.find(parent) if os.path.isdir(x)])
+        return directories
+
+
+def inotify_or_polling(stopped):
+    try:
+        return Inotify(stopped)
+    except (OSError, AttributeError) as e:
+        logger().info("inotify is not available (%s): polling the directories" % e)
+        return Polling(stopped)
+
+
+class Polling(object):
+    def __init__(self, stopped):
+        self._stopped = stopped
+
+    def watch(self, directory):
+        pass
+
+    def wait(self, timeout):
+        self._stopped.wait(timeout)
+
+    def close(self):
+        pass
+
+
+class Inotify(object):
+    """
+    inotify through ctypes: only tells that something changed in one of the watched directories.
+    """
+
+    def __init__(self, stopped):
+        self._stopped = stopped
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init()
+        if self._fd < 0:
+            raise _os_error()
+        self._watched = set()
+
+    def watch(self, directory):
+        if directory in self._watched:
+            return
+        path = directory.encode(sys.getfilesystemencoding()) if isinstance(directory, unicode) else directory
+        if self._libc.inotify_add_watch(self._fd, ctypes.c_char_p(path), ctypes.c_uint32(WATCH_MASK)) < 0:
+            logger().warn("Can't watch %s (%s): it is polled" % (directory, _os_error()))
+        self._watched.add(directory)
+
+    def wait(self, timeout):
+        # waits in short steps to notice stop()
+        deadline = time.time() + timeout
+        while not self._stopped.is_set():
+            step = min(deadline - time.time(), 1.0)
+            if step <= 0:
+                return
+            (readable, _, _) = select.select([self._fd], [], [], step)
+            if readable:
+                # the events themselves are not needed, all the patterns are rescanned
+                os.read(self._fd, 64 * 1024)
+                return
+
+    def close(self):
+        os.close(self._fd)
+
+
+def _os_error():
+    code = ctypes.get_errno()
+    return OSError(code, os.strerror(code))
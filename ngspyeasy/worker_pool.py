@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+###
+# Copyright 2015, EMBL-EBI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+###
+
+import itertools
+import multiprocessing
+import re
+import shlex
+import signal
+import sys
+import threading
+import time
+import traceback
+from Queue import Empty
+
+import os
+import fingerprint
+import ngspyeasy_play_run
+from executor import LocalProvider
+from logger import logger, play_run_logger
+
+PLAY_RUN_EXECUTABLE = "ngspyeasy_play_run"
+
+ARRAY_INDEX = re.compile(r'\$\(\(LSB_JOBINDEX\+(-?\d+)\)\)')
+
+# seconds between the checks for workers which died while running a job
+WATCHDOG_INTERVAL = 1
+
+# exit code of a job whose worker died without an exit code known
+LOST_EXIT_CODE = 1
+
+# the run record source (a manifest or a parsed playbook) of this worker process, by the ngspyeasy_play_run
+# options it was opened with: only the most recent one is kept, as in watch mode every batch has its own
+_runs = dict()
+
+_fingerprinters = dict()
+
+# where this worker process tells which job it started (see init_worker)
+_started = None
+
+
+class PoolProvider(LocalProvider):
+    """
+    Local provider running ngspyeasy_play_run commands inside a pool of long-lived worker
+    processes, which import Ansible and parse the playbook only once; other commands are
+    run in a shell as usual. Jobs are packed by their resources the same way.
+    """
+
+    def __init__(self, on_exit=None, capacity=None, processes=None):
+        super(PoolProvider, self).__init__(on_exit=on_exit, capacity=capacity)
+        self._processes = processes or self._slots.capacity().cpu
+        self._pool = None
+        self._job_ids = itertools.count()
+        # the jobs in the pool by id, and the pids of the workers running them
+        self._jobs = dict()
+        self._pids = dict()
+        self._workers = dict()
+        self._started = None
+        self._lock = threading.Lock()
+
+    def _start(self, name, cmd, env):
+        if not is_play_run(cmd):
+            return super(PoolProvider, self)._start(name, cmd, env)
+        if self._pool is None:
+            # created lazily, in the executor process, not in the one the provider was created in
+            self._started = multiprocessing.Queue(-1)
+            self._pool = multiprocessing.Pool(self._processes, initializer=init_worker, initargs=(self._started,))
+            watchdog = threading.Thread(target=self._watch_workers, args=(self._pool,))
+            watchdog.daemon = True
+            watchdog.start()
+        handle = PoolJob(name, self._job_ids.next())
+        with self._lock:
+            self._jobs[handle.id] = handle
+        self._pool.apply_async(run_command, (cmd, env, handle.id), callback=lambda rc: self._finished(handle, rc))
+        return handle
+
+    def _finished(self, handle, returncode):
+        # once: the result of a job given up as lost may still come
+        with self._lock:
+            if self._jobs.pop(handle.id, None) is None:
+                return
+            self._pids.pop(handle.id, None)
+        self._exited.put((handle, returncode))
+        if self._on_exit is not None:
+            self._on_exit()
+
+    def _watch_workers(self, pool):
+        """
+        The result of a job comes only when its worker returns it: a worker which dies (e.g. killed
+        for its memory) takes the job with it, so the jobs of dead workers are reported as failed,
+        with the exit code of the worker.
+        """
+        while self._pool is pool:
+            time.sleep(WATCHDOG_INTERVAL)
+            self._check_workers(pool)
+
+    def _check_workers(self, pool):
+        while True:
+            try:
+                (job_id, pid) = self._started.get(block=False)
+            except Empty:
+                break
+            with self._lock:
+                if job_id in self._jobs:
+                    self._pids[job_id] = pid
+        # the pool replaces the dead workers in its (private) list; the ones seen before keep their exit code
+        for worker in list(pool._pool):
+            self._workers[worker.pid] = worker
+        with self._lock:
+            pids = self._pids.items()
+        for job_id, pid in pids:
+            worker = self._workers.get(pid, None)
+            if worker is not None and worker.exitcode is None:
+                continue
+            exit_code = worker.exitcode if worker is not None else LOST_EXIT_CODE
+            handle = self._jobs.get(job_id, None)
+            if handle is not None:
+                logger().error("worker %d running job %s died: exit_code=%s" % (pid, handle.name, exit_code))
+                self._finished(handle, exit_code)
+
+    def stop(self):
+        self._waiting_jobs = []
+        self._procs = [x for x in self._procs if not isinstance(x[0], PoolJob)]
+        if self._pool is not None:
+            pool = self._pool
+            self._pool = None
+            pool.terminate()
+            pool.join()
+        super(PoolProvider, self).stop()
+
+
+class PoolJob(object):
+    def __init__(self, name, id):
+        self.name = name
+        self.id = id
+
+
+def is_play_run(cmd):
+    return cmd.split(None, 1)[0] == PLAY_RUN_EXECUTABLE
+
+
+def expand_array_index(cmd, env):
+    """
+    Substitutes the $((LSB_JOBINDEX+n)) run index of a job array element, as the shell would.
+    """
+    if env is None or "LSB_JOBINDEX" not in env:
+        return cmd
+    index = int(env["LSB_JOBINDEX"])
+    return ARRAY_INDEX.sub(lambda m: str(index + int(m.group(1))), cmd)
+
+
+def init_worker(started=None):
+    global _started
+    # the executor stops the pool itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _started = started
+
+
+def run_command(cmd, env, job_id=None):
+    if _started is not None and job_id is not None:
+        _started.put((job_id, os.getpid()))
+    try:
+        args = ngspyeasy_play_run.parse_args(shlex.split(expand_array_index(cmd, env))[1:])
+        playbook_path = os.path.abspath(args.playbook_path)
+        fingerprinter = _fingerprinter(args.staged_dir or os.path.dirname(playbook_path))
+        if args.batch is not None:
+            records = [_runs_of(args).run_record(args.play_index, x) for x in args.batch]
+            run_id = ngspyeasy_play_run.batch_id(args.play_index, args.batch)
+            run = lambda: len(ngspyeasy_play_run.run_batch(records, playbook_path, fingerprinter, args.staged_dir,
+                                                           args.fact_cache_ttl, args.results)) == 0
+        else:
+            record = _runs_of(args).run_record(args.play_index, args.run_index)
+            run_id = ngspyeasy_play_run.run_id(args.play_index, record)
+            run = lambda: ngspyeasy_play_run.run(record, playbook_path, fingerprinter, args.staged_dir,
+                                                 args.fact_cache_ttl)
+        if args.log_dir is None:
+            ok = run()
+        else:
+            with play_run_logger(args.log_dir, run_id):
+                ok = run()
+        return 0 if ok else 1
+    except SystemExit as e:
+        # argparse errors
+        return e.code if isinstance(e.code, int) else 1
+    except:
+        (type, value, tb) = sys.exc_info()
+        logger().error("exception in play run worker: \n %s" % "".join(traceback.format_exception(type, value, tb)))
+        return 1
+
+
+def _runs_of(args):
+    key = (args.playbook_path, args.samples_tsv, tuple(args.var_files or []), args.log_dir, args.manifest)
+    if key not in _runs:
+        _runs.clear()
+        _runs[key] = ngspyeasy_play_run.open_runs(args)
+    return _runs[key]
+
+
+def _fingerprinter(roles_dir):
+    # only the most recent one, as for _runs
+    if roles_dir not in _fingerprinters:
+        _fingerprinters.clear()
+        _fingerprinters[roles_dir] = fingerprint.Fingerprinter(roles_dir)
+    return _fingerprinters[roles_dir]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+import imp
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import unittest
+
+import os
+from ansible.runner import Runner
+from ansible.inventory import Inventory
+from ansible import callbacks
+
+# an Ansible module of the example, not a part of the ngspyeasy package
+LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "trivial", "library")
+dockercmd = imp.load_source("dockercmd", os.path.join(LIBRARY, "dockercmd.py"))
+
+# runs the command of "docker run --rm IMAGE COMMAND" here
+FAKE_DOCKER = """#!/bin/bash
+shift; shift; shift; eval "$@"
+"""
+
+
+class RunCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.tmp_dir, "out.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_tail_and_log_file(self):
+        (rc, line_count, tail) = dockercmd.run_command("seq 1 5000", self.log_file, 3)
+        self.assertEqual(0, rc)
+        self.assertEqual(5000, line_count)
+        self.assertEqual(["4998\n", "4999\n", "5000\n"], tail)
+        with open(self.log_file) as f:
+            self.assertEqual("".join(["%d\n" % x for x in range(1, 5001)]), f.read())
+
+    def test_long_lines_across_chunks(self):
+        (rc, line_count, tail) = dockercmd.run_command("head -c 100000 /dev/zero | tr '\\0' x; echo; echo end",
+                                                       self.log_file, 1)
+        self.assertEqual((0, 2, ["end\n"]), (rc, line_count, tail))
+        self.assertEqual(100005, os.path.getsize(self.log_file))
+
+    def test_failed_command(self):
+        (rc, line_count, tail) = dockercmd.run_command("echo failing >&2; exit 3", self.log_file, 10)
+        self.assertEqual((3, 1, ["failing\n"]), (rc, line_count, tail))
+
+
+class DoneFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input = self.touch("in.txt", time.time() - 100)
+        self.output = self.touch("out.txt", time.time() - 50)
+        self.done_file = self.output + ".done"
+        self.cmd = "docker run --rm test cat in.txt > out.txt"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def touch(self, name, mtime):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(name)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def write_done(self, checksum=False):
+        dockercmd.write_done(self.done_file, self.cmd, dockercmd.file_state([self.input], checksum),
+                             dockercmd.file_state([self.output], checksum, self.done_file))
+
+    def is_done(self, cmd=None, checksum=False):
+        return dockercmd.is_done(self.done_file, cmd or self.cmd, dockercmd.file_state([self.input], checksum),
+                                 [self.output], checksum)
+
+    def test_done(self):
+        self.assertFalse(self.is_done())
+        self.write_done()
+        self.assertTrue(self.is_done())
+        # no temporary files are left
+        self.assertEqual(["in.txt", "out.txt", "out.txt.done"], sorted(os.listdir(self.tmp_dir)))
+
+    def test_input_newer_than_done_file(self):
+        self.write_done()
+        self.touch("in.txt", time.time())
+        self.assertFalse(self.is_done())
+
+    def test_output_older_than_input(self):
+        self.touch("in.txt", time.time())
+        self.write_done()
+        self.assertFalse(self.is_done())
+        # unless the contents are compared
+        self.write_done(checksum=True)
+        self.assertTrue(self.is_done(checksum=True))
+
+    def test_missing_input(self):
+        self.write_done()
+        os.remove(self.input)
+        self.assertFalse(self.is_done())
+
+    def test_missing_output(self):
+        self.write_done()
+        os.remove(self.output)
+        self.assertFalse(self.is_done())
+
+    def test_changed_command(self):
+        self.write_done()
+        self.assertFalse(self.is_done(cmd="docker run --rm test cp in.txt out.txt"))
+
+    def test_broken_done_file(self):
+        with open(self.done_file, 'w') as f:
+            f.write("{\"cmd\": ")
+        self.assertFalse(self.is_done())
+
+
+class DockerCmdModuleTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        docker = os.path.join(self.tmp_dir, "docker")
+        with open(docker, 'w') as f:
+            f.write(FAKE_DOCKER)
+        os.chmod(docker, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_module(self, args):
+        args = dict(image="test", secure=False, sudo=False, **args)
+        # the module (#!/usr/bin/env python) runs with the same python as the tests
+        path = ":".join([self.tmp_dir, os.path.dirname(sys.executable), os.environ["PATH"]])
+        runner = Runner(module_name="dockercmd", module_path=LIBRARY, complex_args=args, pattern="localhost",
+                        inventory=Inventory(["localhost"]), transport="local",
+                        callbacks=callbacks.DefaultRunnerCallbacks(),
+                        environment={"PATH": path, "TMPDIR": self.tmp_dir})
+        return runner.run()["contacted"]["localhost"]
+
+    def test_failed_command(self):
+        result = self.run_module({"command": "'echo failing; exit 3'"})
+        self.assertTrue(result["failed"])
+        self.assertEqual(3, result["rc"])
+        self.assertEqual(["failing"], result["stdout_lines"])
+        # the temporary log file is removed
+        self.assertFalse("log_file" in result)
+        self.assertEqual(["docker"], os.listdir(self.tmp_dir))
+
+    def test_log_file(self):
+        log_file = os.path.join(self.tmp_dir, "out.log")
+        result = self.run_module({"command": "'seq 1 5'", "log_file": log_file, "tail_lines": 2})
+        self.assertFalse(result.get("failed", False))
+        self.assertEqual((["4", "5"], True, log_file),
+                         (result["stdout_lines"], result["truncated"], result["log_file"]))
+        with open(log_file) as f:
+            self.assertEqual("1\n2\n3\n4\n5\n", f.read())
+
+
+    def test_skipped_when_done(self):
+        output = os.path.join(self.tmp_dir, "out.txt")
+        args = {"command": "'seq 1 5 > %s'" % output, "creates": [output],
+                "inputs": [os.path.join(self.tmp_dir, "docker")]}
+        self.assertTrue(self.run_module(args)["changed"])
+        self.assertTrue(os.path.exists(output + ".done"))
+        self.assertFalse(self.run_module(args)["changed"])
+
+    def test_missing_inputs(self):
+        output = os.path.join(self.tmp_dir, "out.txt")
+        result = self.run_module({"command": "'seq 1 5 > %s'" % output, "creates": [output],
+                                  "inputs": [self.tmp_dir + "/*.bam"]})
+        self.assertTrue(result["failed"])
+        self.assertTrue("missing inputs" in result["msg"])
+        self.assertFalse(os.path.exists(output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import os
+from ngspyeasy import executor
+from ngspyeasy.journal import RunTag
+from ngspyeasy.executor import job_states
+
+
+class ParseBjobsOutputTest(unittest.TestCase):
+    def test_states_and_exit_codes(self):
+        jobs = executor.parse_bjobs_output(
+            ["101|0|RUN|-", "102|0|DONE|-", "103|0|EXIT|137", "104|0|EXIT|-", "105|0|PEND|-"])
+
+        self.assertEqual(job_states.RUNNING, jobs["101"].state)
+        self.assertFalse(jobs["101"].is_finished())
+
+        self.assertEqual(job_states.DONE, jobs["102"].state)
+        self.assertEqual(0, jobs["102"].exit_code)
+
+        self.assertEqual(job_states.EXIT, jobs["103"].state)
+        self.assertEqual(137, jobs["103"].exit_code)
+
+        self.assertEqual(1, jobs["104"].exit_code)
+        self.assertEqual(job_states.PENDING, jobs["105"].state)
+
+    def test_array_elements(self):
+        jobs = executor.parse_bjobs_output(["200|1|DONE|-", "200|2|EXIT|2", "200|3|RUN|-"])
+
+        self.assertEqual(["200[1]", "200[2]", "200[3]"], sorted(jobs.keys()))
+        self.assertEqual(0, jobs[executor.array_element("200", 1)].exit_code)
+        self.assertEqual(2, jobs[executor.array_element("200", 2)].exit_code)
+        self.assertFalse(jobs[executor.array_element("200", 3)].is_finished())
+
+    def test_killed_at_memory_limit(self):
+        jobs = executor.parse_bjobs_output(
+            ["301|0|EXIT|130|TERM_MEMLIMIT: job killed after reaching LSF memory usage limit", "302|0|EXIT|130|-",
+             "303|0|DONE|-|-"])
+
+        self.assertTrue(jobs["301"].out_of_memory)
+        self.assertEqual(130, jobs["301"].exit_code)
+        self.assertFalse(jobs["302"].out_of_memory)
+        self.assertFalse(jobs["303"].out_of_memory)
+
+    def test_skips_malformed_lines(self):
+        jobs = executor.parse_bjobs_output(["", "No job found in job group /ngspyeasy/x"])
+        self.assertEqual({}, jobs)
+
+
+class CountingJobStatus(executor.LSFJobStatus):
+    def __init__(self, ttl, delay=0):
+        super(CountingJobStatus, self).__init__("/test", ttl)
+        self.queries = 0
+        self.delay = delay
+
+    def _query(self):
+        self.queries += 1
+        time.sleep(self.delay)
+        return executor.parse_bjobs_output(["1|0|RUN|-"])
+
+
+class LSFJobStatusTest(unittest.TestCase):
+    def test_cached_within_ttl(self):
+        status = CountingJobStatus(ttl=3600)
+        status.get("1")
+        status.get("1")
+        status.all()
+        self.assertEqual(1, status.queries)
+
+    def test_submitted_job_is_pending(self):
+        status = CountingJobStatus(ttl=3600)
+        status.all()
+        status.submitted("2")
+        self.assertEqual(job_states.PENDING, status.get("2").state)
+        self.assertEqual(1, status.queries)
+
+    def test_submitted_array_elements_are_pending(self):
+        status = CountingJobStatus(ttl=3600)
+        status.all()
+        status.submitted("3", indices=[1, 2])
+        self.assertEqual(job_states.PENDING, status.get("3[1]").state)
+        self.assertEqual(job_states.PENDING, status.get("3[2]").state)
+
+    def test_expired_cache(self):
+        status = CountingJobStatus(ttl=0)
+        status.get("1")
+        status.get("1")
+        self.assertEqual(2, status.queries)
+
+    def test_slow_query_every_poll(self):
+        # the executor polls ttl seconds after the start of its previous poll
+        status = CountingJobStatus(ttl=0.5, delay=0.3)
+        started = time.time()
+        status.all()
+        time.sleep(max(0, started + 0.5 - time.time()))
+        status.all()
+        self.assertEqual(2, status.queries)
+
+
+class ArrayIndexSpecTest(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual("1", executor.array_index_spec([1]))
+        self.assertEqual("1-3", executor.array_index_spec([3, 1, 2]))
+        self.assertEqual("1-3,5,7-8", executor.array_index_spec([1, 2, 3, 5, 7, 8]))
+
+
+class LocalProviderTest(unittest.TestCase):
+    def test_exit_wakes_up_without_polling(self):
+        exited = threading.Event()
+        provider = executor.LocalProvider(on_exit=exited.set)
+        self.assertIsNone(provider.poll_interval())
+
+        provider.submit("job", "sleep 0.2; exit 3")
+        self.assertEqual(job_states.RUNNING, provider.status(["job"])["job"].state)
+        self.assertTrue(exited.wait(10))
+        self.assertEqual(3, provider.status(["job"])["job"].exit_code)
+        self.assertFalse(provider.status(["job"])["job"].out_of_memory)
+        self.assertEqual([], provider.list())
+
+
+class JobExecutorTest(unittest.TestCase):
+    def setUp(self):
+        executor.start(provider="local", log_dir=None)
+        self.stopped = False
+
+    def tearDown(self):
+        if not self.stopped:
+            stop()
+
+    def test_results(self):
+        executor.submit("ok", "sleep 0.1")
+        executor.submit("failed", "sleep 0.1; exit 2")
+
+        # the local provider is never polled: only the wakeups of its waiter threads deliver the results
+        results = dict([executor.results_queue.get(timeout=10) for i in range(2)])
+        self.assertEqual({"ok": 0, "failed": 2}, results)
+
+    def test_batch_results(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            tags = [RunTag(0, x, "sample_%d" % x) for x in range(3)]
+            results_path = os.path.join(tmp_dir, "batch.results.json")
+            # the second run of the batch failed
+            executor.submit_batch("batch", "echo [0, 1, 0] > %s; exit 1" % results_path, tags=tags,
+                                  results_path=results_path)
+            executor.submit_batch("killed", "exit 9", tags=tags, results_path=os.path.join(tmp_dir, "x.json"))
+
+            results = dict([executor.results_queue.get(timeout=10) for i in range(6)])
+            self.assertEqual({"batch:0": 0, "batch:1": 1, "batch:2": 0, "killed:0": 9, "killed:1": 9, "killed:2": 9},
+                             results)
+            self.assertEqual([], os.listdir(tmp_dir))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_stop_while_jobs_are_running(self):
+        executor.submit("long", "sleep 30")
+        time.sleep(0.5)
+        started = time.time()
+        stop()
+        self.stopped = True
+        self.assertLess(time.time() - started, 10)
+
+
+def stop():
+    executor.stop()
+    # STOP is the last result of the executor; results of the jobs finished meanwhile are dropped
+    while executor.results_queue.get(timeout=10)[0] != "STOP":
+        pass
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import time
+import unittest
+
+import os
+from ngspyeasy import fact_cache
+
+
+class FactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "facts", "node1.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_facts_within_ttl(self):
+        self.assertIsNone(fact_cache.load(60, self.path))
+        fact_cache.store({"ansible_processor_vcpus": 16}, self.path)
+        self.assertEqual({"ansible_processor_vcpus": 16}, fact_cache.load(60, self.path))
+
+    def test_expired_facts(self):
+        fact_cache.store({"ansible_processor_vcpus": 16}, self.path)
+        os.utime(self.path, (time.time() - 120, time.time() - 120))
+        self.assertIsNone(fact_cache.load(60, self.path))
+
+    def test_broken_cache_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write("{\"ansible_")
+        self.assertIsNone(fact_cache.load(60, self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import gzip
+import shutil
+import tempfile
+import unittest
+
+import os
+from ngspyeasy import fastq_chunks
+
+
+def fastq(names):
+    return "".join(["@%s\nACGT\n+\nIIII\n" % x for x in names])
+
+
+class FastqChunksTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.block_reads = fastq_chunks.BLOCK_READS
+        fastq_chunks.BLOCK_READS = 2
+
+    def tearDown(self):
+        fastq_chunks.BLOCK_READS = self.block_reads
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with (gzip.open(path, 'wb') if name.endswith(".gz") else open(path, 'wb')) as f:
+            f.write(text)
+        return path
+
+    def read(self, path):
+        with (gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')) as f:
+            return f.read()
+
+    def test_chunk_path(self):
+        self.assertEqual("/out/s1_R1.chunk003.fq.gz", fastq_chunks.chunk_path("/in/s1_R1.fq.gz", "/out", 3))
+        self.assertEqual("/out/s1.chunk000.fastq", fastq_chunks.chunk_path("s1.fastq", "/out", 0))
+
+    def test_paired_reads_split_in_blocks(self):
+        fq1 = self.write("s1_1.fq.gz", fastq(["r%d/1" % i for i in range(5)]))
+        fq2 = self.write("s1_2.fq", fastq(["r%d/2" % i for i in range(5)]))
+        out_dir = os.path.join(self.tmp_dir, "chunks")
+        chunks = [fastq_chunks.chunk_paths(fq1, out_dir, 2), fastq_chunks.chunk_paths(fq2, out_dir, 2)]
+
+        fastq_chunks.split([fq1, fq2], chunks)
+        self.assertEqual(fastq(["r0/1", "r1/1", "r4/1"]), self.read(chunks[0][0]))
+        self.assertEqual(fastq(["r2/1", "r3/1"]), self.read(chunks[0][1]))
+        self.assertEqual(fastq(["r0/2", "r1/2", "r4/2"]), self.read(chunks[1][0]))
+        self.assertEqual(fastq(["r2/2", "r3/2"]), self.read(chunks[1][1]))
+        self.assertEqual(sorted([os.path.basename(x) for x in chunks[0] + chunks[1]]), sorted(os.listdir(out_dir)))
+
+    def test_different_number_of_mates(self):
+        fq1 = self.write("s1_1.fq", fastq(["r0/1", "r1/1"]))
+        fq2 = self.write("s1_2.fq", fastq(["r0/2"]))
+        out_dir = os.path.join(self.tmp_dir, "chunks")
+        chunks = [fastq_chunks.chunk_paths(fq1, out_dir, 2), fastq_chunks.chunk_paths(fq2, out_dir, 2)]
+
+        self.assertRaises(ValueError, fastq_chunks.split, [fq1, fq2], chunks)
+        self.assertEqual([], os.listdir(out_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
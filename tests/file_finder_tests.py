@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import glob
+import shutil
+import tempfile
+import unittest
+
+import os
+from ngspyeasy import file_finder
+
+
+def touch(path):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+
+class FileFinderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for path in ["a/s1_1.fastq", "a/s1_2.fastq", "a/s1.bam", "a/.hidden.fastq",
+                     "b/c/s2_1.fastq", "b/s3_1.fastq", "b/.d/s4_1.fastq"]:
+            touch(os.path.join(self.tmp_dir, path))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def find(self, pattern):
+        return [os.path.relpath(x, self.tmp_dir) for x in file_finder.find(os.path.join(self.tmp_dir, pattern))]
+
+    def test_same_as_glob(self):
+        for pattern in ["a/*.fastq", "*/*_1.fastq", "a/s1_?.fastq", "a/s1.bam", "a/none.bam", "*"]:
+            expected = sorted(glob.glob(os.path.join(self.tmp_dir, pattern)))
+            self.assertEqual(expected, file_finder.find_all(os.path.join(self.tmp_dir, pattern)))
+
+    def test_sorted_by_path(self):
+        touch(os.path.join(self.tmp_dir, "a-b", "s5_1.fastq"))
+        pattern = os.path.join(self.tmp_dir, "*", "*_1.fastq")
+        self.assertEqual(sorted(glob.glob(pattern)), file_finder.find_all(pattern))
+
+    def test_recursive(self):
+        self.assertEqual(["a/s1_1.fastq", "b/s3_1.fastq", "b/c/s2_1.fastq"], self.find("**/*_1.fastq"))
+        self.assertEqual(["b/s3_1.fastq", "b/c/s2_1.fastq"], self.find("b/**/*_1.fastq"))
+
+    def test_relative_pattern(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        try:
+            self.assertEqual(["a/s1_1.fastq", "a/s1_2.fastq"], file_finder.find_all("a/*.fastq"))
+        finally:
+            os.chdir(cwd)
+
+    def test_streams_matches(self):
+        matches = file_finder.find(os.path.join(self.tmp_dir, "**", "*.fastq"))
+        self.assertEqual("a/s1_1.fastq", os.path.relpath(matches.next(), self.tmp_dir))
+
+
+    def test_root(self):
+        self.assertEqual("/data", file_finder.root("/data/**/*.fq"))
+        self.assertEqual("/data/L1", file_finder.root("/data/L1/R1.fq"))
+        self.assertEqual("/", file_finder.root("/*.fq"))
+        self.assertEqual("data", file_finder.root("data/L*/R1.fq"))
+        self.assertEqual(".", file_finder.root("*.fq"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+
+import os
+from ngspyeasy import fingerprint, manifest
+from ngspyeasy.playbook_yaml import PlayBookYaml, JobCommand
+
+SAMPLES = [{"sample_id": "s1"}, {"sample_id": "s2"}]
+
+
+def write(path, text):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        write(os.path.join(self.tmp_dir, "roles", "align", "tasks", "main.yml"), "- shell: align")
+        for sample in SAMPLES:
+            write(os.path.join(self.tmp_dir, "data", sample["sample_id"] + ".fastq"), "ACGT")
+
+        self.plays = [{"roles": ["align"], "samples": "{{ all_samples }}",
+                  "inputs": "%s/data/{{ curr_sample.sample_id }}.fastq" % self.tmp_dir,
+                  "outputs": ["%s/data/{{ curr_sample.sample_id }}.bam" % self.tmp_dir]}]
+        self.pb = self.create_playbook(self.plays)
+        self.play = self.pb.play(0)
+
+    def create_playbook(self, plays, samples=SAMPLES):
+        cmd = JobCommand(os.path.join(self.tmp_dir, "pipeline.yml"), None, [], None)
+        return PlayBookYaml(cmd, plays, samples, {"all_samples": samples}, fingerprint.Fingerprinter(self.tmp_dir))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def finish(self, run_index):
+        (digest, outputs) = self.pb.fingerprint(self.play, self.play.play_run(run_index))
+        for output in outputs:
+            write(output, "BAM")
+        fingerprint.store(digest, outputs)
+
+    def up_to_date(self):
+        # a new playbook, so the role digests are not cached
+        pb = self.create_playbook(self.plays)
+        play = pb.play(0)
+        return [pb.is_up_to_date(play, play.play_run(i)) for i in range(play.run_count())]
+
+    def test_finished_runs_are_up_to_date(self):
+        self.assertEqual([False, False], self.up_to_date())
+        self.finish(0)
+        self.assertEqual([True, False], self.up_to_date())
+
+    def test_changed_input(self):
+        self.finish(0)
+        self.finish(1)
+        write(os.path.join(self.tmp_dir, "data", "s2.fastq"), "ACGTACGT")
+        self.assertEqual([True, False], self.up_to_date())
+
+    def test_changed_role(self):
+        self.finish(0)
+        write(os.path.join(self.tmp_dir, "roles", "align", "tasks", "main.yml"), "- shell: align --fast")
+        self.assertEqual([False, False], self.up_to_date())
+
+    def test_removed_output(self):
+        self.finish(0)
+        os.remove(os.path.join(self.tmp_dir, "data", "s1.bam"))
+        self.assertEqual([False, False], self.up_to_date())
+
+    def test_new_sample(self):
+        self.finish(0)
+        pb = self.create_playbook(self.plays, SAMPLES + [{"sample_id": "s3"}])
+        play = pb.play(0)
+        self.assertEqual([True, False, False], [pb.is_up_to_date(play, play.play_run(i)) for i in range(3)])
+
+    def test_inputs_written_by_upstream_play(self):
+        plays = [{"roles": ["align"], "inputs": "%s/data/*.bam" % self.tmp_dir,
+                  "outputs": ["%s/summary.txt" % self.tmp_dir]}]
+        # planned before the upstream play wrote the BAM files
+        manifest_path = os.path.join(self.tmp_dir, "manifest.jsonl")
+        self.create_playbook(plays).write_manifest(manifest_path)
+        write(os.path.join(self.tmp_dir, "data", "s1.bam"), "BAM")
+
+        record = manifest.Manifest(manifest_path).run_record(0, -1)
+        (digest, outputs) = record.fingerprint(fingerprint.Fingerprinter(self.tmp_dir))
+        write(outputs[0], "summary")
+        fingerprint.store(digest, outputs)
+
+        pb = self.create_playbook(plays)
+        self.assertTrue(pb.is_up_to_date(pb.play(0), pb.play(0).play_run(-1)))
+
+    def test_no_outputs(self):
+        pb = self.create_playbook([{"roles": ["align"]}])
+        play = pb.play(0)
+        self.assertEqual((None, None), pb.fingerprint(play, play.play_run(-1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+
+import os
+from ngspyeasy import genome_build
+from ngspyeasy.genome_build import GenomeBuild
+
+
+class GenomeBuildIntervalsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.ref_fasta = os.path.join(self.tmp_dir, "ref.fasta")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, path, lines):
+        with open(path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+    def test_intervals_from_fai(self):
+        self.write(self.ref_fasta + ".fai", ["1\t250\t3\t60\t61", "2\t100\t260\t60\t61", "MT\t16\t365\t60\t61"])
+        gb = GenomeBuild(self.tmp_dir, REFFASTA="ref.fasta")
+
+        self.assertEqual(["1:1-100", "1:101-200", "1:201-250", "2:1-100", "MT:1-16"],
+                         [x["region"] for x in gb.intervals(100)])
+        self.assertEqual(["1:1-250", "2:1-100", "MT:1-16"], [x["region"] for x in gb.intervals()])
+        self.assertEqual(["2:1-100"], [x["region"] for x in gb.intervals(contigs=[2])])
+
+    def test_contigs_from_dict(self):
+        self.write(os.path.join(self.tmp_dir, "ref.dict"),
+                   ["@HD\tVN:1.4\tSO:unsorted", "@SQ\tSN:20\tLN:63025520\tM5:0dec", "@SQ\tSN:21\tLN:48129895"])
+        self.assertEqual([("20", 63025520), ("21", 48129895)], genome_build.read_contigs(self.ref_fasta))
+
+    def test_no_index(self):
+        self.assertRaises(ValueError, genome_build.read_contigs, self.ref_fasta)
+
+    def test_parse_interval(self):
+        self.assertEqual({"contig": "20", "start": 1000, "end": 2000000, "region": "20:1000-2000000"},
+                         genome_build.parse_interval("20:1,000-2,000,000"))
+        self.assertEqual("X", genome_build.parse_interval("X")["region"])
+        self.assertEqual("X:5-10", genome_build.parse_interval({"contig": "X", "start": 5, "end": 10})["region"])
+
+
+if __name__ == '__main__':
+    unittest.main()
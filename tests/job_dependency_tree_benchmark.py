@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+"""
+Scheduling cost of JobDependencyTree for a per-sample pipeline of 7 plays:
+run i of a play depends on run i of the previous play.
+
+$ PYTHONPATH=. python tests/job_dependency_tree_benchmark.py
+"""
+
+import time
+from ngspyeasy.job_dependency_tree import JobDependencyTree
+
+PLAYS = 7
+
+
+def build(samples):
+    tree = JobDependencyTree()
+    for play in range(PLAYS):
+        for sample in range(samples):
+            deps = ["%d_%d" % (play - 1, sample)] if play > 0 else None
+            tree.append("%d_%d" % (play, sample), deps)
+    return tree
+
+
+def drain(tree):
+    jobs = 0
+    while True:
+        (job_id, details) = tree.get()
+        if job_id is None:
+            if not tree.has_running_jobs():
+                return jobs
+            continue
+        tree.done(job_id, 0)
+        jobs += 1
+
+
+def main():
+    print "%10s %12s %12s %14s" % ("jobs", "build, s", "drain, s", "us per job")
+    for samples in [1000, 10000, 20000]:
+        start = time.time()
+        tree = build(samples)
+        built = time.time()
+        jobs = drain(tree)
+        drained = time.time()
+        print "%10d %12.2f %12.2f %14.2f" % (
+            jobs, built - start, drained - built, (drained - start) * 1e6 / jobs)
+
+
+if __name__ == "__main__":
+    main()
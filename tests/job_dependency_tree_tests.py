@@ -60,3 +60,70 @@ class JobDependencyTreeTests(unittest.TestCase):
 
         (id, details) = tree.get()
         self.assertEqual(None, id)
+
+    def test_fan_in(self):
+        tree = JobDependencyTree()
+        tree.append("id0")
+        tree.append("id1")
+        tree.append("id2", ["id0", "id1"])
+
+        self.assertEqual("id0", tree.get()[0])
+        self.assertEqual("id1", tree.get()[0])
+        self.assertTrue(tree.has_running_jobs())
+
+        tree.done("id0", 0)
+        self.assertEqual(None, tree.get()[0])
+
+        tree.done("id1", 0)
+        self.assertFalse(tree.has_running_jobs())
+        self.assertEqual("id2", tree.get()[0])
+        self.assertTrue(tree.has_running_jobs())
+
+    def test_dependency_on_finished_job(self):
+        tree = JobDependencyTree()
+        tree.append("id0")
+        tree.get()
+        tree.done("id0", 0)
+
+        tree.append("id1", ["id0"])
+        self.assertEqual("id1", tree.get()[0])
+
+    def test_failed_job_blocks_children(self):
+        tree = JobDependencyTree()
+        tree.append("id0")
+        tree.append("id1", ["id0"])
+
+        tree.get()
+        tree.done("id0", 1)
+
+        self.assertEqual(None, tree.get()[0])
+        self.assertFalse(tree.has_running_jobs())
+
+    def test_done_before_start(self):
+        tree = JobDependencyTree()
+        tree.append("id0")
+        tree.append("id1", ["id0"])
+
+        tree.done("id0", 0)
+        self.assertEqual("id1", tree.get()[0])
+        self.assertEqual(None, tree.get()[0])
+
+    def test_failed_job_skips_only_descendants(self):
+        tree = JobDependencyTree()
+        tree.append("a0")
+        tree.append("b0")
+        tree.append("a1", ["a0"])
+        tree.append("b1", ["b0"])
+        tree.append("a2", ["a1"])
+        tree.append("all", ["a2", "b1"])
+
+        self.assertEqual("a0", tree.get()[0])
+        self.assertEqual("b0", tree.get()[0])
+
+        self.assertEqual(["a1", "a2", "all"], sorted(tree.done("a0", 1)))
+        self.assertEqual([], tree.done("b0", 0))
+
+        self.assertEqual("b1", tree.get()[0])
+        self.assertEqual([], tree.done("b1", 0))
+        self.assertEqual(None, tree.get()[0])
+        self.assertFalse(tree.has_running_jobs())
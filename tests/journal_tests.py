@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+
+from ngspyeasy.journal import Journal, ResumeIndex, RunTag, journal_path
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.journal = Journal(journal_path(self.tmp_dir))
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_records(self):
+        t1 = RunTag(0, 0, "s1")
+        t2 = RunTag(0, 1, "s2")
+        self.journal.submitted([(t1, "job_1", "101"), (t2, "job_2", "102")])
+        self.journal.finished([(t1, 0)])
+
+        records = Journal(journal_path(self.tmp_dir)).records()
+        self.assertEqual(2, len(records))
+        self.assertTrue(records[(0, "s1")].is_done())
+        self.assertTrue(records[(0, "s2")].is_running())
+        self.assertEqual("102", records[(0, "s2")].job_id)
+
+        self.journal.finished([(t2, 1)])
+        record = self.journal.records()[(0, "s2")]
+        self.assertFalse(record.is_done())
+        self.assertEqual(1, record.exit_code)
+
+    def test_clear(self):
+        self.journal.set_meta("job_group", "/ngspyeasy/1")
+        self.journal.submitted([(RunTag(0, 0, "s1"), "job_1", "101")])
+        self.assertEqual("/ngspyeasy/1", self.journal.get_meta("job_group"))
+
+        self.journal.clear()
+        self.assertEqual(0, len(self.journal.records()))
+        self.assertIsNone(self.journal.get_meta("job_group"))
+
+    def test_resume_index(self):
+        self.journal.submitted([(RunTag(0, 0, "s1"), "job_1", "101"),
+                                (RunTag(0, 1, "s2"), "job_2", "102"),
+                                (RunTag(1, 0, "s1"), "job_3", "103")])
+        self.journal.finished([(RunTag(0, 0, "s1"), 0), (RunTag(0, 1, "s2"), 0)])
+
+        resume = ResumeIndex(self.journal.records(), attach=True)
+        self.assertTrue(resume.is_done(RunTag(0, 0, "s1")))
+        self.assertFalse(resume.is_done(RunTag(0, 2, "s3")))
+        # the samples were reordered, or the file arrived in another batch in watch mode
+        self.assertTrue(resume.is_done(RunTag(0, 5, "s2")))
+        self.assertEqual("103", resume.running_job_id(RunTag(1, 0, "s1")))
+        self.assertIsNone(resume.running_job_id(RunTag(0, 0, "s1")))
+
+        resume = ResumeIndex(self.journal.records(), attach=False)
+        self.assertIsNone(resume.running_job_id(RunTag(1, 0, "s1")))
+
+
+if __name__ == '__main__':
+    unittest.main()
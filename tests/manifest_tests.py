@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+
+import os
+from ngspyeasy.manifest import Manifest, manifest_path
+from ngspyeasy.playbook_yaml import PlayBookYaml, JobCommand
+
+SAMPLES = [{"sample_id": "s1"}, {"sample_id": "s2"}, {"sample_id": "s3"}]
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = manifest_path(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_runs_read_their_own_records(self):
+        plays = [{"roles": ["init"]},
+                 {"roles": ["align"], "samples": "{{ all_samples }}", "resources": {"cpu": 2},
+                  "outputs": "/data/{{ curr_sample.sample_id }}.bam"},
+                 {"roles": ["report"]}]
+        pb = PlayBookYaml(JobCommand("/path/to/pipeline.yml", None, [], None, self.path), plays, SAMPLES,
+                          {"all_samples": SAMPLES, "genome": "b37"})
+        pb.write_manifest(self.path)
+
+        m = Manifest(self.path)
+        for (play_index, run_index) in [(0, -1), (1, 0), (1, 2), (2, -1)]:
+            expected = pb.run_record(play_index, run_index)
+            record = m.run_record(play_index, run_index)
+            self.assertEqual(expected.name(), record.name())
+            self.assertEqual(expected.vars(), record.vars())
+            self.assertEqual(expected.yaml(), record.yaml())
+
+        self.assertEqual({"roles": ["align"]}, m.run_record(1, 1).yaml())
+        self.assertEqual("s2", m.run_record(1, 1).vars()["curr_sample"]["sample_id"])
+        self.assertEqual(["/data/s2.bam"], m.run_record(1, 1).to_json()["outputs"])
+        self.assertTrue(os.path.exists(self.path + ".idx"))
+
+    def test_command_refers_to_manifest(self):
+        cmd = JobCommand("/path/to/pipeline.yml", None, [], None, self.path)
+        (name, command) = cmd.compose(0, 1)
+        self.assertTrue(("--manifest %s" % self.path) in command)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import os
+from ngspyeasy import batch_results, fact_cache, manifest, ngspyeasy_play_run, playbook_yaml
+
+PLAYBOOK = """
+- name: check
+  samples: "{{ all_samples }}"
+  gather_facts: no
+  tasks:
+  - shell: test {{ curr_sample.sample_id }} != bad
+"""
+
+
+class RunBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_results_per_host(self):
+        playbook_path = self.write("pipeline.yml", PLAYBOOK)
+        samples_tsv = self.write("samples.tsv", "sample_id\ns1\nbad\ns3\n")
+        # the modules run with the same python as the tests
+        vars_path = self.write("vars.yml", "ansible_python_interpreter: %s\n" % sys.executable)
+        manifest_path = os.path.join(self.tmp_dir, "manifest.jsonl")
+        playbook_yaml.parse(playbook_path, samples_tsv, [vars_path], None, manifest_path).write_manifest(manifest_path)
+        records = [manifest.Manifest(manifest_path).run_record(0, x) for x in range(3)]
+        results_path = batch_results.results_path(self.tmp_dir, "batch")
+        # the results of a previous attempt are replaced
+        batch_results.write(results_path, [1, 1, 1])
+
+        failed = ngspyeasy_play_run.run_batch(records, playbook_path, results_path=results_path)
+        self.assertEqual([records[1]], failed)
+        self.assertEqual([0, 1, 0], batch_results.read(results_path, 3))
+
+
+class FactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # the cache goes to the temporary directory of the node
+        self.tempdir = tempfile.tempdir
+        tempfile.tempdir = self.tmp_dir
+        self.out_path = os.path.join(self.tmp_dir, "fact.txt")
+        with open(os.path.join(self.tmp_dir, "playbook.yml"), 'w') as f:
+            f.write("- hosts: all\n"
+                    "  tasks:\n"
+                    "  - shell: echo {{ ansible_cached | default('gathered') }} > %s\n" % self.out_path)
+        fact_cache.store({"ansible_cached": "cached"})
+
+    def tearDown(self):
+        tempfile.tempdir = self.tempdir
+        shutil.rmtree(self.tmp_dir)
+
+    def run_playbook(self):
+        ngspyeasy_play_run.reset_ansible()
+        results = ngspyeasy_play_run.run_playbook(self.tmp_dir, {"ansible_python_interpreter": sys.executable},
+                                                  {"sample_0": dict()}, fact_cache_ttl=60)
+        self.assertEqual({"sample_0": True}, results)
+        with open(self.out_path, 'r') as f:
+            return f.read().strip()
+
+    def test_cached_facts_within_ttl(self):
+        self.assertEqual("cached", self.run_playbook())
+        # no facts were gathered to cache again
+        self.assertEqual({"ansible_cached": "cached"}, fact_cache.load(60))
+
+    def test_expired_facts_are_gathered(self):
+        os.utime(fact_cache.cache_path(), (time.time() - 120, time.time() - 120))
+        self.assertEqual("gathered", self.run_playbook())
+        # and cached again
+        self.assertTrue("ansible_hostname" in fact_cache.load(60))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+import shutil
+import stat
+import tempfile
+import unittest
+
+import os
+from ngspyeasy import batch_results, executor, ngspyeasy
+from ngspyeasy.playbook_yaml import PlayBookYaml, JobCommand
+
+SAMPLES = [{"sample_id": "s1"}, {"sample_id": "s2"}]
+
+# an LSF cluster where every job is done as soon as it is submitted: the commands go to jobs.txt
+FAKE_BSUB = """#!/bin/bash
+echo "${@: -1}" >> %(dir)s/jobs.txt
+echo "Job <$(wc -l < %(dir)s/jobs.txt)> is submitted to default queue <normal>."
+"""
+FAKE_BJOBS = """#!/bin/bash
+for i in $(seq 1 $(wc -l < %(dir)s/jobs.txt)); do echo "$i|-|DONE|-|"; done
+"""
+
+
+def create_playbook(plays):
+    cmd = JobCommand("/path/to/pipeline.yml", "/path/to/samples.tsv", [], None)
+    return PlayBookYaml(cmd, plays, SAMPLES, {"all_samples": SAMPLES})
+
+
+class RunReportTest(unittest.TestCase):
+    def setUp(self):
+        self.report = ngspyeasy.RunReport()
+        pb = create_playbook([{"roles": ["align"], "samples": "{{ all_samples }}"}, {"roles": ["report"]}])
+        self.names = []
+        for play, jobs in pb.play_jobs():
+            for (play_run, name, cmd, resources, dependencies) in jobs:
+                self.report.add(name, play, play_run)
+                self.names.append(name)
+
+    def test_all_finished(self):
+        for name in self.names:
+            self.report.succeeded(name)
+        self.assertFalse(self.report.has_failures())
+
+    def test_interrupted(self):
+        self.report.succeeded(self.names[0])
+        self.report.interrupted()
+
+        self.assertEqual(self.names[1:], self.report.not_run())
+        self.assertTrue(self.report.has_failures())
+
+
+class WrittenFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pattern = os.path.join(self.tmp_dir, "*.bam")
+        self.bams = [os.path.join(self.tmp_dir, x) for x in ["s1.bam", "s2.bam"]]
+        for path in self.bams:
+            open(path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_files_of_finished_runs(self):
+        taken = set()
+        # s2.bam is still being written by a running run
+        self.assertEqual({self.pattern: self.bams[:1]},
+                         ngspyeasy.written_files([self.pattern], taken, set(self.bams[:1])))
+        self.assertEqual({}, ngspyeasy.written_files([self.pattern], taken, set(self.bams[:1])))
+        self.assertEqual({self.pattern: self.bams[1:]},
+                         ngspyeasy.written_files([self.pattern], taken, set(), idle=True))
+
+
+class SequentialBatchesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.submit_batch = executor.submit_batch
+        executor.submit_batch = self.run_batch
+        self.batches = []
+
+    def tearDown(self):
+        executor.submit_batch = self.submit_batch
+        shutil.rmtree(self.tmp_dir)
+
+    def run_batch(self, name, cmd, resources=None, tags=None, retry=None, results_path=None):
+        # what the batch job and the executor do: the run of sample "bad" fails
+        self.batches.append((tags[0].play_index, [tag.run_index for tag in tags]))
+        exit_codes = [1 if tag.run_key == "bad" else 0 for tag in tags]
+        if results_path is None:
+            executor.results_queue.put((name, max(exit_codes)))
+            return
+        batch_results.write(results_path, exit_codes)
+        for i, exit_code in enumerate(executor.batch_exit_codes(results_path, max(exit_codes), len(tags))):
+            executor.results_queue.put((executor.batch_element(name, i), exit_code))
+
+    def test_one_run_fails_in_a_batch(self):
+        samples = [{"sample_id": "s1"}, {"sample_id": "bad"}, {"sample_id": "s3"}]
+        cmd = JobCommand("/path/to/pipeline.yml", "/path/to/samples.tsv", [], None,
+                         os.path.join(self.tmp_dir, "manifest.jsonl"))
+        pb = PlayBookYaml(cmd, [{"roles": ["align"], "samples": "{{ all_samples }}"},
+                                {"roles": ["vc"], "samples": "{{ all_samples }}"}],
+                          samples, {"all_samples": samples})
+        report = ngspyeasy.RunReport()
+
+        self.assertTrue(ngspyeasy.run_sequentially(pb, report, batch_size=2))
+        self.assertEqual([(0, [0, 1]), (0, [2]), (1, [0, 2])], self.batches)
+        self.assertEqual(1, len(report._failed))
+        self.assertEqual(1, len(report._skipped))
+        self.assertEqual(4, len(report._succeeded))
+        self.assertEqual([], os.listdir(self.tmp_dir))
+
+
+class LostJobsResume(object):
+    # the runs of the first play were running in their jobs when the pipeline was interrupted
+    def is_done(self, tag):
+        return False
+
+    def running_job_id(self, tag):
+        return tag.run_key if tag.play_index == 0 else None
+
+
+class LostJobsTest(unittest.TestCase):
+    def setUp(self):
+        self.attach = executor.attach
+        self.submit = executor.submit
+        executor.attach = self.attach_lost
+        executor.submit = self.run_job
+        self.submitted = []
+        self.pb = create_playbook([{"roles": ["align"], "samples": "{{ all_samples }}"}, {"roles": ["report"]}])
+        # only the run of s1 succeeded before LSF cleaned up the jobs
+        self.pb.is_up_to_date = lambda play, play_run: play_run.key() == ("s1",)
+
+    def tearDown(self):
+        executor.attach = self.attach
+        executor.submit = self.submit
+
+    def attach_lost(self, name, job_id, tags=None):
+        # what the executor does with a job bjobs doesn't know anymore
+        executor.results_queue.put((name, None))
+
+    def run_job(self, name, cmd, resources=None, tag=None, retry=None):
+        self.submitted.append((tag.play_index, tag.run_key))
+        executor.results_queue.put((name, 0))
+
+    def assert_resubmitted(self, report):
+        self.assertEqual([(0, "s2"), (1, "")], self.submitted)
+        self.assertFalse(report.has_failures())
+        self.assertEqual(3, len(report._succeeded))
+
+    def test_sequentially(self):
+        report = ngspyeasy.RunReport()
+        self.assertTrue(ngspyeasy.run_sequentially(self.pb, report, resume=LostJobsResume()))
+        self.assert_resubmitted(report)
+
+    def test_pipelined(self):
+        report = ngspyeasy.RunReport()
+        self.assertTrue(ngspyeasy.run_pipelined(self.pb, report, resume=LostJobsResume()))
+        self.assert_resubmitted(report)
+
+
+class LSFWithoutLogDirTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name, script in [("bsub", FAKE_BSUB), ("bjobs", FAKE_BJOBS)]:
+            path = os.path.join(self.tmp_dir, name)
+            with open(path, 'w') as f:
+                f.write(script % {"dir": self.tmp_dir})
+            os.chmod(path, stat.S_IRWXU)
+        open(os.path.join(self.tmp_dir, "jobs.txt"), 'w').close()
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = self.tmp_dir + ":" + self.path
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_runs_parse_the_playbook(self):
+        playbook_path = self.write("pipeline.yml", "- roles: [align]\n  samples: '{{ all_samples }}'\n"
+                                                   "- roles: [report]\n")
+        samples_tsv = self.write("samples.tsv", "sample_id\ns1\ns2\n")
+        vars_path = self.write("vars.yml", "a: 1\n")
+
+        exit_code = ngspyeasy.main([playbook_path, "--samples", samples_tsv, "--vars", vars_path,
+                                    "--provider", "lsf", "--poll_interval", "1"])
+        # the executor stopped by main
+        while executor.results_queue.get(timeout=10)[0] != "STOP":
+            pass
+
+        self.assertEqual(0, exit_code)
+        with open(os.path.join(self.tmp_dir, "jobs.txt")) as f:
+            jobs = f.read().splitlines()
+        self.assertEqual(3, len(jobs))
+        # without a log_dir there is no manifest the LSF nodes can read
+        self.assertEqual([], [x for x in jobs if "--manifest" in x or "--staged_dir" in x])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+import unittest
+from ngspyeasy import playbook_yaml
+from ngspyeasy.playbook_yaml import PlayBookYaml, PlayYaml, JobCommand
+from ngspyeasy.tsv_config import TsvConfig
+
+SAMPLES = [{"sample_id": "s1", "ncpu": "4"}, {"sample_id": "s2", "ncpu": "8"}]
+
+
+def create_playbook(plays):
+    cmd = JobCommand("/path/to/pipeline.yml", "/path/to/samples.tsv", [], None)
+    return PlayBookYaml(cmd, plays, SAMPLES, {"all_samples": SAMPLES})
+
+
+def job_names(pb):
+    return [(name, deps) for name, cmd, resources, deps in pb.jobs()]
+
+
+class PlayBookYamlJobsTest(unittest.TestCase):
+    def test_per_sample_dependencies(self):
+        pb = create_playbook([
+            {"roles": ["align"], "samples": "{{ all_samples }}"},
+            {"roles": ["vc"], "samples": "{{ all_samples }}"}])
+
+        jobs = job_names(pb)
+        self.assertEqual(4, len(jobs))
+        ((align1, deps1), (align2, deps2), (vc1, deps3), (vc2, deps4)) = jobs
+        self.assertEqual([], deps1)
+        self.assertEqual([], deps2)
+        self.assertEqual([align1], deps3)
+        self.assertEqual([align2], deps4)
+
+    def test_single_run_play_is_a_barrier(self):
+        pb = create_playbook([
+            {"roles": ["init"]},
+            {"roles": ["align"], "samples": "{{ all_samples }}"},
+            {"roles": ["report"]}])
+
+        ((init, deps1), (align1, deps2), (align2, deps3), (report, deps4)) = job_names(pb)
+        self.assertEqual([init], deps2)
+        self.assertEqual([init], deps3)
+        self.assertEqual(sorted([align1, align2]), sorted(deps4))
+
+    def test_fan_in(self):
+        pb = create_playbook([
+            {"roles": ["align"], "samples": "{{ all_samples }}"},
+            {"roles": ["joint_calling"], "samples": "{{ all_samples }}", "fan_in": True}])
+
+        ((align1, deps1), (align2, deps2), (vc1, deps3), (vc2, deps4)) = job_names(pb)
+        self.assertEqual(sorted([align1, align2]), sorted(deps3))
+        self.assertEqual(sorted([align1, align2]), sorted(deps4))
+
+    def test_resources(self):
+        pb = create_playbook([
+            {"roles": ["align"], "samples": "{{ all_samples }}", "resources": {"cpu": "{{ curr_sample.ncpu }}"}}])
+
+        resources = [r for name, cmd, r, deps in pb.jobs()]
+        self.assertEqual([4, 8], [r.cpu for r in resources])
+
+    def test_samples_selected_by_column_values(self):
+        samples = TsvConfig([["sample_id", "aligner"], ["s1", "bwa"], ["s2", "novoalign"], ["s3", "bwa"]])
+        cmd = JobCommand("/path/to/pipeline.yml", None, [], None)
+        pb = PlayBookYaml(cmd, [{"roles": ["align"], "samples": {"aligner": "{{ aligner }}"}}], samples,
+                          {"all_samples": list(samples.all_rows()), "aligner": "bwa"})
+
+        play = pb.play(0)
+        self.assertEqual(2, play.run_count())
+        self.assertEqual(("s3",), play.play_run(1).key())
+
+    def test_split_in_groups(self):
+        samples = [{"sample_id": "s%d" % i, "ncpu": str(i)} for i in range(1, 6)]
+        cmd = JobCommand("/path/to/pipeline.yml", "/path/to/samples.tsv", [], None)
+        pb = PlayBookYaml(cmd, [
+            {"roles": ["init"], "split": "{{ all_samples }}", "split_size": 2,
+             "resources": {"cpu": "{{ curr_split.ncpu }}"}, "outputs": "/data/{{ curr_split.sample_id }}"},
+            {"roles": ["align"], "samples": "{{ all_samples }}"}], samples, {"all_samples": samples})
+
+        play = pb.play(0)
+        self.assertEqual(3, play.run_count())
+        self.assertEqual([("s3",), ("s4",)], play.play_run(1).keys())
+        self.assertEqual(4, play.resources(1).cpu)
+        self.assertEqual(["/data/s3", "/data/s4"], play.outputs(1))
+        self.assertEqual(["s3", "s4"], [x["curr_split"]["sample_id"] for x in pb.run_record(0, 1).all_vars()])
+
+        ((init1, deps1), (init2, deps2), (init3, deps3), (a1, d1), (a2, d2), (a3, d3), (a4, d4), (a5, d5)) = \
+            job_names(pb)
+        self.assertEqual([[init1], [init1], [init2], [init2], [init3]], [d1, d2, d3, d4, d5])
+
+    def test_scatter_gather_by_interval(self):
+        pb = create_playbook([
+            {"roles": ["bqsr"], "samples": "{{ all_samples }}"},
+            {"roles": ["vc"], "samples": "{{ all_samples }}", "intervals": ["20:1-1000", "21"]},
+            {"roles": ["merge_vcf"], "samples": "{{ all_samples }}"}])
+
+        play = pb.play(1)
+        self.assertEqual(4, play.run_count())
+        self.assertEqual(("s1", "21"), play.play_run(1).key())
+        self.assertEqual("20:1-1000", pb.run_record(1, 2).vars()["curr_interval"]["region"])
+        self.assertEqual("s2", pb.run_record(1, 2).vars()["curr_sample"]["sample_id"])
+
+        ((bqsr1, d1), (bqsr2, d2), (vc1, d3), (vc2, d4), (vc3, d5), (vc4, d6), (merge1, d7), (merge2, d8)) = \
+            job_names(pb)
+        self.assertEqual([[bqsr1], [bqsr1], [bqsr2], [bqsr2]], [d3, d4, d5, d6])
+        self.assertEqual([[vc1, vc2], [vc3, vc4]], [sorted(d7), sorted(d8)])
+
+    def test_alignment_of_fastq_chunks(self):
+        chunks = {"count": 2, "fastq1": "/fastq/{{ curr_sample.sample_id }}_1.fq.gz", "dir": "/chunks",
+                  "merge": {"bam": "/chunks/{{ curr_sample.sample_id }}.{{ curr_chunk.index }}.bam",
+                            "output": "/bam/{{ curr_sample.sample_id }}.bam"}}
+        plays = playbook_yaml.expand_chunks([
+            {"name": "align", "roles": ["bwa"], "samples": "{{ all_samples }}", "chunks": chunks}])
+        pb = create_playbook(plays)
+
+        self.assertEqual(["align: split FASTQ files into chunks", "align", "align: merge the chunks"],
+                         [x["name"] for x in plays])
+        split = pb.play(0).step(1)
+        self.assertEqual(["/fastq/s2_1.fq.gz"], split["inputs"])
+        self.assertEqual([["/chunks/s2_1.chunk000.fq.gz", "/chunks/s2_1.chunk001.fq.gz"]], split["chunks"])
+        self.assertEqual(4, pb.play(1).run_count())
+        self.assertEqual("/chunks/s2_1.chunk001.fq.gz", pb.run_record(1, 3).vars()["curr_chunk"]["fastq1"])
+        self.assertEqual(None, pb.run_record(1, 3).step())
+        merge = pb.run_record(2, 0).step()
+        self.assertEqual(["/chunks/s1.0.bam", "/chunks/s1.1.bam"], merge["inputs"])
+        self.assertEqual(["/bam/s1.bam"], merge["outputs"])
+
+        ((split1, d1), (split2, d2), (a1, d3), (a2, d4), (a3, d5), (a4, d6), (merge1, d7), (merge2, d8)) = \
+            job_names(pb)
+        self.assertEqual([[split1], [split1], [split2], [split2]], [d3, d4, d5, d6])
+        self.assertEqual([[a1, a2], [a3, a4]], [sorted(d7), sorted(d8)])
+
+    def test_batch_of_files(self):
+        pb = create_playbook([
+            {"roles": ["trim"], "files": "/landing/*.fastq"},
+            {"roles": ["qc"], "files": "/landing/*.bam"},
+            {"roles": ["align"], "files": "/landing/*.fastq"}])
+        batch = pb.for_files({"/landing/*.fastq": ["/landing/s2.fastq"]}, "/log/manifest.1.jsonl")
+
+        jobs = list(batch.play_jobs())
+        self.assertEqual([0, 2], [play.index() for play, play_jobs in jobs])
+        ((trim, trim_jobs), (align, align_jobs)) = jobs
+        self.assertEqual([trim_jobs[0][1]], align_jobs[0][4])
+        self.assertEqual(("s2.fastq",), align_jobs[0][0].key())
+        self.assertTrue("--manifest /log/manifest.1.jsonl" in align_jobs[0][2])
+
+    def test_files_with_the_same_name(self):
+        pb = create_playbook([
+            {"roles": ["trim"], "files": "/data/**/R1.fq"},
+            {"roles": ["align"], "files": "/data/**/R1.fq"}])
+        batch = pb.for_files({"/data/**/R1.fq": ["/data/L1/R1.fq", "/data/L2/R1.fq"]}, "/log/manifest.1.jsonl")
+
+        ((trim, trim_jobs), (align, align_jobs)) = list(batch.play_jobs())
+        self.assertEqual([("L1/R1.fq",), ("L2/R1.fq",)], [x[0].key() for x in align_jobs])
+        self.assertEqual(["L1_R1.fq", "L2_R1.fq"], [x[0].name() for x in align_jobs])
+        self.assertEqual([[trim_jobs[0][1]], [trim_jobs[1][1]]], [x[4] for x in align_jobs])
+
+    def test_play_run_yaml_has_no_ngspyeasy_keys(self):
+        pb = create_playbook([
+            {"roles": ["align"], "samples": "{{ all_samples }}", "resources": {"cpu": 2}, "fan_in": True}])
+
+        record = pb.run_record(0, 1)
+        run_yaml = record.yaml()
+        self.assertEqual({"roles": ["align"]}, run_yaml)
+        self.assertEqual("s2", record.vars()["curr_sample"]["sample_id"])
+        self.assertEqual("sample_1", record.name())
+        for key in playbook_yaml.PLAY_KEYS:
+            self.assertFalse(key in run_yaml)
+
+
+class PlayYamlArrayCommandsTest(unittest.TestCase):
+    def test_arrays_split_by_max_size(self):
+        play = PlayYaml(0, ["f%d" % i for i in range(5)], [], JobCommand("/path/to/pipeline.yml", None, [], None))
+
+        arrays = list(play.array_commands(2))
+        self.assertEqual([[(1, 0), (2, 1)], [(1, 2), (2, 3)], [(1, 4)]], [x[2] for x in arrays])
+        self.assertTrue("$((LSB_JOBINDEX+1))" in arrays[1][1])
+
+    def test_arrays_of_selected_runs(self):
+        play = create_playbook([{"roles": ["align"], "samples": "{{ all_samples }}"}]).plays().next()
+
+        arrays = list(play.array_commands(10, [1]))
+        self.assertEqual(1, len(arrays))
+        self.assertEqual([(1, 1)], arrays[0][2])
+        self.assertTrue("$((LSB_JOBINDEX+0))" in arrays[0][1])
+
+    def test_single_run_play(self):
+        play = create_playbook([{"roles": ["init"]}]).plays().next()
+
+        arrays = list(play.array_commands(10))
+        self.assertEqual(1, len(arrays))
+        self.assertEqual(None, arrays[0][2])
+
+
+class PlayYamlBatchCommandsTest(unittest.TestCase):
+    def test_batches_request_resources_of_all_runs(self):
+        play = create_playbook([
+            {"roles": ["align"], "samples": "{{ all_samples }}", "resources": {"cpu": "{{ curr_sample.ncpu }}"}}
+        ]).plays().next()
+
+        ((name, cmd, run_indices, resources, results_path),) = list(play.batch_commands(4))
+        self.assertEqual([0, 1], run_indices)
+        self.assertEqual(12, resources.cpu)
+        self.assertTrue("--batch 0,1" in cmd)
+        self.assertEqual(None, results_path)
+        self.assertEqual([[1]], [x[2] for x in play.batch_commands(4, [1])])
+
+    def test_results_next_to_manifest(self):
+        cmd = JobCommand("/path/to/pipeline.yml", "/path/to/samples.tsv", [], None, "/path/to/logs/manifest.jsonl")
+        play = PlayBookYaml(cmd, [{"roles": ["align"], "samples": "{{ all_samples }}"}], SAMPLES,
+                            {"all_samples": SAMPLES}).plays().next()
+
+        ((name, cmd, run_indices, resources, results_path),) = list(play.batch_commands(4))
+        self.assertEqual("/path/to/logs/%s.results.json" % name, results_path)
+        self.assertTrue("--results " + results_path in cmd)
+
+    def test_split_runs_are_not_batched(self):
+        play = create_playbook([{"roles": ["init"], "split": "{{ all_samples }}"}]).plays().next()
+
+        batches = list(play.batch_commands(4))
+        self.assertEqual([[0], [1]], [x[2] for x in batches])
+        self.assertTrue("--run_index 1" in batches[1][1])
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import unittest
+from ngspyeasy.resources import Resources, SlotAllocator, parse_size, largest
+
+
+class ParseSizeTest(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(0, parse_size(None))
+        self.assertEqual(512, parse_size(512))
+        self.assertEqual(512, parse_size("512"))
+        self.assertEqual(512, parse_size("512M"))
+        self.assertEqual(16384, parse_size("16G"))
+        self.assertEqual(1536, parse_size("1.5GB"))
+        self.assertEqual(1024 * 1024, parse_size("1t"))
+
+    def test_wrong_value(self):
+        self.assertRaises(ValueError, parse_size, "lots")
+
+
+class ResourcesTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(Resources(cpu=1), Resources.parse(None))
+        self.assertEqual(Resources(cpu=8, memory=16384, disk=0), Resources.parse({"cpu": "8", "memory": "16G"}))
+
+    def test_largest(self):
+        self.assertEqual(Resources(cpu=8, memory=2048),
+                         largest([Resources(cpu=8, memory=1024), Resources(cpu=1, memory=2048)]))
+
+
+class SlotAllocatorTest(unittest.TestCase):
+    def test_packs_by_cpu_and_memory(self):
+        slots = SlotAllocator(Resources(cpu=8, memory=16384, disk=1000))
+
+        self.assertTrue(slots.allocate(Resources(cpu=6, memory=1024)))
+        self.assertTrue(slots.allocate(Resources(cpu=1)))
+        self.assertTrue(slots.allocate(Resources(cpu=1)))
+        self.assertFalse(slots.allocate(Resources(cpu=1)))
+
+        slots.release(Resources(cpu=6, memory=1024))
+        self.assertTrue(slots.allocate(Resources(cpu=2, memory=15000)))
+        self.assertFalse(slots.allocate(Resources(cpu=1, memory=2000)))
+
+    def test_request_larger_than_machine_runs_alone(self):
+        slots = SlotAllocator(Resources(cpu=4, memory=1024, disk=1000))
+
+        self.assertTrue(slots.allocate(Resources(cpu=32)))
+        self.assertFalse(slots.allocate(Resources(cpu=1)))
+        slots.release(Resources(cpu=32))
+        self.assertEqual(Resources(cpu=4, memory=1024, disk=1000), slots.free())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import signal
+import unittest
+
+from ngspyeasy.executor import JobRequest
+from ngspyeasy.resources import Resources
+from ngspyeasy.retry import RetryPolicy, exit_signal
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertIsNone(RetryPolicy.parse(None))
+        self.assertEqual(3, RetryPolicy.parse(3).attempts)
+
+        policy = RetryPolicy.parse({"attempts": 2, "backoff": 10, "exit_codes": [75], "signals": ["KILL", "SIGTERM"],
+                                    "memory_factor": 2})
+        self.assertEqual([75], policy.exit_codes)
+        self.assertEqual([signal.SIGKILL, signal.SIGTERM], policy.signals)
+        self.assertRaises(ValueError, RetryPolicy.parse, {"signals": ["NOSUCHSIGNAL"]})
+
+    def test_exit_signal(self):
+        self.assertEqual(signal.SIGKILL, exit_signal(-9))
+        self.assertEqual(signal.SIGKILL, exit_signal(137))
+        self.assertIsNone(exit_signal(1))
+        self.assertIsNone(exit_signal(None))
+
+    def test_should_retry(self):
+        policy = RetryPolicy(attempts=3, exit_codes=[75], signals=[signal.SIGKILL])
+        self.assertTrue(policy.should_retry(1, 75))
+        self.assertTrue(policy.should_retry(2, 137))
+        self.assertTrue(policy.should_retry(1, None))
+        self.assertFalse(policy.should_retry(1, 1))
+        self.assertFalse(policy.should_retry(3, 75))
+        self.assertFalse(policy.should_retry(1, 0))
+
+        self.assertTrue(RetryPolicy(attempts=2).should_retry(1, 1))
+        self.assertTrue(RetryPolicy(attempts=2, signals=[signal.SIGKILL], memory_factor=2).should_retry(1, 130, True))
+
+    def test_backoff(self):
+        policy = RetryPolicy(attempts=4, backoff=10)
+        self.assertEqual([10, 20, 40], [policy.delay(x) for x in [1, 2, 3]])
+
+    def test_more_memory_after_oom(self):
+        policy = RetryPolicy(attempts=2, memory_factor=1.5)
+        resources = Resources(cpu=2, memory=1000)
+        self.assertEqual(Resources(cpu=2, memory=1500), policy.resources(resources, True))
+        self.assertEqual(resources, policy.resources(resources, False))
+        self.assertIsNone(policy.resources(None, True))
+
+
+class RetryRequestTest(unittest.TestCase):
+    def test_array_element_is_retried_alone(self):
+        request = JobRequest("play_0", "cmd", array_indices=[1, 2, 3], resources=Resources(memory=100),
+                             retry=RetryPolicy(attempts=2, memory_factor=2))
+
+        retry = request.retry_request(2, 130, out_of_memory=True)
+        self.assertEqual([2], retry.array_indices)
+        self.assertEqual(2, retry.attempt)
+        self.assertEqual(200, retry.resources.memory)
+        self.assertIsNone(retry.retry_request(2, 130, out_of_memory=True))
+
+    def test_no_policy(self):
+        self.assertIsNone(JobRequest("play_0", "cmd").retry_request(None, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
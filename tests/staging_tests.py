@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+
+import os
+from ngspyeasy import staging
+
+
+class StagingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.playbook_dir = os.path.join(self.tmp_dir, "pipeline")
+        self.root = os.path.join(self.tmp_dir, "log")
+        self.write("roles/align/tasks/main.yml", "---\n")
+        self.write("library/bwa.py", "print 'bwa'\n")
+
+    def tearDown(self):
+        staging.remove(self.tmp_dir)
+
+    def write(self, path, text):
+        path = os.path.join(self.playbook_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def test_staged_once_per_content(self):
+        staged_dir = staging.stage(self.playbook_dir, self.root)
+
+        self.assertEqual(staged_dir, staging.stage(self.playbook_dir, self.root))
+        self.assertTrue(os.path.isfile(os.path.join(staged_dir, "roles", "align", "tasks", "main.yml")))
+        self.assertFalse(os.stat(os.path.join(staged_dir, "library", "bwa.py")).st_mode & 0222)
+        self.assertFalse(os.stat(os.path.join(staged_dir, "roles")).st_mode & 0222)
+
+        self.write("roles/align/tasks/main.yml", "---\n- debug: msg=changed\n")
+        self.assertNotEqual(staged_dir, staging.stage(self.playbook_dir, self.root))
+        self.assertEqual(2, len(os.listdir(os.path.join(self.root, staging.STAGING_DIR))))
+
+    def test_link_into_run_dir(self):
+        shutil.rmtree(os.path.join(self.playbook_dir, "library"))
+        staged_dir = staging.stage(self.playbook_dir, self.root)
+        run_dir = os.path.join(self.tmp_dir, "run")
+        os.mkdir(run_dir)
+
+        staging.link(staged_dir, run_dir)
+        self.assertEqual(["roles"], os.listdir(run_dir))
+        self.assertEqual(os.path.join(staged_dir, "roles"), os.readlink(os.path.join(run_dir, "roles")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+import unittest
+from ngspyeasy import templates
+from ngspyeasy.tsv_config import TsvConfig
+
+
+class TemplatesTest(unittest.TestCase):
+    def test_render(self):
+        self.assertEqual("/data/s1.bam", templates.render("/data/{{ curr_sample.sample_id }}.bam", {},
+                                                          curr_sample={"sample_id": "s1"}))
+
+    def test_single_expression_returns_the_object(self):
+        samples = [{"sample_id": "s1"}, {"sample_id": "s2"}]
+        self.assertTrue(templates.evaluate("{{ all_samples }}", {"all_samples": samples}) is samples)
+
+    def test_filtered_expression(self):
+        samples = TsvConfig([["sample_id", "aligner"], ["s1", "bwa"], ["s2", "novoalign"], ["s3", "bwa"]])
+        selected = templates.evaluate("{{ all_samples | selectattr('aligner', 'equalto', 'bwa') }}",
+                                      {"all_samples": list(samples.all_rows())})
+        self.assertEqual(["s1", "s3"], [x["sample_id"] for x in selected])
+
+    def test_literal(self):
+        self.assertEqual([{"sample_id": "s1"}, {"sample_id": "s2"}],
+                         templates.evaluate("[{'sample_id': '{{ a }}'}, {'sample_id': 's2'}]", {"a": "s1"}))
+
+    def test_undefined(self):
+        self.assertRaises(ValueError, templates.evaluate, "{{ no_such_samples }}", {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
 #!/usr/bin/env python
+import collections
 import os.path
 import unittest
 import tempfile
 from testsettings import get_resource_path
 from ngspyeasy import tsv_config
+from ngspyeasy.tsv_config import TsvConfig
+
+ROWS = [["SAMPLE_ID", "ALIGNER", "NCPU"],
+        ["s1", "bwa", "4"],
+        ["s2", "novoalign", "8"],
+        ["s3", "bwa", "8"]]
 
 
 class TsvConfigTest(unittest.TestCase):
@@ -30,3 +37,50 @@ class TsvConfigTest(unittest.TestCase):
         self.assertEqual("ILLUMINA", row['ngs_platform'])
         self.assertEqual("100bp150x.PE", row['dna_prep_library_id'])
         self.assertEqual("hg19", row['genomebuild'])
+
+    def test_memory_map(self):
+        config = tsv_config.parse(get_resource_path("ngspyeasy_test.config.tsv"), memory_map=True)
+        self.assertEqual("NA12878", config.row_at(0)['sample_id'])
+
+    def test_bounds(self):
+        config = TsvConfig(ROWS)
+
+        self.assertEqual(3, config.row_size())
+        self.assertEqual(3, config.col_size())
+        self.assertEqual("s3", config.row_at(2)["sample_id"])
+        self.assertIsNone(config.row_at(3))
+        self.assertIsNone(config.row_at(-1))
+
+    def test_row_is_a_mapping(self):
+        row = TsvConfig(ROWS).row_at(0)
+
+        self.assertEqual({"sample_id": "s1", "aligner": "bwa", "ncpu": "4"}, dict(row))
+        self.assertEqual(eval(repr(row)), dict(row))
+        self.assertEqual("bwa", row.get("aligner"))
+        self.assertIsNone(row.get("varcaller"))
+        self.assertRaises(KeyError, lambda: row["varcaller"])
+        self.assertTrue(isinstance(row, collections.Mapping))
+        self.assertEqual({"sample_id": "s1", "aligner": "bwa", "ncpu": "4"}, row)
+        self.assertEqual([("aligner", "bwa")], [x for x in row.items() if x[0] == "aligner"])
+
+    def test_row_has_no_dict(self):
+        row = TsvConfig(ROWS).row_at(0)
+        self.assertFalse(hasattr(row, "__dict__"))
+
+    def test_lookup_by_sample_id(self):
+        config = TsvConfig(ROWS)
+
+        self.assertEqual("novoalign", config.get("s2")["aligner"])
+        self.assertIsNone(config.get("s4"))
+
+    def test_where(self):
+        config = TsvConfig(ROWS)
+
+        self.assertEqual(["s1", "s3"], [x["sample_id"] for x in config.where(aligner="bwa")])
+        self.assertEqual(["s3"], [x["sample_id"] for x in config.where(aligner="bwa", ncpu=8)])
+        self.assertEqual(["s2", "s3"], [x["sample_id"] for x in config.where(ncpu=["8", "16"])])
+        self.assertEqual(3, len(config.where()))
+
+    def test_select_from_list(self):
+        samples = [{"sample_id": "s1", "aligner": "bwa"}, {"sample_id": "s2", "aligner": "novoalign"}]
+        self.assertEqual([samples[1]], tsv_config.select(samples, {"aligner": "novoalign"}))
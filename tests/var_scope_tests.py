@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import unittest
+from ngspyeasy.tsv_config import TsvConfig
+from ngspyeasy.var_scope import VarScope, plain
+
+
+class VarScopeTest(unittest.TestCase):
+    def test_overlay(self):
+        samples = [{"sample_id": "s1"}, {"sample_id": "s2"}]
+        base = {"all_samples": samples, "genome": "b37"}
+        scope = VarScope(base, {"curr_sample": samples[1], "genome": "hg19"})
+
+        self.assertEqual("hg19", scope["genome"])
+        self.assertEqual("s2", scope["curr_sample"]["sample_id"])
+        self.assertTrue(scope["all_samples"] is samples)
+        self.assertEqual(3, len(scope))
+        self.assertEqual(set(["all_samples", "genome", "curr_sample"]), set(scope.keys()))
+        self.assertEqual({"all_samples": samples, "genome": "hg19", "curr_sample": samples[1]}, scope.to_dict())
+
+    def test_writes_do_not_change_base(self):
+        base = {"a": 1, "b": 2}
+        scope = VarScope(base)
+        scope["a"] = 10
+        scope["c"] = 3
+        del scope["b"]
+
+        self.assertEqual({"a": 10, "c": 3}, scope.to_dict())
+        self.assertFalse("b" in scope)
+        self.assertRaises(KeyError, lambda: scope["b"])
+        self.assertEqual({"a": 1, "b": 2}, base)
+
+        scope["b"] = 20
+        self.assertEqual(20, scope["b"])
+
+
+class PlainTest(unittest.TestCase):
+    def test_rows_become_dicts(self):
+        rows = list(TsvConfig([["sample_id"], ["s1"], ["s2"]]).all_rows())
+        result = plain(VarScope({"all_samples": rows}, {"curr_sample": rows[0]}))
+
+        self.assertEqual(dict, type(result))
+        self.assertEqual(dict, type(result["curr_sample"]))
+        self.assertEqual([dict, dict], [type(x) for x in result["all_samples"]])
+        self.assertEqual({"sample_id": "s2"}, result["all_samples"][1])
+
+    def test_plain_values_are_not_copied(self):
+        value = {"all_samples": [{"sample_id": "s1"}], "genome": "b37"}
+        self.assertTrue(plain(value) is value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import time
+import unittest
+
+import os
+from ngspyeasy.watcher import FileWatcher
+
+
+class FileWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pattern = os.path.join(self.tmp_dir, "*.fastq")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, text, age=0):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'a') as f:
+            f.write(text)
+        if age > 0:
+            os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def test_old_files_are_observed_twice(self):
+        path = self.write("s1.fastq", "ACGT", age=3600)
+        self.write("s1.bam", "", age=3600)
+        watcher = FileWatcher([self.pattern], stable_seconds=30)
+        now = time.time()
+
+        # e.g. copied with its mtime preserved, and still being written
+        self.assertFalse(watcher.scan(now))
+        self.assertTrue(watcher.scan(now + 30))
+        self.assertEqual({self.pattern: [path]}, watcher.new_files())
+        self.assertFalse(watcher.scan(now + 60))
+        self.assertEqual({}, watcher.new_files())
+
+    def test_new_file_is_reported_when_unchanged(self):
+        path = self.write("s1.fastq", "ACGT")
+        watcher = FileWatcher([self.pattern], stable_seconds=30)
+        now = time.time()
+
+        self.assertFalse(watcher.scan(now))
+        self.assertTrue(watcher.has_pending())
+        self.assertFalse(watcher.scan(now + 10))
+
+        self.write("s1.fastq", "ACGT")
+        os.utime(path, (now + 10, now + 10))
+        self.assertFalse(watcher.scan(now + 20))
+        self.assertFalse(watcher.scan(now + 35))
+        self.assertTrue(watcher.scan(now + 50))
+        self.assertEqual({self.pattern: [path]}, watcher.new_files())
+        self.assertFalse(watcher.has_pending())
+
+    def test_removed_file_is_forgotten(self):
+        path = self.write("s1.fastq", "ACGT")
+        watcher = FileWatcher([self.pattern], stable_seconds=30)
+        watcher.scan(time.time())
+        os.remove(path)
+        watcher.scan(time.time())
+        self.assertFalse(watcher.has_pending())
+
+    def test_watches_in_background(self):
+        watcher = FileWatcher([self.pattern], stable_seconds=0, poll_interval=0.1)
+        watcher.start()
+        try:
+            path = self.write("s1.fastq", "ACGT")
+            deadline = time.time() + 5
+            new = dict()
+            while len(new) == 0 and time.time() < deadline:
+                time.sleep(0.05)
+                new = watcher.new_files()
+            self.assertEqual({self.pattern: [path]}, new)
+        finally:
+            watcher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
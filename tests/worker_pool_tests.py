@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import os
+from ngspyeasy import playbook_yaml
+from ngspyeasy.resources import Resources
+from ngspyeasy.worker_pool import PoolProvider, expand_array_index, is_play_run
+
+PLAYBOOK = """
+- name: check
+  samples: "{{ all_samples }}"
+  gather_facts: no
+  tasks:
+  - shell: test {{ curr_sample.sample_id }} != bad
+"""
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def test_expand_array_index(self):
+        cmd = "ngspyeasy_play_run /path/to/pipeline.yml --play_index 1 --run_index $((LSB_JOBINDEX+9))"
+        self.assertEqual("ngspyeasy_play_run /path/to/pipeline.yml --play_index 1 --run_index 12",
+                         expand_array_index(cmd, {"LSB_JOBINDEX": "3"}))
+        self.assertEqual("ngspyeasy_play_run x --run_index 0",
+                         expand_array_index("ngspyeasy_play_run x --run_index $((LSB_JOBINDEX+-1))",
+                                            {"LSB_JOBINDEX": "1"}))
+        self.assertEqual(cmd, expand_array_index(cmd, None))
+
+    def test_is_play_run(self):
+        self.assertTrue(is_play_run("ngspyeasy_play_run /path/to/pipeline.yml --play_index 0"))
+        self.assertFalse(is_play_run("echo ngspyeasy_play_run"))
+
+
+class PoolProviderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.provider = PoolProvider(on_exit=self.exited, capacity=Resources(cpu=2), processes=2)
+        self.finished = threading.Event()
+
+    def tearDown(self):
+        self.provider.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def exited(self):
+        self.finished.set()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_runs_in_workers(self):
+        playbook_path = self.write("pipeline.yml", PLAYBOOK)
+        samples_tsv = self.write("samples.tsv", "sample_id\ns1\nbad\ns3\n")
+        # the modules run with the same python as the tests
+        vars_path = self.write("vars.yml", "ansible_python_interpreter: %s\n" % sys.executable)
+        manifest_path = os.path.join(self.tmp_dir, "manifest.jsonl")
+        pb = playbook_yaml.parse(playbook_path, samples_tsv, [vars_path], None, manifest_path)
+        pb.write_manifest(manifest_path)
+
+        names = []
+        for name, cmd, resources, dependencies in pb.jobs():
+            self.assertTrue(is_play_run(cmd))
+            names.append(self.provider.submit(name, cmd, resources))
+        self.provider.submit("shell", "exit 3")
+
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            statuses = self.provider.status(names + ["shell"])
+            if all([x.is_finished() for x in statuses.values()]):
+                break
+            self.finished.wait(1)
+            self.finished.clear()
+        self.assertEqual([0, 1, 0, 3], [statuses[x].exit_code for x in names + ["shell"]])
+
+
+    def test_job_of_dead_worker_fails(self):
+        playbook_path = self.write("pipeline.yml", "- gather_facts: no\n  tasks:\n  - shell: sleep 20\n")
+        vars_path = self.write("vars.yml", "ansible_python_interpreter: %s\n" % sys.executable)
+        pb = playbook_yaml.parse(playbook_path, None, [vars_path], None)
+        ((name, cmd, resources, dependencies),) = list(pb.jobs())
+        job_id = self.provider.submit(name, cmd, resources)
+
+        deadline = time.time() + 60
+        while len(self.provider._pids) == 0 and time.time() < deadline:
+            time.sleep(0.1)
+        # e.g. killed for its memory
+        os.kill(self.provider._pids.values()[0], signal.SIGKILL)
+
+        while time.time() < deadline and not self.provider.status([job_id])[job_id].is_finished():
+            self.finished.wait(1)
+            self.finished.clear()
+        self.assertEqual(-signal.SIGKILL, self.provider.status([job_id])[job_id].exit_code)
+
+
+if __name__ == '__main__':
+    unittest.main()